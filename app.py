@@ -1,20 +1,93 @@
 # app.py (à la racine)
-from flask import Flask, send_from_directory, request
+from flask import Flask, Response, request
 import os
+import gzip
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
+# Flux publié et en-têtes de cache destinés au CDN (les clients revalident, le CDN garde la copie plus longtemps)
+FEED_PATH = os.path.join(app.root_path, 'static', 'event.ics')
+FEED_CACHE_CONTROL = os.environ.get(
+    'FEED_CACHE_CONTROL', 'public, max-age=300, s-maxage=3600, stale-while-revalidate=86400')
+
+
+# Version du flux : contenu brut et variantes compressées, produites une seule fois par version du fichier
+class FeedVersion:
+    def __init__(self, signature, data, last_modified):
+        self.signature = signature
+        self.last_modified = last_modified
+        self.digest = hashlib.sha256(data).hexdigest()[:32]
+        self.variants = {'identity': data}
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            self.variants['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(data):
+                self.variants['br'] = compressed
+
+    # ETag fort propre à chaque représentation (le corps compressé diffère du corps brut)
+    def etag(self, encoding):
+        return self.digest if encoding == 'identity' else f'{self.digest}-{encoding}'
+
+    # Meilleure variante acceptée par le client : brotli, puis gzip, sinon le contenu brut
+    def negotiate(self, accept_encodings):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings.quality(encoding) > 0:
+                return encoding
+        return 'identity'
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+# Version courante du flux, relue seulement si le fichier a changé (date, taille ou inode)
+def load_feed():
+    global _feed
+    stat = os.stat(FEED_PATH)
+    signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    feed = _feed
+    if feed is not None and feed.signature == signature:
+        return feed
+    with _feed_lock:
+        if _feed is None or _feed.signature != signature:
+            with open(FEED_PATH, 'rb') as f:
+                data = f.read()
+            _feed = FeedVersion(signature, data, int(stat.st_mtime))
+        return _feed
+
+
 @app.route('/', methods=['GET'])
 def home():
     return "Bienvenue sur le serveur de calendrier !"
 
 @app.route('/calendar.ics', methods=['GET'])
 def serve_calendar():
-    return send_from_directory('static', 'event.ics')
+    feed = load_feed()
+    encoding = feed.negotiate(request.accept_encodings)
+    body = feed.variants[encoding]
+
+    response = Response(body, mimetype='text/calendar')
+    response.set_etag(feed.etag(encoding))
+    response.last_modified = feed.last_modified
+    response.headers['Cache-Control'] = FEED_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    if encoding != 'identity':
+        response.content_encoding = encoding
+    # 304 si If-None-Match / If-Modified-Since correspondent, 206 pour les requêtes Range
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
 
 # Point d'entrée pour Vercel
 @app.route('/api/calendar', methods=['GET'])
 def api_calendar():
     return serve_calendar()
 
-app=app
\ No newline at end of file
+app=app
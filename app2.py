@@ -1,19 +1,35 @@
-from flask import Flask, request, Response, redirect, make_response
-import icalendar
+from flask import Flask, Blueprint, request, Response, redirect, make_response, jsonify, abort
 from datetime import datetime
 import os
+import time
 import uuid
-import pytz
-import xml.etree.ElementTree as ET
-import shutil
+import argparse
+import threading
 import logging
+from urllib.parse import unquote, urlsplit
+from xml.sax.saxutils import escape
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from calendar_storage import (open_storage, default_storage_path, import_ics, entry_from_component,
+                              entry_from_calendar, PreconditionFailed, EventNotFound, CalendarUnreadable)
+from user_file_watcher import UserFileWatcher
+from caldav_query import parse_report, UnsupportedReport, parse_propfind, CALENDAR_DATA, DAV_NS, CALDAV_NS, CALENDARSERVER_NS
+from change_journal import InvalidSyncToken
+from multistatus import (event_propfind_response, event_report_response, missing_response, multistatus_response,
+                         properties_response, multistatus_body)
+from response_cache import ResponseCache
+from calendar_cache import CalendarSnapshot, content_etag, write_index
+from recurrence import expanded_resource, limited_resource, filter_entries, occurrence_cache
+from free_busy import freebusy_calendar
+from calendar_collections import CalendarCollection, CollectionRegistry
+from logging_config import configure_logging, logging_stats
+from metrics import REGISTRY, instrument_app, stage, counted_events, profiler
+
+# L'import de ce module n'a aucun effet de bord : create_app() configure le journal, ouvre le stockage et
+# enregistre les routes. app2:app (gunicorn, flask run) construit l'application à la première demande.
 logger = logging.getLogger('caldav-server')
 
-app = Flask(__name__)
+# Routes CalDAV, enregistrées sur l'application par create_app()
+caldav = Blueprint('caldav', __name__)
 
 # Configuration des chemins
 USER_ICS_FILE = 'calendars/user/event.ics'  # Chemin vers votre fichier .ics existant
@@ -21,114 +37,87 @@ CALENDAR_DIR = 'calendars'
 ICS_FILE_PATH = f'{CALENDAR_DIR}/my_calendar.ics'
 CALENDAR_URL = '/calendar/'
 
-# Assurez-vous que le dossier des calendriers existe
-os.makedirs(os.path.dirname(ICS_FILE_PATH), exist_ok=True)
+# Stockage des événements : 'ics' (fichier unique historique), 'directory' ou 'sqlite'
+STORAGE_BACKEND = os.environ.get('CALDAV_STORAGE', 'ics')
+STORAGE_PATH = os.environ.get('CALDAV_STORAGE_PATH') or default_storage_path(STORAGE_BACKEND, ICS_FILE_PATH)
+
+# Index préconstruit du calendrier (python app2.py build-index) : chargé au démarrage à la place de l'analyse
+INDEX_SNAPSHOT = os.environ.get('CALDAV_INDEX_SNAPSHOT')
+
+# Collections des utilisateurs : /calendars/<utilisateur>/<calendrier>/, chargées à la demande
+COLLECTIONS_DIR = os.environ.get('CALDAV_COLLECTIONS_DIR', f'{CALENDAR_DIR}/users')
+
+# État du processus, partagé par les applications créées : initialisé par le premier create_app()
+user_file_watcher = None
+calendar_storage = None
+legacy_collection = None
+collection_registry = None
+_state_lock = threading.Lock()
 
 # Fonction pour copier le fichier utilisateur vers le répertoire de l'application
-def update_calendar_from_user_file():
-    if os.path.exists(USER_ICS_FILE):
-        # Assurez-vous que le dossier de destination existe
-        os.makedirs(os.path.dirname(ICS_FILE_PATH), exist_ok=True)
-        
-        # Copier le fichier
-        shutil.copy2(USER_ICS_FILE, ICS_FILE_PATH)
-        logger.info(f"Fichier {USER_ICS_FILE} copié vers {ICS_FILE_PATH}")
-        return True
-    else:
-        logger.warning(f"Attention: {USER_ICS_FILE} n'existe pas")
-        return False
+def update_calendar_from_user_file(force=False):
+    with stage('file_sync'):
+        return user_file_watcher.sync_if_changed(force=force)
 
-# Créer un exemple de fichier .ics si aucun n'existe
-def create_sample_ics():
-    if not os.path.exists(USER_ICS_FILE):
-        # Assurez-vous que le dossier existe
-        os.makedirs(os.path.dirname(USER_ICS_FILE), exist_ok=True)
-        
-        # Créer un calendrier avec un événement de test
-        cal = icalendar.Calendar()
-        cal.add('prodid', '-//My Calendar//example.com//')
-        cal.add('version', '2.0')
-        
-        # Créer un événement de test
-        event = icalendar.Event()
-        event.add('summary', 'Événement Exemple')
-        
-        # Date de début (demain à 10h)
-        start_time = datetime.now(pytz.utc).replace(hour=10, minute=0, second=0)
-        event.add('dtstart', start_time)
-        
-        # Date de fin (demain à 11h)
-        end_time = start_time.replace(hour=11)
-        event.add('dtend', end_time)
-        
-        event.add('dtstamp', datetime.now(pytz.utc))
-        event.add('uid', str(uuid.uuid4()))
-        
-        # Ajouter l'événement au calendrier
-        cal.add_component(event)
-        
-        # Sauvegarder le calendrier
-        with open(USER_ICS_FILE, 'wb') as f:
-            f.write(cal.to_ical())
-        
-        logger.info(f"Fichier exemple {USER_ICS_FILE} créé")
-        return True
-    return False
+# Ouvre le stockage et les collections ; la première synchronisation du fichier utilisateur
+# a lieu à la première lecture du calendrier (ou ici si un index préconstruit est à charger)
+def init_storage():
+    global user_file_watcher, calendar_storage, legacy_collection, collection_registry
+    with _state_lock:
+        if calendar_storage is not None:
+            return
+        os.makedirs(os.path.dirname(ICS_FILE_PATH), exist_ok=True)
+        # Surveillance du fichier utilisateur : la copie n'est refaite que s'il a changé
+        user_file_watcher = UserFileWatcher(USER_ICS_FILE, ICS_FILE_PATH)
+        # Seul le stockage 'ics' suit le fichier utilisateur ; les autres sont alimentés par import ou écriture
+        storage = open_storage(STORAGE_BACKEND, STORAGE_PATH, source_path=USER_ICS_FILE,
+                               sync=update_calendar_from_user_file, index_path=INDEX_SNAPSHOT)
+        # Collection historique /calendar/ : stockage, journal des modifications et index de disponibilité
+        legacy_collection = CalendarCollection('default', 'calendar', CALENDAR_URL, storage,
+                                               display_name='Calendrier Principal')
+        collection_registry = CollectionRegistry(COLLECTIONS_DIR, STORAGE_BACKEND)
+        calendar_storage = storage
+        if storage.name == 'ics':
+            user_file_watcher.start()
+            if INDEX_SNAPSHOT:
+                storage.view()
 
 # Afficher les routes enregistrées au démarrage
-def log_routes():
+def log_routes(app):
     routes = []
     for rule in app.url_map.iter_rules():
         routes.append(f"{rule} - {rule.methods}")
-    logger.info(f"Routes enregistrées: {routes}")
-
-# Appeler ces fonctions au démarrage
-with app.app_context():
-    log_routes()
-    # Créer un exemple si nécessaire
-    create_sample_ics()
-    # Mettre à jour depuis le fichier utilisateur
-    update_calendar_from_user_file()
-
-# Fonction pour lire un fichier .ics
-def read_ical_file(file_path):
-    # D'abord, vérifier si le fichier utilisateur a été modifié
-    update_calendar_from_user_file()
-    
-    if not os.path.exists(file_path):
-        logger.warning(f"Fichier {file_path} n'existe pas, création d'un calendrier vide")
-        # Créer un calendrier vide si le fichier n'existe pas
-        cal = icalendar.Calendar()
-        cal.add('prodid', '-//My Calendar//example.com//')
-        cal.add('version', '2.0')
-        
-        with open(file_path, 'wb') as f:
-            f.write(cal.to_ical())
-    
-    try:
-        with open(file_path, 'rb') as f:
-            cal_data = f.read()
-            cal = icalendar.Calendar.from_ical(cal_data)
-            
-            # Compter et logger les événements
-            event_count = len([c for c in cal.walk('VEVENT')])
-            logger.info(f"Lecture de {file_path}: {event_count} événements trouvés")
-            
-            # Logger les détails des événements pour le débogage
-            for i, event in enumerate(cal.walk('VEVENT')):
-                summary = event.get('summary', 'Sans titre')
-                uid = event.get('uid', 'Pas d\'UID')
-                dtstart = event.get('dtstart', 'Pas de date de début')
-                logger.info(f"Événement {i+1}: {summary}, UID: {uid}, Début: {dtstart}")
-            
-            return cal
-    except Exception as e:
-        logger.error(f"Erreur lors de la lecture du fichier {file_path}: {str(e)}")
-        # En cas d'erreur, créer un calendrier vide
-        cal = icalendar.Calendar()
-        cal.add('prodid', '-//My Calendar//example.com//')
-        cal.add('version', '2.0')
-        return cal
+    logger.debug("Routes enregistrées: %s", routes)
+
+# Construit l'application : journal, métriques, stockage et routes CalDAV
+def create_app():
+    started = time.perf_counter()
+    # Configuration du logging : écriture dans un thread dédié, débit limité par modèle de message
+    configure_logging()
+    app = Flask(__name__)
+    # Durées par route, statuts et tailles de réponse, exposés sur /metrics
+    instrument_app(app)
+    app.register_blueprint(caldav)
+    init_storage()
+    log_routes(app)
+    logger.info("Application prête en %.0f ms (stockage %s)", (time.perf_counter() - started) * 1000,
+                calendar_storage.name)
+    return app
+
+# app2:app : application par défaut, créée au premier accès à l'attribut
+_app_lock = threading.Lock()
+
+def __getattr__(name):
+    if name == 'app':
+        with _app_lock:
+            if 'app' not in globals():
+                globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Vue de la collection historique
+def calendar_view():
+    return legacy_collection.view()
 
 # Fonction d'aide pour créer des réponses CalDAV
 def caldav_response(status_code, headers=None, body=None):
@@ -144,10 +133,101 @@ def caldav_response(status_code, headers=None, body=None):
     
     return response
 
+# Réponses de découverte déjà encodées, par (chemin, profondeur, propriétés demandées, version)
+discovery_cache = ResponseCache()
+
+# Corps produit par build(), compté comme sérialisation
+def serialized(build):
+    with stage('serialization'):
+        return build()
+
+# Réponse multistatus servie depuis le cache ; render() fournit les éléments <D:response> à la première demande
+def cached_multistatus(key, render):
+    cached = discovery_cache.get(key, lambda: serialized(lambda: multistatus_body(render())))
+    headers = {'ETag': f'"{cached.etag}"'}
+    if cached.etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    headers['Content-Length'] = str(cached.length)
+    return Response(cached.body, status=207, content_type='text/xml; charset=utf-8', headers=headers)
+
+# Propriété (nom {espace}nom, fragment XML encodé) utilisée pour construire les réponses PROPFIND
+def xml_property(namespace, name, xml):
+    return (f'{{{namespace}}}{name}', xml.encode('utf-8'))
+
+# Fuseau horaire annoncé par les collections (calendar-timezone)
+CALENDAR_TIMEZONE = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//Example Corp.//CalDAV Server//EN
+BEGIN:VTIMEZONE
+TZID:Europe/Paris
+BEGIN:STANDARD
+DTSTART:20201025T030000
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+END:STANDARD
+BEGIN:DAYLIGHT
+DTSTART:20200329T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU
+TZOFFSETFROM:+0100
+TZOFFSETTO:+0200
+END:DAYLIGHT
+END:VTIMEZONE
+END:VCALENDAR
+"""
+
+# Propriétés invariables, encodées une seule fois au démarrage
+SUPPORTED_COMPONENTS = xml_property(CALDAV_NS, 'supported-calendar-component-set',
+                                    '<C:supported-calendar-component-set><C:comp name="VEVENT"/>'
+                                    '</C:supported-calendar-component-set>')
+STATIC_COLLECTION_PROPERTIES = [
+    xml_property(DAV_NS, 'supported-report-set', '<D:supported-report-set>'
+                 '<D:supported-report><D:report><C:calendar-query/></D:report></D:supported-report>'
+                 '<D:supported-report><D:report><C:calendar-multiget/></D:report></D:supported-report>'
+                 '<D:supported-report><D:report><D:sync-collection/></D:report></D:supported-report>'
+                 '<D:supported-report><D:report><C:free-busy-query/></D:report></D:supported-report>'
+                 '</D:supported-report-set>'),
+    SUPPORTED_COMPONENTS,
+    xml_property(CALDAV_NS, 'calendar-timezone', f'<C:calendar-timezone>{escape(CALENDAR_TIMEZONE)}</C:calendar-timezone>'),
+]
+ROOT_PROPERTIES = [
+    xml_property(DAV_NS, 'resourcetype', '<D:resourcetype><D:collection/></D:resourcetype>'),
+    xml_property(DAV_NS, 'displayname', '<D:displayname>CalDAV Server</D:displayname>'),
+    xml_property(DAV_NS, 'current-user-principal',
+                 '<D:current-user-principal><D:href>/principals/users/default/</D:href></D:current-user-principal>'),
+]
+LEGACY_CALENDAR_PROPERTIES = [
+    xml_property(DAV_NS, 'resourcetype', '<D:resourcetype><D:collection/><C:calendar/></D:resourcetype>'),
+    xml_property(DAV_NS, 'displayname', '<D:displayname>Calendrier Principal</D:displayname>'),
+]
+
+# Propriétés d'un principal
+def principal_properties(user, display_name, calendar_home):
+    principal = f'<D:href>/principals/users/{user}/</D:href>'
+    return [
+        xml_property(DAV_NS, 'resourcetype', '<D:resourcetype><D:principal/></D:resourcetype>'),
+        xml_property(DAV_NS, 'displayname', f'<D:displayname>{escape(display_name)}</D:displayname>'),
+        xml_property(CALDAV_NS, 'calendar-home-set', f'<C:calendar-home-set><D:href>{calendar_home}</D:href></C:calendar-home-set>'),
+        xml_property(DAV_NS, 'principal-URL', f'<D:principal-URL>{principal}</D:principal-URL>'),
+        xml_property(DAV_NS, 'current-user-principal', f'<D:current-user-principal>{principal}</D:current-user-principal>'),
+    ]
+
+# Propriétés d'une collection de calendrier ; seuls le CTag et le sync-token varient
+def collection_properties(collection, ctag, sync_token):
+    principal = f'<D:href>{collection.principal_url}</D:href>'
+    return [
+        xml_property(DAV_NS, 'resourcetype', '<D:resourcetype><D:collection/><C:calendar/></D:resourcetype>'),
+        xml_property(DAV_NS, 'displayname', f'<D:displayname>{escape(collection.display_name)}</D:displayname>'),
+        xml_property(CALENDARSERVER_NS, 'getctag', f'<CS:getctag>"{ctag}"</CS:getctag>'),
+        xml_property(DAV_NS, 'sync-token', f'<D:sync-token>{escape(sync_token)}</D:sync-token>'),
+        xml_property(DAV_NS, 'owner', f'<D:owner>{principal}</D:owner>'),
+        xml_property(DAV_NS, 'current-user-principal', f'<D:current-user-principal>{principal}</D:current-user-principal>'),
+    ] + STATIC_COLLECTION_PROPERTIES
+
 # Redirection de l'URL de découverte de service vers le calendrier principal
-@app.route('/.well-known/caldav', methods=['GET', 'PROPFIND', 'OPTIONS'])
+@caldav.route('/.well-known/caldav', methods=['GET', 'PROPFIND', 'OPTIONS'])
 def well_known_caldav():
-    logger.info(f"Requête {request.method} sur /.well-known/caldav")
+    logger.debug("Requête %s sur /.well-known/caldav", request.method)
     if request.method == 'OPTIONS':
         return caldav_response(200, {
             'Allow': 'OPTIONS, GET, PROPFIND',
@@ -158,9 +238,9 @@ def well_known_caldav():
     return redirect(CALENDAR_URL, code=301)
 
 # Route pour la racine du serveur - Important pour la découverte
-@app.route('/', methods=['GET', 'PROPFIND', 'OPTIONS'])
+@caldav.route('/', methods=['GET', 'PROPFIND', 'OPTIONS'])
 def root():
-    logger.info(f"Requête {request.method} sur /")
+    logger.debug("Requête %s sur /", request.method)
     if request.method == 'OPTIONS':
         return caldav_response(200, {
             'Allow': 'OPTIONS, GET, PROPFIND',
@@ -169,87 +249,40 @@ def root():
     
     if request.method == 'PROPFIND':
         depth = request.headers.get('Depth', '0')
-        logger.info(f"PROPFIND sur / avec profondeur {depth}")
-        
-        xml_response = f"""<?xml version="1.0" encoding="utf-8"?>
-        <D:multistatus xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
-            <D:response>
-                <D:href>/</D:href>
-                <D:propstat>
-                    <D:prop>
-                        <D:resourcetype>
-                            <D:collection/>
-                        </D:resourcetype>
-                        <D:displayname>CalDAV Server</D:displayname>
-                        <D:current-user-principal>
-                            <D:href>/principals/users/default/</D:href>
-                        </D:current-user-principal>
-                    </D:prop>
-                    <D:status>HTTP/1.1 200 OK</D:status>
-                </D:propstat>
-            </D:response>
-        """
+        logger.debug("PROPFIND sur / avec profondeur %s", depth)
+        requested = parse_propfind(request.data)
         
-        if depth != '0':
-            xml_response += f"""
-            <D:response>
-                <D:href>{CALENDAR_URL}</D:href>
-                <D:propstat>
-                    <D:prop>
-                        <D:resourcetype>
-                            <D:collection/>
-                            <C:calendar/>
-                        </D:resourcetype>
-                        <D:displayname>Calendrier Principal</D:displayname>
-                    </D:prop>
-                    <D:status>HTTP/1.1 200 OK</D:status>
-                </D:propstat>
-            </D:response>
-            """
-            
-        xml_response += '</D:multistatus>'
+        def render():
+            responses = [properties_response('/', ROOT_PROPERTIES, requested)]
+            if depth != '0':
+                responses.append(properties_response(CALENDAR_URL, LEGACY_CALENDAR_PROPERTIES, requested))
+            return responses
         
-        return Response(xml_response, mimetype='text/xml')
+        return cached_multistatus(('/', depth != '0', requested), render)
     
     return "<h1>Serveur CalDAV en fonctionnement</h1>"
 
 # Route pour gérer les chemins de découverte CalDAV supplémentaires
-@app.route('/principals/', methods=['PROPFIND', 'OPTIONS'])
-@app.route('/principals/users/', methods=['PROPFIND', 'OPTIONS'])
-@app.route('/principals/users/default/', methods=['PROPFIND', 'OPTIONS'])
+@caldav.route('/principals/', methods=['PROPFIND', 'OPTIONS'])
+@caldav.route('/principals/users/', methods=['PROPFIND', 'OPTIONS'])
+@caldav.route('/principals/users/default/', methods=['PROPFIND', 'OPTIONS'])
 def principals():
-    logger.info(f"Requête {request.method} sur {request.path}")
+    logger.debug("Requête %s sur %s", request.method, request.path)
     if request.method == 'OPTIONS':
         return caldav_response(200, {
             'Allow': 'OPTIONS, PROPFIND',
             'DAV': '1, 3, calendar-access'
         })
     
-    xml_response = """<?xml version="1.0" encoding="utf-8"?>
-    <D:multistatus xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
-        <D:response>
-            <D:href>/principals/users/default/</D:href>
-            <D:propstat>
-                <D:prop>
-                    <D:resourcetype>
-                        <D:principal/>
-                    </D:resourcetype>
-                    <D:displayname>Utilisateur par défaut</D:displayname>
-                    <C:calendar-home-set>
-                        <D:href>/calendar/</D:href>
-                    </C:calendar-home-set>
-                </D:prop>
-                <D:status>HTTP/1.1 200 OK</D:status>
-            </D:propstat>
-        </D:response>
-    </D:multistatus>
-    """
-    return Response(xml_response, mimetype='text/xml')
+    requested = parse_propfind(request.data)
+    return cached_multistatus(('principal', 'default', requested), lambda: [
+        properties_response('/principals/users/default/',
+                            principal_properties('default', 'Utilisateur par défaut', CALENDAR_URL), requested)])
 
 # Route pour gérer les chemins de découverte alternatifs
-@app.route('/calendar/dav/u/user/', methods=['PROPFIND', 'OPTIONS', 'GET'])
+@caldav.route('/calendar/dav/u/user/', methods=['PROPFIND', 'OPTIONS', 'GET'])
 def calendar_alt_path():
-    logger.info(f"Requête {request.method} sur {request.path}")
+    logger.debug("Requête %s sur %s", request.method, request.path)
     # Rediriger vers le chemin de calendrier principal
     if request.method == 'GET':
         return redirect(CALENDAR_URL)
@@ -257,26 +290,85 @@ def calendar_alt_path():
         # Pour PROPFIND/OPTIONS, rediriger vers l'URL principale du calendrier
         return redirect(CALENDAR_URL, code=301)
 
-# Route principale pour l'accès au calendrier
-@app.route('/calendar/', methods=['PROPFIND', 'REPORT', 'GET', 'OPTIONS', 'PROPPATCH'])
-def calendar_root():
-    logger.info(f"Requête {request.method} sur /calendar/")
-    # Vérifier si le fichier utilisateur a été mis à jour
-    update_calendar_from_user_file()
+# Principal d'un utilisateur hébergé : son calendar-home-set pointe vers /calendars/<utilisateur>/
+@caldav.route('/principals/users/<user>/', methods=['PROPFIND', 'OPTIONS'])
+def user_principal(user):
+    logger.debug("Requête %s sur %s", request.method, request.path)
+    if request.method == 'OPTIONS':
+        return caldav_response(200, {
+            'Allow': 'OPTIONS, PROPFIND',
+            'DAV': '1, 3, calendar-access'
+        })
+    if not collection_registry.user_exists(user):
+        return "Utilisateur inconnu", 404
     
+    requested = parse_propfind(request.data)
+    return cached_multistatus(('principal', user, requested), lambda: [
+        properties_response(f'/principals/users/{user}/',
+                            principal_properties(user, user, f'/calendars/{user}/'), requested)])
+
+# Calendar-home d'un utilisateur : la liste de ses calendriers est lue sur disque, sans charger les collections
+@caldav.route('/calendars/<user>/', methods=['PROPFIND', 'OPTIONS'])
+def calendar_home(user):
+    logger.debug("Requête %s sur %s", request.method, request.path)
     if request.method == 'OPTIONS':
         return caldav_response(200, {
-            'Allow': 'OPTIONS, GET, PROPFIND, REPORT, PROPPATCH',
+            'Allow': 'OPTIONS, PROPFIND',
+            'DAV': '1, 3, calendar-access'
+        })
+    if not collection_registry.user_exists(user):
+        return "Utilisateur inconnu", 404
+    
+    depth = request.headers.get('Depth', '0')
+    requested = parse_propfind(request.data)
+    calendars = tuple(collection_registry.calendars(user)) if depth != '0' else ()
+    
+    def render():
+        principal = f'<D:href>/principals/users/{user}/</D:href>'
+        responses = [properties_response(f'/calendars/{user}/', [
+            xml_property(DAV_NS, 'resourcetype', '<D:resourcetype><D:collection/></D:resourcetype>'),
+            xml_property(DAV_NS, 'owner', f'<D:owner>{principal}</D:owner>'),
+        ], requested)]
+        for name in calendars:
+            responses.append(properties_response(f'/calendars/{user}/{name}/', [
+                xml_property(DAV_NS, 'resourcetype', '<D:resourcetype><D:collection/><C:calendar/></D:resourcetype>'),
+                xml_property(DAV_NS, 'displayname', f'<D:displayname>{escape(name)}</D:displayname>'),
+                SUPPORTED_COMPONENTS,
+            ], requested))
+        return responses
+    
+    return cached_multistatus(('home', user, depth != '0', requested, calendars), render)
+
+# Collection d'un utilisateur ; MKCALENDAR la crée
+@caldav.route('/calendars/<user>/<calendar>/', methods=['PROPFIND', 'REPORT', 'OPTIONS', 'PROPPATCH', 'MKCALENDAR'])
+def user_calendar(user, calendar):
+    logger.debug("Requête %s sur %s", request.method, request.path)
+    if request.method == 'MKCALENDAR':
+        if collection_registry.exists(user, calendar):
+            return "Le calendrier existe déjà", 405
+        try:
+            collection_registry.get(user, calendar, create=True).view()
+        except ValueError as e:
+            return str(e), 403
+        logger.info("Calendrier %s/%s créé", user, calendar)
+        return Response(status=201)
+    return collection_request(resolve_collection(user, calendar))
+
+# Requêtes CalDAV sur une collection (historique ou d'utilisateur)
+def collection_request(collection):
+    if request.method == 'OPTIONS':
+        return caldav_response(200, {
+            'Allow': 'OPTIONS, GET, PROPFIND, REPORT, PROPPATCH, PUT, DELETE, MKCALENDAR',
             'DAV': '1, 3, calendar-access'
         })
     
     if request.method == 'PROPPATCH':
         # Pour l'instant, nous simulons une réponse positive sans modifier quoi que ce soit
-        logger.info("PROPPATCH reçu - simulant une réponse positive")
-        xml_response = """<?xml version="1.0" encoding="utf-8"?>
+        logger.debug("PROPPATCH reçu - simulant une réponse positive")
+        xml_response = f"""<?xml version="1.0" encoding="utf-8"?>
         <D:multistatus xmlns:D="DAV:">
             <D:response>
-                <D:href>/calendar/</D:href>
+                <D:href>{collection.url}</D:href>
                 <D:propstat>
                     <D:prop>
                     </D:prop>
@@ -290,136 +382,98 @@ def calendar_root():
     if request.method == 'PROPFIND':
         # Obtenir les en-têtes pour personnaliser la réponse
         depth = request.headers.get('Depth', '0')
-        logger.info(f"PROPFIND sur /calendar/ avec profondeur {depth}")
+        logger.debug("PROPFIND sur %s avec profondeur %s", collection.url, depth)
+        requested = parse_propfind(request.data)
         
-        try:
-            # Analyser la requête XML si elle existe
-            request_xml = None
-            if request.data:
-                request_xml = ET.fromstring(request.data)
-                logger.debug(f"Requête XML reçue: {request.data.decode('utf-8')[:200]}...")
-        except Exception as e:
-            # Si l'analyse échoue, continuer sans elle
-            logger.error(f"Erreur lors de l'analyse XML: {str(e)}")
-            request_xml = None
+        # La vue fournit le CTag et le sync-token de la collection ; la réponse de la collection
+        # n'est reconstruite que lorsqu'ils changent
+        view = collection.view()
+        sync_token = collection.sync_token(view)
+        key = (collection.url, requested, view.ctag, sync_token)
         
-        # Réponse basique pour PROPFIND
-        xml_response = f"""<?xml version="1.0" encoding="utf-8"?>
-        <D:multistatus xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav" xmlns:CS="http://calendarserver.org/ns/">
-            <D:response>
-                <D:href>{CALENDAR_URL}</D:href>
-                <D:propstat>
-                    <D:prop>
-                        <D:resourcetype>
-                            <D:collection/>
-                            <C:calendar/>
-                        </D:resourcetype>
-                        <D:displayname>Calendrier Principal</D:displayname>
-                        <C:supported-calendar-component-set>
-                            <C:comp name="VEVENT"/>
-                        </C:supported-calendar-component-set>
-                        <D:owner>
-                            <D:href>/principals/users/default/</D:href>
-                        </D:owner>
-                        <D:current-user-principal>
-                            <D:href>/principals/users/default/</D:href>
-                        </D:current-user-principal>
-                        <C:calendar-timezone>BEGIN:VCALENDAR
-VERSION:2.0
-PRODID:-//Example Corp.//CalDAV Server//EN
-BEGIN:VTIMEZONE
-TZID:Europe/Paris
-BEGIN:STANDARD
-DTSTART:20201025T030000
-RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU
-TZOFFSETFROM:+0200
-TZOFFSETTO:+0100
-END:STANDARD
-BEGIN:DAYLIGHT
-DTSTART:20200329T020000
-RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU
-TZOFFSETFROM:+0100
-TZOFFSETTO:+0200
-END:DAYLIGHT
-END:VTIMEZONE
-END:VCALENDAR
-                        </C:calendar-timezone>
-                    </D:prop>
-                    <D:status>HTTP/1.1 200 OK</D:status>
-                </D:propstat>
-            </D:response>
-        """
+        def render():
+            return [properties_response(collection.url, collection_properties(collection, view.ctag, sync_token),
+                                        requested)]
         
-        # Si la profondeur est 1, inclure les événements
-        if depth != '0':
-            cal = read_ical_file(ICS_FILE_PATH)
-            
-            # Ajouter chaque événement à la réponse
-            for component in cal.walk('VEVENT'):
-                event_uid = component.get('uid', uuid.uuid4())
-                event_data = component.to_ical().decode('utf-8')
-                
-                xml_response += f"""
-                <D:response>
-                    <D:href>/calendar/{event_uid}.ics</D:href>
-                    <D:propstat>
-                        <D:prop>
-                            <D:getetag>"{hash(event_data)}"</D:getetag>
-                            <D:resourcetype/>
-                        </D:prop>
-                        <D:status>HTTP/1.1 200 OK</D:status>
-                    </D:propstat>
-                </D:response>
-                """
+        if depth == '0':
+            return cached_multistatus(key, render)
         
-        xml_response += '</D:multistatus>'
-        return Response(xml_response, mimetype='text/xml')
+        # Si la profondeur est 1, inclure les événements, envoyés en flux après la réponse de la collection
+        head = discovery_cache.get(key, lambda: serialized(lambda: b''.join(render())))
+        etag = content_etag(f'{head.etag}:{view.ctag}:events'.encode('ascii'))
+        if etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+        
+        def responses():
+            yield head.body
+            for uid, event_etag in counted_events(view.etags(), 'propfind'):
+                yield event_propfind_response(collection.href(uid), event_etag, requested)
+        
+        response = multistatus_response(responses())
+        response.headers['ETag'] = f'"{etag}"'
+        return response
     
     elif request.method == 'REPORT':
-        # Pour un REPORT, nous retournons les événements du calendrier
-        logger.info(f"REPORT sur /calendar/")
-        cal = read_ical_file(ICS_FILE_PATH)
-        
-        # Construire la réponse XML pour les événements
-        xml_response = '<?xml version="1.0" encoding="utf-8"?>\n'
-        xml_response += '<D:multistatus xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">\n'
+        # Pour un REPORT, nous retournons les événements demandés par le filtre
+        logger.debug("REPORT sur %s", collection.url)
+        try:
+            report = parse_report(request.data)
+        except UnsupportedReport as e:
+            logger.warning("REPORT non pris en charge: %s", e)
+            return caldav_response(403, body="""<?xml version="1.0" encoding="utf-8"?>
+<D:error xmlns:D="DAV:"><D:supported-report/></D:error>""")
+        except ValueError as e:
+            logger.warning("REPORT invalide: %s", e)
+            return caldav_response(400, body=f"REPORT invalide: {str(e)}")
+        view = collection.view()
         
-        # Compter les événements pour le débogage
-        event_count = 0
+        if report.kind == 'sync-collection':
+            return sync_collection_report(collection, view, report)
+        if report.kind == 'calendar-multiget':
+            return calendar_multiget_report(collection, view, report)
+        if report.kind == 'free-busy-query':
+            return free_busy_report(collection, view, report)
         
-        # Ajouter chaque événement dans la réponse
-        for component in cal.walk('VEVENT'):
-            event_count += 1
-            event_uid = component.get('uid', uuid.uuid4())
-            event_data = component.to_ical().decode('utf-8')
-            summary = component.get('summary', 'Sans titre')
-            
-            logger.info(f"Ajout de l'événement '{summary}' (UID: {event_uid}) à la réponse REPORT")
-            
-            xml_response += f"""  <D:response>
-    <D:href>/calendar/{event_uid}.ics</D:href>
-    <D:propstat>
-        <D:prop>
-            <D:getetag>"{hash(event_data)}"</D:getetag>
-            <C:calendar-data>{event_data}</C:calendar-data>
-        </D:prop>
-        <D:status>HTTP/1.1 200 OK</D:status>
-    </D:propstat>
-  </D:response>\n"""
+        # Sélectionner les événements via l'index d'intervalles si une plage est demandée
+        with stage('index_lookup'):
+            if not report.match_events:
+                entries = []
+            elif report.time_range is not None:
+                # Les séries retenues par l'index sont vérifiées sur leurs occurrences réelles
+                entries = filter_entries(view.query(*report.time_range), *report.time_range)
+            else:
+                entries = view.events
+        # Construire la réponse XML pour les événements, envoyée en flux
+        def responses():
+            event_count = 0
+            for entry in entries:
+                event_count += 1
+                logger.debug("Ajout de l'événement %s à la réponse REPORT", entry.uid)
+                yield event_report_response(collection.href(entry.uid), entry, report.props,
+                                            report_calendar_data(entry, report))
+            logger.info("REPORT terminé, %d événements inclus dans la réponse", event_count)
         
-        xml_response += '</D:multistatus>'
-        logger.info(f"REPORT terminé, {event_count} événements inclus dans la réponse")
-        return Response(xml_response, mimetype='text/xml')
+        return multistatus_response(counted_events(responses(), report.kind))
+
+# Route principale pour l'accès au calendrier
+@caldav.route('/calendar/', methods=['PROPFIND', 'REPORT', 'GET', 'OPTIONS', 'PROPPATCH'])
+def calendar_root():
+    logger.debug("Requête %s sur /calendar/", request.method)
     
-    elif request.method == 'GET':
+    if request.method != 'GET':
+        return collection_request(legacy_collection)
+    
+    else:
         # Afficher une page simple pour vérifier que tout fonctionne
         update_result = "Fichier utilisateur trouvé et utilisé" if os.path.exists(USER_ICS_FILE) else "Attention: Fichier utilisateur non trouvé"
+        stats = user_file_watcher.stats()
+        sync_info = f"Synchronisations ({stats['mode']}): {stats['syncs_performed']} effectuées, {stats['syncs_skipped']} évitées"
         
         # Obtenir des informations sur les événements
         events_info = ""
         try:
-            cal = read_ical_file(ICS_FILE_PATH)
-            events = list(cal.walk('VEVENT'))
+            view = calendar_view()
+            events = [entry.component for entry in view.events]
             
             if events:
                 events_info = f"<h2>Événements trouvés ({len(events)})</h2><ul>"
@@ -438,38 +492,172 @@ END:VCALENDAR
         <h1>Serveur CalDAV en fonctionnement</h1>
         <p>{update_result}</p>
         <p>Fichier utilisé: {USER_ICS_FILE}</p>
-        <p>Fichier du serveur: {ICS_FILE_PATH}</p>
+        <p>Stockage du serveur ({calendar_storage.name}): {STORAGE_PATH}</p>
+        <p>{sync_info}</p>
         {events_info}
         <p><a href="/update_from_user_file">Forcer la mise à jour depuis le fichier utilisateur</a></p>
         <p><a href="/create_sample_event">Créer un événement exemple</a></p>
         """
 
+# calendar-data d'un événement selon les options C:expand / C:limit-recurrence-set (None : ressource stockée)
+def report_calendar_data(entry, report):
+    if CALENDAR_DATA not in report.props:
+        return None
+    if report.expand is not None:
+        return expanded_resource(entry, *report.expand)
+    if report.limit_recurrence_set is not None:
+        return limited_resource(entry, *report.limit_recurrence_set)
+    return None
+
+# Convertit un href <collection>/<uid>.ics en UID, ou None s'il ne désigne pas un événement de la collection
+def href_to_uid(collection, href):
+    path = unquote(urlsplit(href.strip()).path)
+    if not path.startswith(collection.url) or not path.endswith('.ics'):
+        return None
+    return path[len(collection.url):-len('.ics')] or None
+
+# REPORT calendar-multiget : seuls les href demandés sont servis, depuis les octets pré-sérialisés
+def calendar_multiget_report(collection, view, report):
+    def responses():
+        found = 0
+        for href in report.hrefs:
+            uid = href_to_uid(collection, href)
+            entry = view.get(uid) if uid is not None else None
+            if entry is None:
+                yield missing_response(href)
+            else:
+                found += 1
+                yield event_report_response(href, entry, report.props, report_calendar_data(entry, report))
+        logger.info("calendar-multiget terminé, %d/%d événements trouvés", found, len(report.hrefs))
+    
+    return multistatus_response(counted_events(responses(), report.kind))
+
+# REPORT sync-collection (RFC 6578) : seuls les événements modifiés depuis le jeton sont renvoyés
+def sync_collection_report(collection, view, report):
+    sync_token = collection.sync_token(view)
+    if report.sync_token:
+        try:
+            changed = collection.journal.changes_since(report.sync_token)
+        except InvalidSyncToken:
+            logger.warning("sync-token invalide: %s", report.sync_token)
+            return caldav_response(403, body="""<?xml version="1.0" encoding="utf-8"?>
+<D:error xmlns:D="DAV:"><D:valid-sync-token/></D:error>""")
+    else:
+        # Synchronisation initiale : tous les événements
+        changed = {uid: True for uid, _ in view.etags()}
+    
+    def responses():
+        for uid, present in changed.items():
+            href = collection.href(uid)
+            entry = view.get(uid) if present else None
+            if entry is None:
+                yield missing_response(href)
+            else:
+                yield event_report_response(href, entry, report.props, report_calendar_data(entry, report))
+    
+    logger.info("sync-collection: %d changements depuis %s", len(changed), report.sync_token or 'le début')
+    trailer = f'  <D:sync-token>{escape(sync_token)}</D:sync-token>\n'.encode('utf-8')
+    return multistatus_response(counted_events(responses(), report.kind), trailer)
+
+# REPORT free-busy-query : recherche dichotomique dans l'index des créneaux occupés
+def free_busy_report(collection, view, report):
+    start, end = report.time_range
+    with stage('index_lookup'):
+        busy = collection.busy_index.busy(view, start, end)
+    logger.info("free-busy-query: %d créneaux occupés", sum(len(periods) for periods in busy.values()))
+    return Response(freebusy_calendar(busy, start, end), status=200, content_type='text/calendar; charset=utf-8')
+
+# Liste d'ETag d'un en-tête conditionnel (['*'] pour « n'importe lequel »), ou None s'il est absent
+def conditional_etags(header, etags):
+    if header not in request.headers:
+        return None
+    return ['*'] if etags.star_tag else list(etags)
+
+# Collection désignée par l'URL : la collection historique, ou celle d'un utilisateur (404 si absente)
+def resolve_collection(user=None, calendar=None):
+    if user is None:
+        return legacy_collection
+    collection = collection_registry.get(user, calendar)
+    if collection is None:
+        abort(404)
+    return collection
+
 # Route pour accéder à un événement spécifique
-@app.route('/calendar/<event_id>.ics', methods=['GET'])
-def get_event(event_id):
-    logger.info(f"Requête GET pour l'événement {event_id}")
-    cal = read_ical_file(ICS_FILE_PATH)
+@caldav.route('/calendar/<event_id>.ics', methods=['GET'])
+@caldav.route('/calendars/<user>/<calendar>/<event_id>.ics', methods=['GET'])
+def get_event(event_id, user=None, calendar=None):
+    logger.debug("Requête GET pour l'événement %s", event_id)
+    view = resolve_collection(user, calendar).view()
     
-    # Rechercher l'événement par son ID
-    for component in cal.walk('VEVENT'):
-        if str(component.get('uid', '')) == event_id:
-            # Créer un nouveau calendrier avec juste cet événement
-            event_cal = icalendar.Calendar()
-            event_cal.add('prodid', '-//My Calendar//example.com//')
-            event_cal.add('version', '2.0')
-            event_cal.add_component(component)
-            
-            logger.info(f"Événement {event_id} trouvé et renvoyé")
-            return Response(event_cal.to_ical(), mimetype='text/calendar')
+    # Rechercher l'événement dans l'index des UID
+    with stage('index_lookup'):
+        entry = view.get(event_id)
+    if entry is not None:
+        # Le client possède déjà cette version : inutile de renvoyer le corps
+        if entry.etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{entry.etag}"'})
+        logger.debug("Événement %s trouvé et renvoyé", event_id)
+        return Response(entry.resource, mimetype='text/calendar', headers={'ETag': f'"{entry.etag}"'})
     
-    logger.warning(f"Événement {event_id} non trouvé")
+    logger.info("Événement %s non trouvé", event_id)
     return "Événement non trouvé", 404
 
+# Création ou remplacement d'un événement ; seul cet événement et ses index sont réécrits
+@caldav.route('/calendar/<event_id>.ics', methods=['PUT'])
+@caldav.route('/calendars/<user>/<calendar>/<event_id>.ics', methods=['PUT'])
+def put_event(event_id, user=None, calendar=None):
+    logger.debug("Requête PUT pour l'événement %s", event_id)
+    collection = resolve_collection(user, calendar)
+    try:
+        with stage('parse'):
+            entry = entry_from_calendar(request.get_data())
+    except ValueError as e:
+        logger.warning("Ressource %s invalide: %s", event_id, e)
+        return f"Ressource iCalendar invalide: {str(e)}", 400
+    if entry.uid != event_id:
+        return "L'UID de l'événement doit correspondre au nom de la ressource", 400
+    
+    try:
+        created, etag = collection.storage.put(entry,
+                                               if_match=conditional_etags('If-Match', request.if_match),
+                                               if_none_match=conditional_etags('If-None-Match', request.if_none_match))
+    except PreconditionFailed as e:
+        logger.info("PUT %s refusé: %s", event_id, e)
+        return "Précondition non satisfaite", 412
+    except CalendarUnreadable:
+        return "Calendrier illisible : écriture refusée pour ne pas en perdre le contenu", 409
+    
+    logger.info("Événement %s %s", event_id, 'créé' if created else 'mis à jour')
+    return Response(status=201 if created else 204, headers={'ETag': f'"{etag}"'})
+
+# Suppression d'un événement
+@caldav.route('/calendar/<event_id>.ics', methods=['DELETE'])
+@caldav.route('/calendars/<user>/<calendar>/<event_id>.ics', methods=['DELETE'])
+def delete_event(event_id, user=None, calendar=None):
+    logger.debug("Requête DELETE pour l'événement %s", event_id)
+    collection = resolve_collection(user, calendar)
+    try:
+        collection.storage.delete(event_id, if_match=conditional_etags('If-Match', request.if_match))
+    except EventNotFound:
+        return "Événement non trouvé", 404
+    except PreconditionFailed as e:
+        logger.info("DELETE %s refusé: %s", event_id, e)
+        return "Précondition non satisfaite", 412
+    except CalendarUnreadable:
+        return "Calendrier illisible : écriture refusée pour ne pas en perdre le contenu", 409
+    return Response(status=204)
+
 # Route pour forcer la mise à jour depuis le fichier utilisateur
-@app.route('/update_from_user_file', methods=['GET'])
+@caldav.route('/update_from_user_file', methods=['GET'])
 def force_update():
     logger.info("Mise à jour forcée demandée")
-    result = update_calendar_from_user_file()
+    if calendar_storage.name == 'ics':
+        result = update_calendar_from_user_file(force=True)
+    else:
+        # Les stockages par événement sont réalimentés par import du fichier utilisateur
+        result = os.path.exists(USER_ICS_FILE)
+        if result:
+            import_ics(USER_ICS_FILE, calendar_storage)
     if result:
         return """
         <h1>Calendrier mis à jour avec succès</h1>
@@ -484,40 +672,90 @@ def force_update():
         <p><a href="/">Retour à la page d'accueil</a></p>
         """, 404
 
-# Route pour créer un événement exemple
-@app.route('/create_sample_event', methods=['GET'])
-def create_sample_event():
-    logger.info("Création d'un événement exemple demandée")
-    # Créer un calendrier avec un événement de test
-    cal = icalendar.Calendar()
-    cal.add('prodid', '-//My Calendar//example.com//')
-    cal.add('version', '2.0')
-    
-    # Créer un événement de test
+# Route pour consulter les compteurs de synchronisation du fichier utilisateur
+@caldav.route('/sync_stats', methods=['GET'])
+def sync_stats():
+    stats = user_file_watcher.stats()
+    stats['collections'] = collection_registry.stats()
+    stats['recurrence_cache'] = {'size': len(occurrence_cache), 'hits': occurrence_cache.hits,
+                                 'misses': occurrence_cache.misses}
+    return jsonify(stats)
+
+# Compteurs des caches et de la synchronisation, lus à chaque exposition des métriques
+def cache_metrics():
+    families = []
+    caches = [('discovery', discovery_cache), ('recurrence', occurrence_cache)]
+    if calendar_storage.name == 'ics':
+        caches.append(('parse', calendar_storage.cache))
+    for name, cache in caches:
+        families.append((f'caldav_{name}_cache_hits_total', 'counter', f'Accès servis par le cache {name}',
+                         [({}, cache.hits)]))
+        families.append((f'caldav_{name}_cache_misses_total', 'counter', f'Accès non servis par le cache {name}',
+                         [({}, cache.misses)]))
+    if calendar_storage.name == 'ics':
+        families.append(('caldav_parse_cache_coalesced_total', 'counter',
+                         'Requêtes servies par une analyse déjà en cours', [({}, calendar_storage.cache.coalesced)]))
+    sync = user_file_watcher.stats()
+    families.append(('caldav_file_syncs_total', 'counter', 'Vérifications du fichier utilisateur',
+                     [({'result': 'performed'}, sync['syncs_performed']),
+                      ({'result': 'skipped'}, sync['syncs_skipped'])]))
+    collections = collection_registry.stats()
+    families.append(('caldav_collections_resident', 'gauge', 'Collections chargées en mémoire',
+                     [({}, collections['resident'])]))
+    families.append(('caldav_collections_memory_bytes', 'gauge', 'Estimation de la mémoire des collections chargées',
+                     [({}, collections['memory_estimate'])]))
+    families.append(('caldav_collection_evictions_total', 'counter', 'Collections libérées (budget mémoire)',
+                     [({}, collections['evictions'])]))
+    log = logging_stats()
+    families.append(('caldav_log_messages_discarded_total', 'counter',
+                     'Messages de journal ignorés (limite de débit) ou abandonnés (file pleine)',
+                     [({'reason': 'rate_limit'}, log['suppressed']), ({'reason': 'queue_full'}, log['dropped'])]))
+    return families
+
+REGISTRY.register_collector(cache_metrics)
+
+# Métriques au format texte Prometheus
+@caldav.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
+
+# Piles repliées du profileur par échantillonnage (CALDAV_PROFILE=1) ; ?reset=1 remet les compteurs à zéro
+@caldav.route('/metrics/profile', methods=['GET'])
+def profile():
+    if not profiler.running:
+        return "Profileur désactivé (CALDAV_PROFILE=1 pour l'activer)", 404
+    return Response(profiler.collapsed(reset=request.args.get('reset') == '1'),
+                    content_type='text/plain; charset=utf-8', headers={'Cache-Control': 'no-store'})
+
+# Événement de test d'une heure, aujourd'hui à 10h UTC
+def sample_event(summary):
+    # icalendar et pytz ne sont chargés que pour créer un exemple
+    import icalendar
+    import pytz
     event = icalendar.Event()
-    event.add('summary', 'Événement Exemple ' + datetime.now().strftime('%H:%M:%S'))
+    event.add('summary', summary)
     
-    # Date de début (demain à 10h)
+    # Date de début (aujourd'hui à 10h)
     start_time = datetime.now(pytz.utc).replace(hour=10, minute=0, second=0)
     event.add('dtstart', start_time)
     
-    # Date de fin (demain à 11h)
+    # Date de fin (aujourd'hui à 11h)
     end_time = start_time.replace(hour=11)
     event.add('dtend', end_time)
     
     event.add('dtstamp', datetime.now(pytz.utc))
     event.add('uid', str(uuid.uuid4()))
+    return event
+
+# Route pour créer un événement exemple
+@caldav.route('/create_sample_event', methods=['GET'])
+def create_sample_event():
+    logger.info("Création d'un événement exemple demandée")
+    event = sample_event('Événement Exemple ' + datetime.now().strftime('%H:%M:%S'))
     
-    # Ajouter l'événement au calendrier
-    cal.add_component(event)
-    
-    # Sauvegarder le calendrier dans le fichier utilisateur
-    os.makedirs(os.path.dirname(USER_ICS_FILE), exist_ok=True)
-    with open(USER_ICS_FILE, 'wb') as f:
-        f.write(cal.to_ical())
-    
-    # Mettre à jour le calendrier du serveur
-    update_calendar_from_user_file()
+    # Seul le nouvel événement est ajouté au stockage
+    calendar_storage.put(entry_from_component(event))
     
     return """
     <h1>Événement exemple créé</h1>
@@ -525,5 +763,57 @@ def create_sample_event():
     <p><a href="/">Retour à la page d'accueil</a></p>
     """
 
+# Créer un exemple de fichier .ics si aucun n'existe (commande create-sample)
+def create_sample_ics():
+    import icalendar
+    if os.path.exists(USER_ICS_FILE):
+        return False
+    # Assurez-vous que le dossier existe
+    os.makedirs(os.path.dirname(USER_ICS_FILE), exist_ok=True)
+    
+    # Créer un calendrier avec un événement de test
+    cal = icalendar.Calendar()
+    cal.add('prodid', '-//My Calendar//example.com//')
+    cal.add('version', '2.0')
+    cal.add_component(sample_event('Événement Exemple'))
+    
+    # Sauvegarder le calendrier
+    with open(USER_ICS_FILE, 'wb') as f:
+        f.write(cal.to_ical())
+    
+    logger.info("Fichier exemple %s créé", USER_ICS_FILE)
+    return True
+
+# Construit l'index préconstruit du calendrier servi (commande build-index)
+def build_index(path):
+    os.makedirs(os.path.dirname(ICS_FILE_PATH), exist_ok=True)
+    if os.path.exists(USER_ICS_FILE):
+        UserFileWatcher(USER_ICS_FILE, ICS_FILE_PATH).sync_if_changed(force=True)
+    started = time.perf_counter()
+    with open(ICS_FILE_PATH, 'rb') as f:
+        data = f.read()
+    snapshot = CalendarSnapshot.from_bytes(None, data)
+    write_index(path, snapshot, data)
+    logger.info("Index %s écrit: %d événements analysés en %.0f ms", path, len(snapshot.events),
+                (time.perf_counter() - started) * 1000)
+    return len(snapshot.events)
+
+#   python app2.py                  serveur de développement
+#   python app2.py create-sample    crée calendars/user/event.ics s'il n'existe pas
+#   python app2.py build-index      écrit l'index préconstruit (CALDAV_INDEX_SNAPSHOT)
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Serveur CalDAV")
+    parser.add_argument('command', nargs='?', default='serve', choices=('serve', 'create-sample', 'build-index'))
+    parser.add_argument('--output', help="chemin de l'index (build-index ; par défaut CALDAV_INDEX_SNAPSHOT)")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        create_app().run(debug=True, host='0.0.0.0', port=5000)
+    else:
+        configure_logging()
+        if args.command == 'create-sample':
+            if not create_sample_ics():
+                print(f"{USER_ICS_FILE} existe déjà")
+        else:
+            output = args.output or INDEX_SNAPSHOT or f'{ICS_FILE_PATH}.index'
+            print(f"{build_index(output)} événements indexés dans {output}")
@@ -0,0 +1,211 @@
+import os
+import io
+import sys
+import asyncio
+import logging
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from app2 import create_app
+
+logger = logging.getLogger('caldav-server')
+
+# Nombre de requêtes traitées simultanément ; les connexions inactives n'occupent aucun thread
+WORKER_THREADS = int(os.environ.get('CALDAV_ASGI_THREADS', '32'))
+# Taille maximale d'un corps de requête (PUT, REPORT)
+MAX_BODY_SIZE = int(os.environ.get('CALDAV_MAX_BODY_SIZE', str(10 * 1024 * 1024)))
+# Morceaux de réponse produits d'avance par le thread de traitement avant d'attendre le client
+MAX_PENDING_CHUNKS = int(os.environ.get('CALDAV_ASGI_PENDING_CHUNKS', '8'))
+
+_START, _BODY, _ERROR, _END = 'start', 'body', 'error', 'end'
+
+
+# Point d'entrée ASGI : la boucle asyncio gère les connexions, l'application Flask (WSGI) s'exécute
+# dans un pool de threads borné qui absorbe les accès disque et les analyses
+class WsgiToAsgi:
+    def __init__(self, wsgi_app, max_workers=WORKER_THREADS):
+        self.wsgi_app = wsgi_app
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='caldav')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Type de connexion non géré: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                logger.info("Serveur ASGI démarré (%d threads de traitement)", self.max_workers)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # L'attente des requêtes en cours se fait hors de la boucle d'événements
+                await asyncio.get_running_loop().run_in_executor(None, partial(self.executor.shutdown, wait=True))
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                raise ValueError(f"Corps de requête supérieur à {MAX_BODY_SIZE} octets")
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            # PEP 3333 : chemin décodé, transporté en latin-1
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]) if server[1] is not None else '80',
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    # Exécute l'application WSGI et parcourt tout son corps dans un seul thread du pool (une application WSGI
+    # peut supposer un thread par requête : connexions SQLite par thread, curseurs ouverts pendant le flux).
+    # Les messages (en-têtes, morceaux, erreur, fin) sont transmis à la boucle par une file asyncio ;
+    # credit borne le nombre de morceaux produits d'avance, cancelled arrête le parcours si le client est parti.
+    def _run(self, environ, loop, queue, credit, cancelled):
+        response = {}
+        started = []
+
+        def push(kind, value=None):
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+
+        def emit(data):
+            if not started:
+                started.append(True)
+                push(_START, response)
+            if data:
+                credit.acquire()
+                if not cancelled.is_set():
+                    push(_BODY, data)
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return emit
+
+        result = None
+        try:
+            result = self.wsgi_app(environ, start_response)
+            for chunk in result:
+                if cancelled.is_set():
+                    break
+                emit(chunk)
+            if not started:
+                emit(b'')
+        except BaseException as e:
+            push(_ERROR, (e, bool(started)))
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning("Erreur à la fermeture de la réponse: %s", e)
+            push(_END)
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        try:
+            body = await self._read_body(receive)
+        except ValueError as e:
+            logger.warning('%s', e)
+            await send({'type': 'http.response.start', 'status': 413, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        if body is None:
+            return
+
+        queue = asyncio.Queue()
+        credit = threading.Semaphore(MAX_PENDING_CHUNKS)
+        cancelled = threading.Event()
+        worker = loop.run_in_executor(self.executor, self._run, self._environ(scope, body), loop, queue, credit,
+                                      cancelled)
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == _START:
+                    await send({'type': 'http.response.start', 'status': value['status'],
+                                'headers': value['headers']})
+                elif kind == _BODY:
+                    await send({'type': 'http.response.body', 'body': value, 'more_body': True})
+                    credit.release()
+                elif kind == _ERROR:
+                    error, started = value
+                    logger.error("Erreur pendant le traitement de %s %s: %r", scope['method'], scope['path'], error)
+                    if started:
+                        # En-têtes déjà envoyés : la réponse est interrompue
+                        raise error
+                    await send({'type': 'http.response.start', 'status': 500, 'headers': []})
+                else:
+                    break
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Débloque le thread de traitement s'il attend encore le client, puis attend sa fin
+            cancelled.set()
+            credit.release(MAX_PENDING_CHUNKS)
+            await worker
+
+
+# asgi:application : application créée au premier accès à l'attribut (voir app2.__getattr__)
+_application_lock = threading.Lock()
+
+
+def __getattr__(name):
+    if name == 'application':
+        with _application_lock:
+            if 'application' not in globals():
+                globals()['application'] = WsgiToAsgi(create_app())
+        return globals()['application']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn n'est pas installé : pip install uvicorn (ou lancer asgi:application avec un autre serveur ASGI)")
+    uvicorn.run('asgi:application', host=os.environ.get('CALDAV_HOST', '0.0.0.0'),
+                port=int(os.environ.get('CALDAV_PORT', '5000')), log_level='info')
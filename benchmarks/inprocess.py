@@ -0,0 +1,106 @@
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+from benchmarks.measure import summarize, peak_rss, process_rss
+from benchmarks.workloads import select, requests_for
+
+# Mesures dans le processus via le client de test Flask : exécuté dans un sous-processus par taille de
+# calendrier, depuis le répertoire de travail qui contient calendars/user/event.ics
+
+
+def _send(client, method, path, headers, body):
+    response = client.open(path, method=method, headers=headers, data=body, buffered=True)
+    size = len(response.get_data())
+    status = response.status_code
+    response.close()
+    return status, size
+
+
+# Octets alloués par requête (tracemalloc) : pic pendant la requête et solde restant après
+def _allocations(client, requests, count):
+    peaks = []
+    retained = []
+    tracemalloc.start()
+    try:
+        for _ in range(count):
+            request = next(requests)
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            _send(client, *request)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return {'alloc_peak_bytes': round(sum(peaks) / len(peaks)) if peaks else None,
+            'alloc_retained_bytes': round(sum(retained) / len(retained)) if retained else None}
+
+
+def run(events, workload_names, requests, max_seconds, warmup, traced, seed):
+    started = time.perf_counter()
+    import app2
+    import_seconds = time.perf_counter() - started
+    rss_after_import = process_rss()
+    started = time.perf_counter()
+    app = app2.create_app()
+    startup_seconds = time.perf_counter() - started
+    client = app.test_client()
+
+    results = []
+    first_request_seconds = None
+    for workload in select(workload_names):
+        if not workload.applies_to(events):
+            continue
+        stream = requests_for(workload, events, seed)
+        for index in range(warmup):
+            request_started = time.perf_counter()
+            _send(client, *next(stream))
+            if first_request_seconds is None:
+                first_request_seconds = time.perf_counter() - request_started
+
+        latencies = []
+        errors = 0
+        response_bytes = 0
+        began = time.perf_counter()
+        while len(latencies) < requests and (time.perf_counter() - began < max_seconds or len(latencies) < 5):
+            request = next(stream)
+            request_started = time.perf_counter()
+            status, size = _send(client, *request)
+            latencies.append(time.perf_counter() - request_started)
+            response_bytes += size
+            if status >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - began
+
+        result = summarize(workload.name, latencies, elapsed, response_bytes, errors)
+        if traced:
+            result.update(_allocations(client, stream, traced))
+        results.append(result)
+
+    return {
+        'events': events,
+        'import_seconds': round(import_seconds, 4),
+        'startup_seconds': round(startup_seconds, 4),
+        'first_request_seconds': round(first_request_seconds, 4) if first_request_seconds is not None else None,
+        'rss_after_import_bytes': rss_after_import,
+        'peak_rss_bytes': peak_rss(),
+        'workloads': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mesures dans le processus (client de test Flask)")
+    parser.add_argument('--events', type=int, required=True)
+    parser.add_argument('--workloads', default='')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--max-seconds', type=float, default=10.0)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--traced', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    names = [name for name in args.workloads.split(',') if name]
+    report = run(args.events, names, args.requests, args.max_seconds, args.warmup, args.traced, args.seed)
+    json.dump(report, sys.stdout)
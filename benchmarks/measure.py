@@ -0,0 +1,60 @@
+import os
+import sys
+import math
+import resource
+
+
+# Centile par la méthode du rang le plus proche
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# Résumé d'un scénario : latences en millisecondes, débit, volume de réponse et erreurs
+def summarize(name, latencies, elapsed, response_bytes, errors, concurrency=1):
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        'workload': name,
+        'requests': count,
+        'concurrency': concurrency,
+        'errors': errors,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3) if count else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3) if count else None,
+        'mean_ms': round(sum(values) / count * 1000, 3) if count else None,
+        'max_ms': round(values[-1] * 1000, 3) if count else None,
+        'requests_per_second': round(count / elapsed, 1) if elapsed > 0 else None,
+        'response_bytes_mean': round(response_bytes / count) if count else None,
+    }
+
+
+# Pic de mémoire résidente du processus courant, en octets (ru_maxrss est en Ko sous Linux, en octets sous macOS)
+def peak_rss():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+# Pic de mémoire résidente d'un autre processus (Linux : VmHWM), None si indisponible
+def process_peak_rss(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+# Mémoire résidente actuelle d'un processus (Linux : VmRSS), None si indisponible
+def process_rss(pid=None):
+    try:
+        with open(f'/proc/{pid or os.getpid()}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.synthetic import write_calendar
+from benchmarks.measure import summarize
+from benchmarks.workloads import select
+from benchmarks.server import LocalServer, drive
+
+# Banc de mesure de app2.py :
+#   python -m benchmarks.run --sizes 10,1000,10000,100000 --output bench.json
+#   python -m benchmarks.run --sizes 1000 --mode server --workers 4 --compare bench.json
+#   python -m benchmarks.run --sizes 10,100000 --mode startup
+# Chaque taille de calendrier est mesurée dans des processus neufs, à partir d'un répertoire de travail
+# temporaire contenant calendars/user/event.ics généré de façon reproductible.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = '10,1000,10000,100000'
+
+
+def _environment(args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_ROOT, env.get('PYTHONPATH')]))
+    env['CALDAV_STORAGE'] = args.backend
+    env.setdefault('CALDAV_LOG_LEVEL', args.log_level)
+    return env
+
+
+def _prepare(workdir, events, args):
+    os.makedirs(os.path.join(workdir, 'calendars', 'user'), exist_ok=True)
+    write_calendar(os.path.join(workdir, 'calendars', 'user', 'event.ics'), events,
+                   recurring_ratio=args.recurring_ratio, seed=args.seed)
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_inprocess(workdir, events, args, env):
+    command = [sys.executable, '-m', 'benchmarks.inprocess', '--events', str(events),
+               '--workloads', ','.join(args.workloads), '--requests', str(args.requests),
+               '--max-seconds', str(args.max_seconds), '--traced', str(args.traced), '--seed', str(args.seed)]
+    with open(os.path.join(workdir, 'inprocess.log'), 'ab') as log:
+        result = subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=log, check=True)
+    report = json.loads(result.stdout)
+    report['mode'] = 'inprocess'
+    return report
+
+
+def run_server(workdir, events, args, env):
+    with LocalServer(workdir, workers=args.workers, kind=args.server, env=env) as server:
+        results = []
+        for workload in select(args.workloads):
+            if not workload.applies_to(events):
+                continue
+            # Préchauffage : chaque processus doit avoir analysé le calendrier
+            drive(server.port, workload, events, args.workers * 2, concurrency=args.workers, seed=args.seed)
+            results.append(drive(server.port, workload, events, args.requests, concurrency=args.concurrency,
+                                 max_seconds=args.max_seconds, seed=args.seed))
+        rss = server.peak_rss()
+    return {'mode': 'server', 'server': args.server, 'workers': args.workers, 'events': events,
+            'peak_rss_bytes': rss['max'], 'peak_rss_total_bytes': rss['total'], 'workloads': results}
+
+
+# Démarrages à froid dans des processus neufs, sans puis avec l'index préconstruit (python app2.py build-index)
+def run_startup(workdir, events, args, env):
+    def measure(run_env):
+        samples = []
+        for _ in range(args.startup_runs):
+            with open(os.path.join(workdir, 'startup.log'), 'ab') as log:
+                result = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--events', str(events),
+                                         '--seed', str(args.seed)],
+                                        cwd=workdir, env=run_env, stdout=subprocess.PIPE, stderr=log, check=True)
+            samples.append(json.loads(result.stdout))
+        return samples
+
+    def workloads(samples, suffix=''):
+        results = []
+        for field, name in (('import_seconds', 'import'), ('startup_seconds', 'create_app'),
+                            ('first_request_seconds', 'first_request')):
+            values = [sample[field] for sample in samples]
+            errors = sum(1 for sample in samples if sample['first_request_status'] >= 400)
+            results.append(summarize(f'cold_{name}{suffix}', values, sum(values), 0,
+                                     errors if name == 'first_request' else 0))
+        return results
+
+    plain = measure(env)
+    index_env = dict(env, CALDAV_INDEX_SNAPSHOT=os.path.join(workdir, 'calendars', 'my_calendar.ics.index'))
+    with open(os.path.join(workdir, 'startup.log'), 'ab') as log:
+        subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'app2.py'), 'build-index'], cwd=workdir,
+                       env=index_env, stdout=log, stderr=log, check=True)
+    indexed = measure(index_env)
+    return {'mode': 'startup', 'events': events, 'peak_rss_bytes': max(sample['rss_bytes'] for sample in plain),
+            'eager_modules': plain[0]['eager_modules'],
+            'workloads': workloads(plain) + workloads(indexed, '_index')}
+
+
+# Écarts relatifs avec un fichier de résultats précédent, par (mode, taille, scénario)
+def compare(previous, current):
+    def index(report):
+        return {(run['mode'], run['events'], workload['workload']): workload
+                for run in report['runs'] for workload in run['workloads']}
+
+    before = index(previous)
+    lines = [f"{'mode':<10} {'événements':>10} {'scénario':<26} {'p50':>9} {'p99':>9} {'req/s':>9}"]
+    for key, after in sorted(index(current).items()):
+        old = before.get(key)
+        if old is None:
+            continue
+
+        def delta(field):
+            if not old.get(field) or after.get(field) is None:
+                return '—'
+            return f'{(after[field] - old[field]) / old[field] * 100:+.1f}%'
+
+        lines.append(f'{key[0]:<10} {key[1]:>10} {key[2]:<26} {delta("p50_ms"):>9} {delta("p99_ms"):>9} '
+                     f'{delta("requests_per_second"):>9}')
+    return '\n'.join(lines)
+
+
+def _print_run(report, out):
+    rss = report.get('peak_rss_bytes')
+    header = f"\n[{report['mode']}] {report['events']} événements"
+    if rss:
+        header += f", pic RSS {rss / 1048576:.1f} Mo"
+    if report.get('import_seconds') is not None:
+        header += f", import {report['import_seconds'] * 1000:.0f} ms"
+    if report.get('startup_seconds') is not None:
+        header += f", create_app {report['startup_seconds'] * 1000:.0f} ms"
+    if report.get('first_request_seconds') is not None:
+        header += f", 1re requête {report['first_request_seconds'] * 1000:.0f} ms"
+    if report.get('eager_modules'):
+        header += f", chargés au démarrage : {', '.join(report['eager_modules'])}"
+    print(header, file=out)
+    for workload in report['workloads']:
+        line = (f"  {workload['workload']:<26} p50 {workload['p50_ms']:>9.3f} ms  p99 {workload['p99_ms']:>9.3f} ms  "
+                f"{workload['requests_per_second']:>9.1f} req/s")
+        if workload.get('alloc_peak_bytes') is not None:
+            line += f"  alloc {workload['alloc_peak_bytes'] / 1024:.0f} Kio/req"
+        if workload['errors']:
+            line += f"  {workload['errors']} erreurs"
+        print(line, file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de mesure du serveur CalDAV (app2.py)")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="tailles de calendrier, séparées par des virgules")
+    parser.add_argument('--mode', default='inprocess,server',
+                        help="inprocess (client de test), server, startup (démarrage à froid), séparés par des virgules")
+    parser.add_argument('--workloads', default='', help="scénarios à exécuter (par défaut : tous)")
+    parser.add_argument('--requests', type=int, default=200, help="requêtes mesurées par scénario")
+    parser.add_argument('--max-seconds', type=float, default=10.0, help="durée maximale d'un scénario")
+    parser.add_argument('--traced', type=int, default=5, help="requêtes suivies par tracemalloc (inprocess)")
+    parser.add_argument('--startup-runs', type=int, default=5, help="processus neufs par mesure (startup)")
+    parser.add_argument('--workers', type=int, default=4, help="processus du serveur local")
+    parser.add_argument('--concurrency', type=int, default=8, help="clients simultanés (server)")
+    parser.add_argument('--server', choices=('builtin', 'gunicorn'), default='builtin')
+    parser.add_argument('--backend', choices=('ics', 'directory', 'sqlite'), default='ics')
+    parser.add_argument('--recurring-ratio', type=float, default=0.1)
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="fichier JSON des résultats")
+    parser.add_argument('--compare', help="résultats précédents à comparer")
+    parser.add_argument('--keep', action='store_true', help="conserver les répertoires de travail")
+    args = parser.parse_args(argv)
+
+    args.workloads = [name for name in args.workloads.split(',') if name]
+    select(args.workloads)
+    modes = [mode for mode in args.mode.split(',') if mode]
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    env = _environment(args)
+
+    report = {
+        'meta': {
+            'commit': _commit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'backend': args.backend,
+            'log_level': env['CALDAV_LOG_LEVEL'],
+            'requests': args.requests,
+            'seed': args.seed,
+        },
+        'runs': [],
+    }
+    for events in sizes:
+        for mode in modes:
+            workdir = tempfile.mkdtemp(prefix=f'caldav-bench-{events}-')
+            try:
+                _prepare(workdir, events, args)
+                if mode == 'inprocess':
+                    run = run_inprocess(workdir, events, args, env)
+                elif mode == 'server':
+                    run = run_server(workdir, events, args, env)
+                elif mode == 'startup':
+                    run = run_startup(workdir, events, args, env)
+                else:
+                    parser.error(f"mode inconnu: {mode}")
+                report['runs'].append(run)
+                _print_run(run, sys.stderr)
+            finally:
+                if args.keep:
+                    print(f"  répertoire conservé : {workdir}", file=sys.stderr)
+                else:
+                    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print(compare(json.load(f), report))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import socket
+import shutil
+import argparse
+import threading
+import subprocess
+import http.client
+
+from benchmarks.measure import summarize, process_peak_rss
+from benchmarks.workloads import requests_for
+
+# Serveur local multi-processus : sans gunicorn, des processus werkzeug partagent un même socket d'écoute
+# (modèle pré-fork, chaque processus crée l'application comme le ferait un worker gunicorn)
+
+
+# Processus de travail : sert app2 sur le socket hérité du processus parent
+def serve_worker(fd):
+    from werkzeug.serving import make_server
+    import app2
+    listener = socket.socket(fileno=fd)
+    host, port = listener.getsockname()[:2]
+    listener.detach()
+    make_server(host, port, app2.create_app(), threaded=True, fd=fd).serve_forever()
+
+
+class LocalServer:
+    def __init__(self, workdir, workers=4, kind='builtin', env=None, log_path=None):
+        self.workdir = workdir
+        self.workers = workers
+        self.kind = kind
+        self.env = env
+        self.log_path = log_path or os.path.join(workdir, 'server.log')
+        self.port = None
+        self.processes = []
+        self._socket = None
+        self._log = None
+
+    def start(self):
+        self._log = open(self.log_path, 'ab')
+        if self.kind == 'gunicorn':
+            if shutil.which('gunicorn') is None:
+                raise RuntimeError("gunicorn n'est pas installé (utiliser --server builtin)")
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                self.port = probe.getsockname()[1]
+            self.processes.append(subprocess.Popen(
+                ['gunicorn', '-w', str(self.workers), '--threads', '4', '-b', f'127.0.0.1:{self.port}', 'app2:create_app()'],
+                cwd=self.workdir, env=self.env, stdout=self._log, stderr=self._log))
+        else:
+            self._socket = socket.socket()
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind(('127.0.0.1', 0))
+            self._socket.listen(1024)
+            self._socket.set_inheritable(True)
+            self.port = self._socket.getsockname()[1]
+            fd = self._socket.fileno()
+            for _ in range(self.workers):
+                self.processes.append(subprocess.Popen(
+                    [sys.executable, '-m', 'benchmarks.server', '--worker-fd', str(fd)],
+                    cwd=self.workdir, env=self.env, pass_fds=(fd,), stdout=self._log, stderr=self._log))
+        self.wait_ready()
+        return self
+
+    def wait_ready(self, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(process.poll() is not None for process in self.processes):
+                raise RuntimeError(f"Le serveur s'est arrêté au démarrage (voir {self.log_path})")
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+                connection.request('GET', '/')
+                connection.getresponse().read()
+                connection.close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f"Le serveur ne répond pas après {timeout}s (voir {self.log_path})")
+
+    # Pics de mémoire résidente des processus (maître gunicorn compris), en octets
+    def peak_rss(self):
+        pids = [process.pid for process in self.processes]
+        if self.kind == 'gunicorn':
+            try:
+                output = subprocess.run(['pgrep', '-P', str(pids[0])], capture_output=True, text=True).stdout
+                pids += [int(pid) for pid in output.split()]
+            except OSError:
+                pass
+        values = [value for value in (process_peak_rss(pid) for pid in pids) if value is not None]
+        return {'max': max(values) if values else None, 'total': sum(values) if values else None}
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self._socket is not None:
+            self._socket.close()
+        if self._log is not None:
+            self._log.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# Charge un scénario avec `concurrency` clients HTTP/1.1 à connexion persistante
+def drive(port, workload, events, requests, concurrency=8, max_seconds=10.0, seed=0):
+    latencies = []
+    totals = {'bytes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + max_seconds
+    per_client = max(1, requests // concurrency)
+
+    def client(index):
+        stream = requests_for(workload, events, seed + index)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        local = []
+        size = 0
+        errors = 0
+        try:
+            while len(local) < per_client and (time.perf_counter() < deadline or not local):
+                method, path, headers, body = next(stream)
+                started = time.perf_counter()
+                try:
+                    connection.request(method, path, body=body or None, headers=headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                    errors += 1
+                    continue
+                local.append(time.perf_counter() - started)
+                size += len(data)
+                if response.status >= 400:
+                    errors += 1
+        finally:
+            connection.close()
+            with lock:
+                latencies.extend(local)
+                totals['bytes'] += size
+                totals['errors'] += errors
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    return summarize(workload.name, latencies, elapsed, totals['bytes'], totals['errors'], concurrency)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Processus de travail du serveur de mesure")
+    parser.add_argument('--worker-fd', type=int, required=True)
+    serve_worker(parser.parse_args().worker_fd)
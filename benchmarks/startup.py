@@ -0,0 +1,53 @@
+import sys
+import json
+import time
+import argparse
+
+from benchmarks.measure import process_rss
+from benchmarks.workloads import select, requests_for
+
+# Démarrage à froid d'un processus (worker gunicorn, instance serverless) : import de app2, create_app()
+# puis première requête sur le calendrier, qui synchronise et charge le fichier (ou son index préconstruit).
+# Exécuté dans un processus neuf par mesure, depuis le répertoire de travail du banc.
+
+FIRST_REQUEST = 'report_week'
+# Modules coûteux à importer, qui ne devraient être chargés qu'à la première utilisation
+HEAVY_MODULES = ('icalendar', 'pytz', 'dateutil', 'xml.etree.ElementTree')
+
+
+def run(events, seed):
+    started = time.perf_counter()
+    import app2
+    import_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    app = app2.create_app()
+    startup_seconds = time.perf_counter() - started
+    eager_modules = [name for name in HEAVY_MODULES if name in sys.modules]
+    rss_after_startup = process_rss()
+
+    client = app.test_client()
+    method, path, headers, body = next(requests_for(select([FIRST_REQUEST])[0], events, seed))
+    started = time.perf_counter()
+    response = client.open(path, method=method, headers=headers, data=body, buffered=True)
+    first_request_seconds = time.perf_counter() - started
+    status = response.status_code
+    response.close()
+
+    return {
+        'import_seconds': import_seconds,
+        'startup_seconds': startup_seconds,
+        'first_request_seconds': first_request_seconds,
+        'first_request_status': status,
+        'eager_modules': eager_modules,
+        'rss_after_startup_bytes': rss_after_startup,
+        'rss_bytes': process_rss(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mesure du démarrage à froid de app2")
+    parser.add_argument('--events', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    json.dump(run(args.events, args.seed), sys.stdout)
@@ -0,0 +1,93 @@
+import random
+from datetime import datetime, timedelta
+
+# Calendriers synthétiques reproductibles : événements ponctuels, journées entières, séries récurrentes
+# (avec EXDATE et occurrences modifiées) et événements dans le fuseau Europe/Paris
+
+START = datetime(2025, 1, 1, 8, 0)
+SPAN_DAYS = 365
+
+VTIMEZONE = """BEGIN:VTIMEZONE
+TZID:Europe/Paris
+BEGIN:STANDARD
+DTSTART:19701025T030000
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+END:STANDARD
+BEGIN:DAYLIGHT
+DTSTART:19700329T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU
+TZOFFSETFROM:+0100
+TZOFFSETTO:+0200
+END:DAYLIGHT
+END:VTIMEZONE
+"""
+
+SUMMARIES = ('Réunion d\'équipe', 'Point projet', 'Revue de code', 'Déjeuner client', 'Formation',
+             'Entretien', 'Visite de chantier', 'Maintenance ascenseur', 'Comité de pilotage', 'Démonstration')
+LOCATIONS = ('Bureau 30', 'Salle A', 'Salle B', 'Visioconférence', 'Site client', '')
+
+
+def uid_for(index):
+    return f'bench-{index:07d}@syncroteam'
+
+
+def _utc(moment):
+    return moment.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _local(moment):
+    return moment.strftime('%Y%m%dT%H%M%S')
+
+
+# Lignes d'un événement ; kind : 'single', 'allday', 'paris' ou 'recurring'
+def event_lines(index, kind, rng, dtstamp):
+    start = START + timedelta(days=rng.randrange(SPAN_DAYS), hours=rng.randrange(10), minutes=15 * rng.randrange(4))
+    end = start + timedelta(minutes=30 * rng.randint(1, 6))
+    uid = uid_for(index)
+    lines = ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{dtstamp}']
+    if kind == 'allday':
+        lines += [f'DTSTART;VALUE=DATE:{start:%Y%m%d}', f'DTEND;VALUE=DATE:{start + timedelta(days=1):%Y%m%d}']
+    elif kind == 'paris':
+        lines += [f'DTSTART;TZID=Europe/Paris:{_local(start)}', f'DTEND;TZID=Europe/Paris:{_local(end)}']
+    else:
+        lines += [f'DTSTART:{_utc(start)}', f'DTEND:{_utc(end)}']
+    lines.append(f'SUMMARY:{rng.choice(SUMMARIES)} {index}')
+    location = rng.choice(LOCATIONS)
+    if location:
+        lines.append(f'LOCATION:{location}')
+    lines.append(f'DESCRIPTION:Événement synthétique {index} généré pour les mesures de performance')
+    overrides = []
+    if kind == 'recurring':
+        lines.append(f"RRULE:FREQ=WEEKLY;COUNT={rng.randint(4, 52)}")
+        lines.append(f'EXDATE:{_utc(start + timedelta(weeks=2))}')
+        # Une occurrence déplacée d'une heure
+        moved = start + timedelta(weeks=1)
+        overrides = ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{dtstamp}', f'RECURRENCE-ID:{_utc(moved)}',
+                     f'DTSTART:{_utc(moved + timedelta(hours=1))}', f'DTEND:{_utc(end + timedelta(weeks=1, hours=1))}',
+                     f'SUMMARY:{rng.choice(SUMMARIES)} {index} (déplacé)', 'END:VEVENT']
+    lines.append('END:VEVENT')
+    return lines + overrides
+
+
+# Écrit un calendrier de `events` ressources dans `path` ; recurring_ratio et paris_ratio fixent la part
+# de séries récurrentes et d'événements à fuseau horaire, allday_ratio celle des journées entières
+def write_calendar(path, events, recurring_ratio=0.1, paris_ratio=0.2, allday_ratio=0.05, seed=0):
+    rng = random.Random(seed)
+    dtstamp = _utc(START)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//SyncroTeam//Benchmarks//FR\r\n')
+        f.write(VTIMEZONE.replace('\n', '\r\n'))
+        for index in range(events):
+            draw = rng.random()
+            if draw < recurring_ratio:
+                kind = 'recurring'
+            elif draw < recurring_ratio + paris_ratio:
+                kind = 'paris'
+            elif draw < recurring_ratio + paris_ratio + allday_ratio:
+                kind = 'allday'
+            else:
+                kind = 'single'
+            f.write('\r\n'.join(event_lines(index, kind, rng, dtstamp)) + '\r\n')
+        f.write('END:VCALENDAR\r\n')
@@ -0,0 +1,77 @@
+import random
+
+from benchmarks.synthetic import uid_for
+
+CALENDAR_URL = '/calendar/'
+
+PROPFIND_ALLPROP = b'<?xml version="1.0" encoding="utf-8"?><D:propfind xmlns:D="DAV:"><D:allprop/></D:propfind>'
+PROPFIND_CALENDAR = (b'<?xml version="1.0" encoding="utf-8"?>'
+                     b'<D:propfind xmlns:D="DAV:" xmlns:CS="http://calendarserver.org/ns/"><D:prop>'
+                     b'<D:resourcetype/><D:displayname/><CS:getctag/><D:sync-token/><D:getetag/>'
+                     b'</D:prop></D:propfind>')
+
+REPORT_TEMPLATE = ('<?xml version="1.0" encoding="utf-8"?>'
+                   '<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">'
+                   '<D:prop><D:getetag/><C:calendar-data/></D:prop>'
+                   '<C:filter><C:comp-filter name="VCALENDAR"><C:comp-filter name="VEVENT">{time_range}'
+                   '</C:comp-filter></C:comp-filter></C:filter></C:calendar-query>')
+WEEK_RANGE = '<C:time-range start="20250303T000000Z" end="20250310T000000Z"/>'
+
+MULTIGET_SIZE = 20
+
+
+# Requête d'un scénario : (méthode, chemin, en-têtes, corps)
+class Workload:
+    def __init__(self, name, build, max_events=None):
+        self.name = name
+        self.build = build
+        # Au-delà de ce nombre d'événements le scénario est ignoré (corps de réponse trop volumineux)
+        self.max_events = max_events
+
+    def applies_to(self, events):
+        return self.max_events is None or events <= self.max_events
+
+
+def _multiget(events, rng):
+    hrefs = ''.join(f'<D:href>{CALENDAR_URL}{uid_for(rng.randrange(events))}.ics</D:href>'
+                    for _ in range(min(MULTIGET_SIZE, events)))
+    body = ('<?xml version="1.0" encoding="utf-8"?>'
+            '<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">'
+            f'<D:prop><D:getetag/><C:calendar-data/></D:prop>{hrefs}</C:calendar-multiget>')
+    return 'REPORT', CALENDAR_URL, {'Depth': '1', 'Content-Type': 'application/xml'}, body.encode('utf-8')
+
+
+WORKLOADS = [
+    Workload('well_known', lambda events, rng: ('GET', '/.well-known/caldav', {}, b'')),
+    Workload('root_propfind', lambda events, rng: ('PROPFIND', '/', {'Depth': '0'}, PROPFIND_ALLPROP)),
+    Workload('principals_propfind', lambda events, rng: ('PROPFIND', '/principals/', {'Depth': '0'}, PROPFIND_ALLPROP)),
+    Workload('calendar_propfind_depth0',
+             lambda events, rng: ('PROPFIND', CALENDAR_URL, {'Depth': '0'}, PROPFIND_CALENDAR)),
+    Workload('calendar_propfind_depth1',
+             lambda events, rng: ('PROPFIND', CALENDAR_URL, {'Depth': '1'}, PROPFIND_CALENDAR)),
+    Workload('report_week', lambda events, rng: (
+        'REPORT', CALENDAR_URL, {'Depth': '1', 'Content-Type': 'application/xml'},
+        REPORT_TEMPLATE.format(time_range=WEEK_RANGE).encode('utf-8'))),
+    Workload('report_all', lambda events, rng: (
+        'REPORT', CALENDAR_URL, {'Depth': '1', 'Content-Type': 'application/xml'},
+        REPORT_TEMPLATE.format(time_range='').encode('utf-8')), max_events=20000),
+    Workload('report_multiget', _multiget),
+    Workload('get_event', lambda events, rng: ('GET', f'{CALENDAR_URL}{uid_for(rng.randrange(events))}.ics', {}, b'')),
+]
+
+
+def select(names=None):
+    if not names:
+        return list(WORKLOADS)
+    known = {workload.name: workload for workload in WORKLOADS}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f"Scénarios inconnus: {', '.join(unknown)} (disponibles : {', '.join(known)})")
+    return [known[name] for name in names]
+
+
+# Générateur de requêtes reproductible pour un scénario
+def requests_for(workload, events, seed=0):
+    rng = random.Random(seed)
+    while True:
+        yield workload.build(events, rng)
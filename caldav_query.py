@@ -0,0 +1,144 @@
+import math
+import logging
+
+from time_range import parse_utc
+
+logger = logging.getLogger('caldav-server')
+
+DAV_NS = 'DAV:'
+CALDAV_NS = 'urn:ietf:params:xml:ns:caldav'
+CALENDARSERVER_NS = 'http://calendarserver.org/ns/'
+
+GETETAG = f'{{{DAV_NS}}}getetag'
+CALENDAR_DATA = f'{{{CALDAV_NS}}}calendar-data'
+
+# Rapports pris en charge, annoncés dans DAV:supported-report-set
+SUPPORTED_REPORTS = frozenset([
+    f'{{{CALDAV_NS}}}calendar-query',
+    f'{{{CALDAV_NS}}}calendar-multiget',
+    f'{{{CALDAV_NS}}}free-busy-query',
+    f'{{{DAV_NS}}}sync-collection',
+])
+
+# Propriétés renvoyées quand le client n'en demande pas explicitement
+DEFAULT_REPORT_PROPS = frozenset([GETETAG, CALENDAR_DATA])
+
+
+# REPORT dont l'élément racine n'est pas un rapport pris en charge (RFC 3253, section 3.6)
+class UnsupportedReport(Exception):
+    pass
+
+
+# Description d'une requête REPORT analysée
+class ReportRequest:
+    def __init__(self, kind, props=DEFAULT_REPORT_PROPS, time_range=None, match_events=True):
+        self.kind = kind
+        # Jeton fourni par un sync-collection ('' pour une synchronisation initiale)
+        self.sync_token = None
+        # href demandés par un calendar-multiget
+        self.hrefs = []
+        self.props = props
+        # (début, fin) en secondes epoch, ou None si aucun filtre temporel
+        self.time_range = time_range
+        # False si le filtre ne porte que sur des composants autres que VEVENT
+        self.match_events = match_events
+        # Fenêtres (début, fin) des éléments C:expand et C:limit-recurrence-set de calendar-data
+        self.expand = None
+        self.limit_recurrence_set = None
+
+
+def _requested_props(root):
+    prop = root.find(f'{{{DAV_NS}}}prop')
+    if prop is None:
+        return DEFAULT_REPORT_PROPS
+    return frozenset(child.tag for child in prop)
+
+
+def _parse_time_range(element):
+    start = element.get('start')
+    end = element.get('end')
+    return (parse_utc(start) if start else -math.inf, parse_utc(end) if end else math.inf)
+
+
+# Options de C:calendar-data (RFC 4791, section 9.6) : développement ou limitation des séries
+def _parse_calendar_data(root, request):
+    calendar_data = root.find(f'{{{DAV_NS}}}prop/{{{CALDAV_NS}}}calendar-data')
+    if calendar_data is None:
+        return
+    expand = calendar_data.find(f'{{{CALDAV_NS}}}expand')
+    if expand is not None:
+        request.expand = _parse_time_range(expand)
+    limit = calendar_data.find(f'{{{CALDAV_NS}}}limit-recurrence-set')
+    if limit is not None:
+        request.limit_recurrence_set = _parse_time_range(limit)
+
+
+# Analyse le filtre d'un calendar-query (RFC 4791, section 9.7) ; seuls VEVENT et time-range sont gérés
+def _parse_calendar_query(root, request):
+    calendar_filter = root.find(f'{{{CALDAV_NS}}}filter/{{{CALDAV_NS}}}comp-filter[@name="VCALENDAR"]')
+    if calendar_filter is None:
+        return request
+
+    component_filters = calendar_filter.findall(f'{{{CALDAV_NS}}}comp-filter')
+    if not component_filters:
+        return request
+
+    event_filter = next((f for f in component_filters if f.get('name', '').upper() == 'VEVENT'), None)
+    if event_filter is None:
+        request.match_events = False
+        return request
+
+    time_range = event_filter.find(f'{{{CALDAV_NS}}}time-range')
+    if time_range is not None:
+        request.time_range = _parse_time_range(time_range)
+    return request
+
+
+# Propriétés demandées par un PROPFIND : ensemble de noms {espace}nom, ou None pour toutes
+# (corps absent, allprop, propname ou XML illisible)
+def parse_propfind(body):
+    import xml.etree.ElementTree as ET
+    if not body:
+        return None
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError as e:
+        logger.warning("Erreur lors de l'analyse XML du PROPFIND: %s", e)
+        return None
+    prop = root.find(f'{{{DAV_NS}}}prop')
+    if prop is None:
+        return None
+    return frozenset(child.tag for child in prop)
+
+
+# Analyse le corps d'un REPORT ; un corps absent ou illisible équivaut à un calendar-query sans filtre
+def parse_report(body):
+    import xml.etree.ElementTree as ET
+    if not body:
+        return ReportRequest('calendar-query')
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError as e:
+        logger.warning("Erreur lors de l'analyse XML du REPORT: %s", e)
+        return ReportRequest('calendar-query')
+
+    if root.tag not in SUPPORTED_REPORTS:
+        raise UnsupportedReport(root.tag)
+    kind = root.tag.rpartition('}')[2]
+    request = ReportRequest(kind, props=_requested_props(root))
+    # Une fenêtre C:expand ou C:limit-recurrence-set mal formée lève ValueError
+    _parse_calendar_data(root, request)
+    if kind == 'calendar-query':
+        # Un time-range mal formé lève ValueError
+        return _parse_calendar_query(root, request)
+    if kind == 'calendar-multiget':
+        request.hrefs = [href.text or '' for href in root.findall(f'{{{DAV_NS}}}href')]
+    if kind == 'free-busy-query':
+        # RFC 4791, section 7.10 : un time-range avec début et fin est obligatoire
+        time_range = root.find(f'{{{CALDAV_NS}}}time-range')
+        if time_range is None or not time_range.get('start') or not time_range.get('end'):
+            raise ValueError("free-busy-query sans time-range complet")
+        request.time_range = _parse_time_range(time_range)
+    if kind == 'sync-collection':
+        request.sync_token = (root.findtext(f'{{{DAV_NS}}}sync-token') or '').strip()
+    return request
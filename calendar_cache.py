@@ -0,0 +1,402 @@
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import uuid
+import tempfile
+import threading
+import logging
+
+from time_range import IntervalIndex, event_bounds
+from metrics import stage
+from ics_stream import iter_components, component_bytes, split_property, unescape_text, raw_bounds
+
+logger = logging.getLogger('caldav-server')
+
+
+# Signature d'un fichier : toute modification change au moins l'un de ces champs
+def file_signature(stat_result):
+    return (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+
+
+# ETag déterministe : SHA-256 tronqué, identique d'un processus à l'autre
+def content_etag(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+# En-tête et pied des ressources à un seul événement servies par GET
+RESOURCE_HEADER = b'BEGIN:VCALENDAR\r\nPRODID:-//My Calendar//example.com//\r\nVERSION:2.0\r\n'
+RESOURCE_FOOTER = b'END:VCALENDAR\r\n'
+
+
+# Un événement réduit à ce qu'exigent listes, contrôles d'ETag et requêtes par plage : UID (internée),
+# ETag, bornes et position de ses octets dans un tampon partagé (le fichier lu, ou ses propres octets).
+# La ressource VCALENDAR et les composants icalendar (VEVENT maître et exceptions portant un
+# RECURRENCE-ID) ne sont construits qu'à la demande.
+class EventEntry:
+    __slots__ = ('uid', 'etag', 'start', 'end', '_source', '_offset', '_end', '_timezones', '_parsed')
+
+    def __init__(self, uid, component, ical, timezones=b'', overrides=(), bounds=None):
+        self.uid = sys.intern(uid)
+        self._source = ical
+        self._offset = 0
+        self._end = len(ical)
+        # Les VTIMEZONE ne sont joints à la ressource que si l'événement a un TZID
+        self._timezones = timezones if timezones and b'TZID=' in ical else b''
+        self._parsed = (component, tuple(overrides)) if component is not None else None
+        self.etag = content_etag(self.resource)
+        self.start, self.end = bounds if bounds is not None else self._component_bounds()
+
+    # Entrée dont les octets sont la plage [offset, end) de source, sans copie ;
+    # l'ETag est calculé par l'appelant sur ces mêmes octets
+    @classmethod
+    def from_span(cls, uid, source, offset, end, timezones, etag, bounds, parsed=None):
+        entry = cls.__new__(cls)
+        entry.uid = sys.intern(uid)
+        entry.etag = etag
+        entry._source = source
+        entry._offset = offset
+        entry._end = end
+        entry._timezones = timezones
+        entry._parsed = parsed
+        entry.start, entry.end = bounds if bounds is not None else entry._component_bounds()
+        return entry
+
+    # Octets des VEVENT de l'UID, tels qu'écrits dans le fichier
+    @property
+    def ical(self):
+        return self._source[self._offset:self._end]
+
+    # VCALENDAR complet prêt à envoyer
+    @property
+    def resource(self):
+        return b''.join((RESOURCE_HEADER, self._timezones, self.ical, RESOURCE_FOOTER))
+
+    def _component_bounds(self):
+        try:
+            start, end = event_bounds(self.component)
+            # Une exception peut déplacer une occurrence hors des bornes de la série
+            for override in self.overrides:
+                override_start, override_end = event_bounds(override)
+                start, end = min(start, override_start), max(end, override_end)
+            return start, end
+        except (KeyError, TypeError, ValueError):
+            # Dates illisibles : l'événement est renvoyé pour toute plage demandée
+            return -math.inf, math.inf
+
+    def _parse(self):
+        # icalendar n'est importé qu'à la première analyse complète
+        import icalendar
+        with stage('parse'):
+            components = icalendar.Calendar.from_ical(self.resource).walk('VEVENT')
+        master = next((c for c in components if 'recurrence-id' not in c), components[0])
+        self._parsed = parsed = (master, tuple(c for c in components if c is not master))
+        return parsed
+
+    @property
+    def component(self):
+        return (self._parsed or self._parse())[0]
+
+    @property
+    def overrides(self):
+        return (self._parsed or self._parse())[1]
+
+
+# Construit l'entrée d'un UID : le maître est le VEVENT sans RECURRENCE-ID, à défaut le premier
+def entry_from_components(uid, components, ical, timezones=b''):
+    master = next((c for c in components if 'recurrence-id' not in c), components[0])
+    overrides = [c for c in components if c is not master]
+    return EventEntry(uid, master, ical, timezones, overrides)
+
+
+# Bornes d'un VEVENT à partir de ses propriétés indexées, ou None s'il exige l'analyse complète
+def _raw_bounds(fields):
+    try:
+        return raw_bounds(fields)
+    except (KeyError, TypeError, ValueError):
+        return (-math.inf, math.inf)
+
+
+# Bornes d'un UID : union de celles de ses VEVENT (série et exceptions), None si l'un d'eux est inconnu
+def _span_bounds(spans):
+    if len(spans) == 1:
+        return spans[0][2]
+    bounds = [bound for _, _, bound in spans]
+    if any(bound is None for bound in bounds):
+        return None
+    return min(start for start, _ in bounds), max(end for _, end in bounds)
+
+
+# Vrai si les VEVENT d'un UID, donnés par leurs plages (début, fin, bornes), se suivent dans le fichier
+# avec des fins de ligne CRLF : leurs octets bruts sont alors exactement ceux de la ressource
+def _verbatim(data, spans):
+    for previous, span in zip(spans, spans[1:]):
+        if previous[1] != span[0]:
+            return False
+    start, end = spans[0][0], spans[-1][1]
+    return data.endswith(b'\r\n', start, end) and data.count(b'\n', start, end) == data.count(b'\r\n', start, end)
+
+
+# En-tête par défaut d'un calendrier vide (propriétés du VCALENDAR, sans END:VCALENDAR)
+EMPTY_SHELL = b'BEGIN:VCALENDAR\r\nPRODID:-//My Calendar//example.com//\r\nVERSION:2.0\r\n'
+CALENDAR_FOOTER = b'END:VCALENDAR\r\n'
+
+
+# Vue figée d'un calendrier pour une version donnée du fichier.
+# shell contient le fichier privé de ses VEVENT et de la ligne END:VCALENDAR finale : propriétés
+# du calendrier, VTIMEZONE et autres composants, recopiés tels quels lors des réécritures.
+class CalendarSnapshot:
+    __slots__ = ('signature', 'shell', 'events', 'by_uid', 'timezones', 'ctag', '_interval_index')
+
+    def __init__(self, signature, shell, events, timezones=b''):
+        self.signature = signature
+        self.shell = shell
+        self.events = events
+        self.timezones = timezones
+        self._interval_index = None
+        # Index UID -> événement ; en cas de doublon, le premier l'emporte
+        self.by_uid = {}
+        for entry in events:
+            self.by_uid.setdefault(entry.uid, entry)
+        # CTag de la collection : change dès qu'un événement est ajouté, modifié ou supprimé
+        digest = hashlib.sha256()
+        for entry in events:
+            digest.update(entry.uid.encode('utf-8'))
+            digest.update(entry.etag.encode('ascii'))
+        self.ctag = digest.hexdigest()[:32]
+
+    # Lecture en flux, ou analyse complète par icalendar (l'analyseur historique, plus tolérant)
+    # si le fichier sort de ce que reconnaît la lecture en flux
+    @classmethod
+    def from_bytes(cls, signature, data, previous=None):
+        try:
+            return cls._scan(signature, data, previous)
+        except ValueError as e:
+            logger.warning("Lecture en flux impossible (%s), analyse complète par icalendar", e)
+        return cls.from_calendar(signature, bytes(data))
+
+    # Analyse complète par icalendar ; lève ValueError si le fichier est illisible
+    @classmethod
+    def from_calendar(cls, signature, data):
+        import icalendar
+        calendar = icalendar.Calendar.from_ical(data)
+        timezones = b''.join(tz.to_ical() for tz in calendar.walk('VTIMEZONE'))
+        groups = {}
+        for component in calendar.walk('VEVENT'):
+            uid = component.get('uid')
+            # Un UID manquant reçoit un identifiant stable pour toute la durée de cette version
+            groups.setdefault(str(uid) if uid is not None else str(uuid.uuid4()), []).append(component)
+        events = [entry_from_components(uid, components, b''.join(c.to_ical() for c in components), timezones)
+                  for uid, components in groups.items()]
+        # En-tête : le calendrier sans ses VEVENT ni la ligne END:VCALENDAR finale
+        calendar.subcomponents = [c for c in calendar.subcomponents if c.name != 'VEVENT']
+        shell = calendar.to_ical()
+        return cls(signature, shell[:shell.upper().rfind(b'END:VCALENDAR')], events, timezones)
+
+    # Lecture en flux : seules les lignes BEGIN/END et les propriétés indexées sont examinées.
+    # Les entrées pointent dans data (bytes) sans en copier les VEVENT.
+    @classmethod
+    def _scan(cls, signature, data, previous=None):
+        groups = {}
+        timezones = []
+        shell = []
+        position = 0
+        for component in iter_components(data):
+            if component.name != 'VEVENT':
+                if component.name == 'VTIMEZONE':
+                    timezones.append(component_bytes(data, component.start, component.end))
+                continue
+            shell.append(data[position:component.start])
+            position = component.end
+            uid = component.fields.get('UID')
+            # Un UID manquant reçoit un identifiant stable pour toute la durée de cette version
+            uid = unescape_text(split_property(uid)[1]) if uid is not None else str(uuid.uuid4())
+            # Seules la plage et les bornes sont gardées : les propriétés relevées sont libérées aussitôt
+            groups.setdefault(uid, []).append((component.start, component.end, _raw_bounds(component.fields)))
+        tail = data[position:]
+        footer = tail.upper().rfind(b'END:VCALENDAR')
+        shell.append(tail[:footer] if footer >= 0 else tail)
+        timezones = b''.join(timezones)
+
+        # Les composants déjà analysés d'une entrée inchangée depuis la version précédente sont conservés
+        reusable = {}
+        if previous is not None and previous.timezones == timezones:
+            reusable = previous.by_uid
+
+        # Empreintes partielles de l'en-tête des ressources, complétées par les octets de chaque événement
+        plain = hashlib.sha256(RESOURCE_HEADER)
+        zoned = plain.copy()
+        zoned.update(timezones)
+        buffer = memoryview(data)
+
+        # Les VEVENT partageant un UID (série et exceptions) forment une seule ressource
+        events = []
+        for uid, spans in groups.items():
+            if _verbatim(data, spans):
+                source, offset, end = data, spans[0][0], spans[-1][1]
+                span = buffer[offset:end]
+            else:
+                # Fins de ligne à normaliser ou VEVENT dispersés : l'entrée garde sa propre copie
+                source = span = b''.join(component_bytes(data, start, end) for start, end, _ in spans)
+                offset, end = 0, len(source)
+            zone = timezones if timezones and source.find(b'TZID=', offset, end) >= 0 else b''
+            digest = (zoned if zone else plain).copy()
+            digest.update(span)
+            digest.update(RESOURCE_FOOTER)
+            etag = digest.hexdigest()[:32]
+            known = reusable.get(uid)
+            if known is not None and known.etag == etag:
+                entry = EventEntry.from_span(uid, source, offset, end, zone, etag, (known.start, known.end),
+                                             known._parsed)
+            else:
+                entry = EventEntry.from_span(uid, source, offset, end, zone, etag, _span_bounds(spans))
+            events.append(entry)
+        return cls(signature, b''.join(shell), events, timezones)
+
+    # Contenu de l'index préconstruit : entrées de l'instantané construit sur data, désignées par leur plage
+    # dans le fichier (ou leurs propres octets), avec en-tête et VTIMEZONE en texte latin-1
+    def to_index(self, data):
+        events = []
+        for entry in self.events:
+            location = [entry._offset, entry._end] if entry._source is data else [entry.ical.decode('latin-1')]
+            events.append([entry.uid, entry.etag, entry.start, entry.end, bool(entry._timezones)] + location)
+        return {'format': INDEX_FORMAT, 'sha256': hashlib.sha256(data).hexdigest(),
+                'shell': self.shell.decode('latin-1'), 'timezones': self.timezones.decode('latin-1'),
+                'events': events}
+
+    # Reconstruit l'instantané décrit par un index sans relire le fichier ; data doit être le fichier indexé
+    @classmethod
+    def from_index(cls, signature, data, index):
+        timezones = index['timezones'].encode('latin-1')
+        events = []
+        for uid, etag, start, end, zoned, *location in index['events']:
+            if len(location) == 2:
+                source, offset, stop = data, location[0], location[1]
+            else:
+                source = location[0].encode('latin-1')
+                offset, stop = 0, len(source)
+            events.append(EventEntry.from_span(uid, source, offset, stop, timezones if zoned else b'', etag,
+                                               (start, end)))
+        return cls(signature, index['shell'].encode('latin-1'), events, timezones)
+
+    @classmethod
+    def empty(cls):
+        return cls(None, EMPTY_SHELL, [])
+
+    def get(self, uid):
+        return self.by_uid.get(uid)
+
+    # Couples (UID, ETag), sans toucher aux octets des événements
+    def etags(self):
+        return ((entry.uid, entry.etag) for entry in self.events)
+
+    # Événements qui chevauchent [start, end) ; l'index d'intervalles est construit au premier appel
+    def query(self, start=-math.inf, end=math.inf):
+        index = self._interval_index
+        if index is None:
+            index = self._interval_index = IntervalIndex(self.events)
+        return index.overlapping(start, end)
+
+
+# Version du format de l'index préconstruit ; un index d'une autre version est ignoré
+INDEX_FORMAT = 1
+
+
+# Écrit l'index préconstruit d'un instantané (remplacement atomique)
+def write_index(path, snapshot, data):
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.index-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(snapshot.to_index(data), f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+# Instantané lu depuis l'index préconstruit, ou None s'il est absent, illisible ou ne décrit pas ces octets
+def read_index(path, signature, data):
+    started = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            index = json.loads(f.read())
+    except FileNotFoundError:
+        logger.info("Index %s absent, analyse complète du calendrier", path)
+        return None
+    except ValueError as e:
+        logger.warning("Index %s illisible: %s", path, e)
+        return None
+    if index.get('format') != INDEX_FORMAT or index.get('sha256') != hashlib.sha256(data).hexdigest():
+        logger.info("Index %s périmé, analyse complète du calendrier", path)
+        return None
+    snapshot = CalendarSnapshot.from_index(signature, data, index)
+    logger.info("Index %s chargé: %d événements en %.0f ms", path, len(snapshot.events),
+                (time.perf_counter() - started) * 1000)
+    return snapshot
+
+
+# Cache d'un fichier .ics : l'analyse n'est refaite que si la signature du fichier change
+class CalendarCache:
+    def __init__(self, path, index_path=None):
+        self.path = path
+        # Index préconstruit consulté au premier chargement, à la place de l'analyse s'il correspond au fichier
+        self.index_path = index_path
+        self.hits = 0
+        self.misses = 0
+        # Requêtes arrivées pendant une analyse et servies par son résultat
+        self.coalesced = 0
+        # Taille du fichier analysé en cache, pour estimer la mémoire occupée
+        self.data_size = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.signature == file_signature(os.stat(self.path)):
+            self.hits += 1
+            return snapshot
+
+        # Une seule analyse par version du fichier : les requêtes concurrentes attendent ce verrou
+        # puis réutilisent l'instantané produit
+        with self._lock:
+            # La signature est relue sur le descripteur ouvert pour correspondre aux octets lus
+            with open(self.path, 'rb') as f:
+                signature = file_signature(os.fstat(f.fileno()))
+                snapshot = self._snapshot
+                if snapshot is not None and snapshot.signature == signature:
+                    self.hits += 1
+                    self.coalesced += 1
+                    return snapshot
+                # Lu d'un bloc : ce tampon reste en mémoire, les entrées de l'instantané pointent dedans
+                data = f.read()
+
+            self.misses += 1
+            snapshot = None
+            if self._snapshot is None and self.index_path:
+                snapshot = read_index(self.index_path, signature, data)
+            if snapshot is None:
+                with stage('parse'):
+                    snapshot = CalendarSnapshot.from_bytes(signature, data, previous=self._snapshot)
+            self._snapshot = snapshot
+            self.data_size = len(data)
+            logger.info("Analyse de %s: %d événements mis en cache", self.path, len(snapshot.events))
+            # Détail des événements pour le débogage, une seule fois par version et seulement en DEBUG
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, entry in enumerate(snapshot.events):
+                    logger.debug("Événement %d: UID: %s, Début: %s", i + 1, entry.uid, entry.start)
+            return snapshot
+
+    # Nombre d'événements de l'instantané en cache
+    @property
+    def event_count(self):
+        snapshot = self._snapshot
+        return len(snapshot.events) if snapshot is not None else 0
+
+    # Installe un instantané construit par une écriture de ce processus
+    def seed(self, snapshot, data_size=0):
+        with self._lock:
+            self._snapshot = snapshot
+            self.data_size = data_size
+
+    def invalidate(self):
+        self._snapshot = None
+        self.data_size = 0
@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+import logging
+from collections import OrderedDict
+
+from calendar_storage import open_storage, default_storage_path
+from free_busy import BusyIndex
+
+logger = logging.getLogger('caldav-server')
+
+# Budget mémoire global des collections chargées, et nombre maximal de collections résidentes
+MEMORY_BUDGET = int(os.environ.get('CALDAV_MEMORY_BUDGET_MB', '256')) * 1024 * 1024
+MAX_RESIDENT = int(os.environ.get('CALDAV_MAX_COLLECTIONS', '256'))
+
+# Noms d'utilisateur et de calendrier acceptés dans les URL et sur le disque
+_NAME = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.@-]{0,63}')
+
+# Suffixe des stockages de calendrier dans le répertoire d'un utilisateur
+_SUFFIXES = {'ics': '.ics', 'directory': '.d', 'sqlite': '.sqlite'}
+
+
+def valid_name(name):
+    return (bool(_NAME.fullmatch(name)) and '..' not in name
+            and not name.endswith(tuple(_SUFFIXES.values()) + ('.journal',)))
+
+
+# Une collection de calendrier : stockage, journal des modifications et index de disponibilité qui lui sont propres
+class CalendarCollection:
+    def __init__(self, user, name, url, storage, display_name=None):
+        self.user = user
+        self.name = name
+        self.url = url
+        self.storage = storage
+        self.journal = storage.journal
+        self.busy_index = BusyIndex()
+        self.display_name = display_name or name
+
+    @property
+    def principal_url(self):
+        return f'/principals/users/{self.user}/'
+
+    # Vue de la collection ; une nouvelle version produit une révision dans le journal
+    def view(self):
+        view = self.storage.view()
+        self.journal.observe(view)
+        return view
+
+    # Sync-token correspondant exactement à la vue servie
+    def sync_token(self, view):
+        return self.journal.token(self.journal.observe(view))
+
+    def href(self, uid):
+        return f'{self.url}{uid}.ics'
+
+    def memory_estimate(self):
+        return self.storage.memory_estimate()
+
+
+# Collections des utilisateurs (calendars/users/<utilisateur>/<calendrier>.ics) chargées à la demande.
+# Les collections les moins récemment utilisées sont libérées au-delà du budget mémoire ;
+# leur journal reste sur disque, les sync-token restent donc valides après rechargement.
+class CollectionRegistry:
+    def __init__(self, root, backend, memory_budget=MEMORY_BUDGET, max_resident=MAX_RESIDENT):
+        self.root = root
+        self.backend = backend
+        self.memory_budget = memory_budget
+        self.max_resident = max_resident
+        self.loads = 0
+        self.evictions = 0
+        self._resident = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _storage_path(self, user, name):
+        return default_storage_path(self.backend, os.path.join(self.root, user, name + '.ics'))
+
+    def users(self):
+        try:
+            return sorted(name for name in os.listdir(self.root)
+                          if valid_name(name) and os.path.isdir(os.path.join(self.root, name)))
+        except FileNotFoundError:
+            return []
+
+    def user_exists(self, user):
+        return valid_name(user) and os.path.isdir(os.path.join(self.root, user))
+
+    # Noms des calendriers d'un utilisateur, d'après les stockages présents sur disque
+    def calendars(self, user):
+        if not self.user_exists(user):
+            return []
+        suffix = _SUFFIXES[self.backend]
+        return sorted(entry[:-len(suffix)] for entry in os.listdir(os.path.join(self.root, user))
+                      if entry.endswith(suffix) and valid_name(entry[:-len(suffix)]))
+
+    def exists(self, user, name):
+        return valid_name(user) and valid_name(name) and os.path.exists(self._storage_path(user, name))
+
+    # Collection demandée, ou None si elle n'existe pas (create=True la crée, pour MKCALENDAR)
+    def get(self, user, name, create=False):
+        key = (user, name)
+        with self._lock:
+            collection = self._resident.get(key)
+            if collection is not None:
+                self._resident.move_to_end(key)
+        if collection is not None:
+            self.enforce_budget(keep=key)
+            return collection
+
+        if not (create or self.exists(user, name)):
+            return None
+        if not (valid_name(user) and valid_name(name)):
+            raise ValueError(f"Nom de collection invalide: {user}/{name}")
+
+        with self._lock:
+            collection = self._resident.get(key)
+            if collection is None:
+                path = self._storage_path(user, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                storage = open_storage(self.backend, path)
+                collection = CalendarCollection(user, name, f'/calendars/{user}/{name}/', storage)
+                self._resident[key] = collection
+                self.loads += 1
+                logger.info("Collection %s/%s chargée (%s: %s)", user, name, self.backend, path)
+            self._resident.move_to_end(key)
+        self.enforce_budget(keep=key)
+        return collection
+
+    # Libère les collections froides tant que le budget est dépassé ; la collection en cours est conservée
+    def enforce_budget(self, keep=None):
+        with self._lock:
+            total = sum(collection.memory_estimate() for collection in self._resident.values())
+            for key in list(self._resident):
+                if total <= self.memory_budget and len(self._resident) <= self.max_resident:
+                    break
+                if key == keep:
+                    continue
+                collection = self._resident.pop(key)
+                total -= collection.memory_estimate()
+                self.evictions += 1
+                logger.info("Collection %s/%s libérée (budget mémoire)", key[0], key[1])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'resident': len(self._resident),
+                'memory_estimate': sum(collection.memory_estimate() for collection in self._resident.values()),
+                'memory_budget': self.memory_budget,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,607 @@
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import sqlite3
+import tempfile
+import argparse
+import threading
+import logging
+from urllib.parse import quote
+
+from calendar_cache import (CalendarCache, CalendarSnapshot, EventEntry, entry_from_components, file_signature,
+                            CALENDAR_FOOTER, RESOURCE_HEADER, RESOURCE_FOOTER)
+from ics_stream import iter_components, component_bytes, split_property
+from change_journal import ChangeJournal, ADDED, MODIFIED, DELETED
+from time_range import IntervalIndex, LONG_SPAN, overlaps
+from metrics import stage
+
+logger = logging.getLogger('caldav-server')
+
+BACKENDS = ('ics', 'directory', 'sqlite')
+
+# Facteurs d'estimation de la mémoire occupée par un stockage chargé (octets par événement)
+EVENT_RECORD_SIZE = 768
+INDEX_RECORD_SIZE = 256
+
+
+# Événement lu depuis un stockage par événement ; le composant n'est analysé qu'à la demande
+class StoredEvent:
+    __slots__ = ('uid', 'etag', 'resource', 'start', 'end', 'last_modified', '_component', '_overrides')
+
+    def __init__(self, uid, etag, resource, start, end, last_modified):
+        self.uid = uid
+        self.etag = etag
+        self.resource = resource
+        self.start = start
+        self.end = end
+        self.last_modified = last_modified
+        self._component = None
+        self._overrides = ()
+
+    def _parse(self):
+        import icalendar
+        with stage('parse'):
+            calendar = icalendar.Calendar.from_ical(self.resource)
+        components = calendar.walk('VEVENT')
+        master = next((c for c in components if 'recurrence-id' not in c), components[0])
+        self._overrides = tuple(c for c in components if c is not master)
+        self._component = master
+
+    @property
+    def component(self):
+        if self._component is None:
+            self._parse()
+        return self._component
+
+    # Exceptions (VEVENT avec RECURRENCE-ID) de la série
+    @property
+    def overrides(self):
+        if self._component is None:
+            self._parse()
+        return self._overrides
+
+    @classmethod
+    def from_entry(cls, entry, last_modified=None):
+        return cls(entry.uid, entry.etag, entry.resource, entry.start, entry.end,
+                   time.time() if last_modified is None else last_modified)
+
+
+# Précondition If-Match / If-None-Match non satisfaite (HTTP 412)
+class PreconditionFailed(Exception):
+    pass
+
+
+# Calendrier illisible lors d'une écriture (HTTP 409) : il n'est pas réécrit, pour ne pas perdre son contenu
+class CalendarUnreadable(Exception):
+    pass
+
+
+# Événement absent lors d'une suppression (HTTP 404)
+class EventNotFound(Exception):
+    pass
+
+
+# Vérifie If-Match / If-None-Match (listes d'ETag sans guillemets, ou ['*']) contre l'ETag courant
+def check_preconditions(current_etag, if_match=None, if_none_match=None):
+    if if_match is not None:
+        if current_etag is None or ('*' not in if_match and current_etag not in if_match):
+            raise PreconditionFailed(f"If-Match: ETag courant {current_etag}")
+    if if_none_match is not None:
+        if current_etag is not None and ('*' in if_none_match or current_etag in if_none_match):
+            raise PreconditionFailed(f"If-None-Match: ETag courant {current_etag}")
+
+
+# Nouveau CTag après une écriture : dérivé du précédent pour rester unique
+def next_ctag(ctag, uid, etag):
+    return hashlib.sha256(f'{ctag}:{uid}:{etag}'.encode('utf-8')).hexdigest()[:32]
+
+
+# VTIMEZONE contenus dans des octets concaténés : liste de (TZID, octets du composant)
+def timezone_components(timezones):
+    data = RESOURCE_HEADER + timezones + RESOURCE_FOOTER
+    return [(split_property(component.fields.get('TZID', ':'))[1], component_bytes(data, component.start, component.end))
+            for component in iter_components(data) if component.name == 'VTIMEZONE']
+
+
+# Stockage historique : un seul fichier .ics, servi par le cache de calendriers analysés.
+# Les écritures vont dans source_path (le fichier utilisateur) puis sync(force=True) le recopie.
+class IcsFileStorage:
+    name = 'ics'
+
+    def __init__(self, path, source_path=None, sync=None, index_path=None):
+        self.path = path
+        self.source_path = source_path or path
+        self.sync = sync
+        self.cache = CalendarCache(path, index_path=index_path)
+        self.journal = ChangeJournal(f'{path}.journal', track_etags=True)
+
+    # Estimation de la mémoire occupée : le fichier lu, dans lequel pointent les événements, et leurs entrées d'index
+    def memory_estimate(self):
+        return self.cache.data_size + self.cache.event_count * EVENT_RECORD_SIZE
+
+    # force : recopie du fichier utilisateur sans attendre la notification de son changement
+    def _load(self, force=False):
+        # D'abord, vérifier si le fichier utilisateur a été modifié
+        if self.sync is not None:
+            self.sync(force=force)
+
+        if not os.path.exists(self.path):
+            logger.warning("Fichier %s n'existe pas, création d'un calendrier vide", self.path)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'wb') as f:
+                f.write(CalendarSnapshot.empty().shell + CALENDAR_FOOTER)
+        return self.cache.get()
+
+    # Vue en lecture seule : un fichier illisible est servi comme un calendrier vide
+    def view(self):
+        try:
+            return self._load()
+        except Exception as e:
+            logger.error("Erreur lors de la lecture du fichier %s: %s", self.path, e)
+            return CalendarSnapshot.empty()
+
+    # Vue servant de base à une réécriture : toujours celle du fichier utilisateur actuel,
+    # et jamais de calendrier vide de repli, qui effacerait le fichier
+    def _writable_view(self):
+        try:
+            return self._load(force=self.source_path != self.path)
+        except Exception as e:
+            logger.error("Écriture refusée, fichier %s illisible: %s", self.path, e)
+            raise CalendarUnreadable(f"{self.path}: {e}") from e
+
+    # Réécrit le fichier à partir des octets déjà sérialisés : l'en-tête (propriétés du calendrier et
+    # composants autres que VEVENT) et les autres événements sont recopiés tels quels
+    def _commit(self, view, entries, shell=None):
+        data = b''.join([view.shell if shell is None else shell] + [entry.ical for entry in entries]
+                        + [CALENDAR_FOOTER])
+
+        directory = os.path.dirname(self.source_path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.write-', suffix='.ics')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.source_path)
+        if self.sync is not None and self.source_path != self.path:
+            self.sync(force=True)
+
+        # Le nouvel instantané est construit sur les octets écrits, comme le ferait un autre processus
+        # (mêmes ETag) ; les composants déjà analysés de la vue précédente sont réutilisés
+        with stage('parse'):
+            snapshot = CalendarSnapshot.from_bytes(file_signature(os.stat(self.path)), data, previous=view)
+        self.cache.seed(snapshot, len(data))
+        return snapshot
+
+    # En-tête du fichier complété des VTIMEZONE de la ressource qu'il ne définit pas encore
+    @staticmethod
+    def _shell_with_timezones(view, entry):
+        if not entry._timezones:
+            return view.shell
+        known = {tzid for tzid, _ in timezone_components(view.timezones)}
+        missing = [data for tzid, data in timezone_components(entry._timezones) if tzid not in known]
+        return view.shell + b''.join(missing)
+
+    # Renvoie (création, ETag de l'événement tel que relu depuis le fichier)
+    def put(self, entry, if_match=None, if_none_match=None):
+        with self.journal.locked():
+            view = self._writable_view()
+            # Les changements externes encore non journalisés reçoivent d'abord leur propre révision
+            self.journal.observe(view)
+            current = view.get(entry.uid)
+            check_preconditions(current.etag if current else None, if_match, if_none_match)
+            if current is None:
+                entries = list(view.events) + [entry]
+            else:
+                entries = [entry if e.uid == entry.uid else e for e in view.events]
+            snapshot = self._commit(view, entries, self._shell_with_timezones(view, entry))
+            etag = snapshot.get(entry.uid).etag
+            self.journal.record(snapshot.ctag, [(entry.uid, MODIFIED if current else ADDED, etag)])
+            return current is None, etag
+
+    def delete(self, uid, if_match=None):
+        with self.journal.locked():
+            view = self._writable_view()
+            self.journal.observe(view)
+            current = view.get(uid)
+            if current is None:
+                raise EventNotFound(uid)
+            check_preconditions(current.etag, if_match)
+            snapshot = self._commit(view, [e for e in view.events if e.uid != uid])
+            self.journal.record(snapshot.ctag, [(uid, DELETED, None)])
+
+
+# Vue d'un répertoire à un fichier par UID, construite à partir de son index
+class DirectoryView:
+    def __init__(self, storage, signature, ctag, records):
+        self.storage = storage
+        self.signature = signature
+        self.ctag = ctag
+        self.records = records
+        self._interval_index = None
+
+    def etags(self):
+        return ((uid, record['etag']) for uid, record in self.records.items())
+
+    def _load(self, uid, record):
+        try:
+            with open(os.path.join(self.storage.path, record['file']), 'rb') as f:
+                resource = f.read()
+        except FileNotFoundError:
+            return None
+        start = -math.inf if record['start'] is None else record['start']
+        end = math.inf if record['end'] is None else record['end']
+        return StoredEvent(uid, record['etag'], resource, start, end, record['last_modified'])
+
+    def get(self, uid):
+        record = self.records.get(uid)
+        return self._load(uid, record) if record is not None else None
+
+    @property
+    def events(self):
+        for uid, record in self.records.items():
+            entry = self._load(uid, record)
+            if entry is not None:
+                yield entry
+
+    def query(self, start=-math.inf, end=math.inf):
+        index = self._interval_index
+        if index is None:
+            # L'index d'intervalles ne contient que les métadonnées ; les fichiers sont lus à la fin
+            index = self._interval_index = IntervalIndex([
+                StoredEvent(uid, record['etag'], None,
+                            -math.inf if record['start'] is None else record['start'],
+                            math.inf if record['end'] is None else record['end'],
+                            record['last_modified'])
+                for uid, record in self.records.items()])
+        return [entry for entry in (self.get(stub.uid) for stub in index.overlapping(start, end))
+                if entry is not None]
+
+
+# Stockage par répertoire : <uid>.ics par événement et index.json (ETag, DTSTART/DTEND, date de modification)
+class DirectoryStorage:
+    name = 'directory'
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(path, 'index.json')
+        os.makedirs(path, exist_ok=True)
+        self.journal = ChangeJournal(f'{path}.journal', track_etags=False)
+        self._view = None
+        self._lock = threading.Lock()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                signature = file_signature(os.fstat(f.fileno()))
+                if self._view is not None and self._view.signature == signature:
+                    return self._view
+                index = json.loads(f.read())
+        except FileNotFoundError:
+            return DirectoryView(self, None, hashlib.sha256(b'').hexdigest()[:32], {})
+        return DirectoryView(self, signature, index['ctag'], index['events'])
+
+    # Seul l'index est gardé en mémoire ; les événements sont relus à la demande
+    def memory_estimate(self):
+        view = self._view
+        return len(view.records) * INDEX_RECORD_SIZE if view is not None else 0
+
+    def view(self):
+        view = self._view
+        if view is not None and view.signature is not None:
+            try:
+                if file_signature(os.stat(self.index_path)) == view.signature:
+                    return view
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._view = self._read_index()
+            return self._view
+
+    @staticmethod
+    def _file_name(uid):
+        return quote(uid, safe='@.-_') + '.ics'
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write_index(self, ctag, records):
+        self._write_atomic(self.index_path, json.dumps({'ctag': ctag, 'events': records}).encode('utf-8'))
+
+    @staticmethod
+    def _record(entry, file_name):
+        return {'file': file_name, 'etag': entry.etag,
+                'start': None if math.isinf(entry.start) else entry.start,
+                'end': None if math.isinf(entry.end) else entry.end,
+                'last_modified': entry.last_modified}
+
+    # Remplace tout le contenu (import depuis un fichier .ics monolithique), sous le verrou du journal comme
+    # put et delete ; l'import est journalisé aussitôt (les jetons antérieurs sont invalidés)
+    def replace_all(self, entries):
+        with self.journal.locked(), self._lock:
+            records = {}
+            for entry in entries:
+                file_name = self._file_name(entry.uid)
+                self._write_atomic(os.path.join(self.path, file_name), entry.resource)
+                records[entry.uid] = self._record(entry, file_name)
+            kept = {record['file'] for record in records.values()}
+            for name in os.listdir(self.path):
+                if name.endswith('.ics') and name not in kept:
+                    os.unlink(os.path.join(self.path, name))
+            ctag = next_ctag('', 'import', hashlib.sha256(json.dumps(records, sort_keys=True).encode()).hexdigest())
+            self._write_index(ctag, records)
+            self._view = None
+            self.journal.observe(self._read_index())
+
+    # Ajoute ou remplace un événement : seuls son fichier et sa ligne d'index sont réécrits.
+    # Le verrou du journal sérialise les écrivains de tous les processus.
+    def put(self, entry, if_match=None, if_none_match=None):
+        entry = StoredEvent.from_entry(entry)
+        with self.journal.locked(), self._lock:
+            view = self._read_index()
+            # Un import non journalisé depuis la dernière révision invalide d'abord les jetons
+            self.journal.observe(view)
+            current = view.records.get(entry.uid)
+            check_preconditions(current['etag'] if current else None, if_match, if_none_match)
+            records = dict(view.records)
+            file_name = self._file_name(entry.uid)
+            self._write_atomic(os.path.join(self.path, file_name), entry.resource)
+            records[entry.uid] = self._record(entry, file_name)
+            ctag = next_ctag(view.ctag, entry.uid, entry.etag)
+            self._write_index(ctag, records)
+            self._view = None
+            self.journal.record(ctag, [(entry.uid, MODIFIED if current else ADDED, entry.etag)])
+            return current is None, entry.etag
+
+    def delete(self, uid, if_match=None):
+        with self.journal.locked(), self._lock:
+            view = self._read_index()
+            self.journal.observe(view)
+            current = view.records.get(uid)
+            if current is None:
+                raise EventNotFound(uid)
+            check_preconditions(current['etag'], if_match)
+            records = dict(view.records)
+            del records[uid]
+            ctag = next_ctag(view.ctag, uid, DELETED)
+            # L'index est réécrit avant la suppression du fichier : un lecteur ne voit jamais d'entrée orpheline
+            self._write_index(ctag, records)
+            try:
+                os.unlink(os.path.join(self.path, current['file']))
+            except FileNotFoundError:
+                pass
+            self._view = None
+            self.journal.record(ctag, [(uid, DELETED, None)])
+
+
+# Vue d'une base SQLite : chaque lecture ne touche que les lignes nécessaires
+class SqliteView:
+    def __init__(self, storage, ctag):
+        self.storage = storage
+        self.ctag = ctag
+
+    def etags(self):
+        return self.storage._execute('SELECT uid, etag FROM events ORDER BY dtstart')
+
+    def get(self, uid):
+        row = self.storage._execute(f'SELECT {SqliteStorage.COLUMNS} FROM events WHERE uid = ?', (uid,)).fetchone()
+        return SqliteStorage._row_to_event(row) if row is not None else None
+
+    @property
+    def events(self):
+        for row in self.storage._execute(f'SELECT {SqliteStorage.COLUMNS} FROM events ORDER BY dtstart'):
+            yield SqliteStorage._row_to_event(row)
+
+    def query(self, start=-math.inf, end=math.inf):
+        # Les événements courts sont trouvés par l'index (dtstart) borné par LONG_SPAN ; les longs à part
+        params = {'start': start if start != -math.inf else -sys.float_info.max,
+                  'end': end if end != math.inf else sys.float_info.max, 'span': LONG_SPAN}
+        rows = self.storage._execute(f'''
+            SELECT {SqliteStorage.COLUMNS} FROM events
+            WHERE long = 0 AND dtstart >= :start - :span AND dtstart < :end
+            UNION ALL
+            SELECT {SqliteStorage.COLUMNS} FROM events WHERE long = 1
+        ''', params)
+        result = []
+        for row in rows:
+            entry = SqliteStorage._row_to_event(row)
+            if overlaps(entry.start, entry.end, start, end):
+                result.append(entry)
+        result.sort(key=lambda entry: entry.start)
+        return result
+
+
+# Stockage SQLite : une ligne par UID avec octets bruts, ETag, bornes et date de modification indexées
+class SqliteStorage:
+    name = 'sqlite'
+    COLUMNS = 'uid, etag, data, dtstart, dtend, last_modified'
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._local = threading.local()
+        self.journal = ChangeJournal(f'{path}.journal', track_etags=False)
+        connection = self._connection()
+        with connection:
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS events (
+                    uid TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    dtstart REAL,
+                    dtend REAL,
+                    long INTEGER NOT NULL DEFAULT 0,
+                    last_modified REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS events_dtstart ON events (long, dtstart);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('ctag', '');
+            ''')
+
+    # Une connexion par thread ; le mode WAL laisse les lectures se poursuivre pendant une écriture
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    @staticmethod
+    def _row_to_event(row):
+        uid, etag, data, start, end, last_modified = row
+        return StoredEvent(uid, etag, data, -math.inf if start is None else start,
+                           math.inf if end is None else end, last_modified)
+
+    @staticmethod
+    def _row_values(entry):
+        span = entry.end - entry.start
+        return (entry.uid, entry.etag, entry.resource,
+                None if math.isinf(entry.start) else entry.start,
+                None if math.isinf(entry.end) else entry.end,
+                1 if math.isinf(span) or span > LONG_SPAN else 0,
+                entry.last_modified)
+
+    # Rien n'est gardé en mémoire : chaque requête interroge la base
+    def memory_estimate(self):
+        return 0
+
+    def view(self):
+        return SqliteView(self, self._execute("SELECT value FROM meta WHERE key = 'ctag'").fetchone()[0])
+
+    # Remplace tout le contenu (import depuis un fichier .ics monolithique), sous le verrou du journal
+    def replace_all(self, entries):
+        def write(connection, ctag):
+            connection.execute('DELETE FROM events')
+            digest = hashlib.sha256()
+            for entry in entries:
+                connection.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   self._row_values(entry))
+                digest.update(f'{entry.uid}:{entry.etag}'.encode('utf-8'))
+            return next_ctag('', 'import', digest.hexdigest())
+
+        with self.journal.locked():
+            self._write(write)
+            self.journal.observe(self.view())
+
+    # Exécute fn(connection, ctag) dans une transaction d'écriture ; fn renvoie le nouveau CTag
+    def _write(self, fn):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            ctag = connection.execute("SELECT value FROM meta WHERE key = 'ctag'").fetchone()[0]
+            ctag = fn(connection, ctag)
+            connection.execute("UPDATE meta SET value = ? WHERE key = 'ctag'", (ctag,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return ctag
+
+    # Ajoute ou remplace un événement dans une seule transaction
+    def put(self, entry, if_match=None, if_none_match=None):
+        entry = StoredEvent.from_entry(entry)
+        existed = []
+
+        def write(connection, ctag):
+            row = connection.execute('SELECT etag FROM events WHERE uid = ?', (entry.uid,)).fetchone()
+            check_preconditions(row[0] if row else None, if_match, if_none_match)
+            existed.append(row is not None)
+            connection.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               self._row_values(entry))
+            return next_ctag(ctag, entry.uid, entry.etag)
+
+        with self.journal.locked():
+            # Un import non journalisé depuis la dernière révision invalide d'abord les jetons
+            self.journal.observe(self.view())
+            ctag = self._write(write)
+            self.journal.record(ctag, [(entry.uid, MODIFIED if existed[0] else ADDED, entry.etag)])
+        return not existed[0], entry.etag
+
+    def delete(self, uid, if_match=None):
+        def write(connection, ctag):
+            row = connection.execute('SELECT etag FROM events WHERE uid = ?', (uid,)).fetchone()
+            if row is None:
+                raise EventNotFound(uid)
+            check_preconditions(row[0], if_match)
+            connection.execute('DELETE FROM events WHERE uid = ?', (uid,))
+            return next_ctag(ctag, uid, DELETED)
+
+        with self.journal.locked():
+            self.journal.observe(self.view())
+            ctag = self._write(write)
+            self.journal.record(ctag, [(uid, DELETED, None)])
+
+
+# Chemin par défaut d'un stockage, à côté du fichier .ics historique
+def default_storage_path(backend, ics_path):
+    base = os.path.splitext(ics_path)[0]
+    if backend == 'directory':
+        return base + '.d'
+    if backend == 'sqlite':
+        return base + '.sqlite'
+    return ics_path
+
+
+def open_storage(backend, path, source_path=None, sync=None, index_path=None):
+    if backend == 'ics':
+        return IcsFileStorage(path, source_path=source_path, sync=sync, index_path=index_path)
+    if backend == 'directory':
+        return DirectoryStorage(path)
+    if backend == 'sqlite':
+        return SqliteStorage(path)
+    raise ValueError(f"Stockage inconnu: {backend} (attendu: {', '.join(BACKENDS)})")
+
+
+# Importe un fichier .ics monolithique dans un stockage par événement
+def import_ics(source_path, storage):
+    with open(source_path, 'rb') as f:
+        snapshot = CalendarSnapshot.from_bytes(None, f.read())
+    mtime = os.path.getmtime(source_path)
+    entries = [StoredEvent.from_entry(entry, mtime) for entry in snapshot.events]
+    storage.replace_all(entries)
+    logger.info("Import de %s vers %s: %d événements", source_path, storage.path, len(entries))
+    return len(entries)
+
+
+# Construit l'entrée à stocker pour un VEVENT (utilisé par les écritures)
+def entry_from_component(component, timezones=b''):
+    return EventEntry(str(component.get('uid')), component, component.to_ical(), timezones)
+
+
+# Construit l'entrée d'une ressource envoyée par PUT : un seul UID, éventuellement avec ses exceptions
+def entry_from_calendar(data):
+    import icalendar
+    calendar = icalendar.Calendar.from_ical(data)
+    components = list(calendar.walk('VEVENT'))
+    if not components:
+        raise ValueError("Aucun VEVENT dans la ressource")
+    uids = {str(component.get('uid', '')) for component in components}
+    if len(uids) != 1 or '' in uids:
+        raise ValueError("La ressource doit contenir un seul UID")
+
+    timezones = b''.join(tz.to_ical() for tz in calendar.walk('VTIMEZONE'))
+    ical = b''.join(component.to_ical() for component in components)
+    return entry_from_components(uids.pop(), components, ical, timezones)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Importe un fichier .ics dans un stockage par événement")
+    parser.add_argument('source', help="fichier .ics monolithique")
+    parser.add_argument('--backend', choices=('directory', 'sqlite'), default='sqlite')
+    parser.add_argument('--target', help="répertoire ou base cible (par défaut à côté du fichier source)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    target = args.target or default_storage_path(args.backend, args.source)
+    count = import_ics(args.source, open_storage(args.backend, target))
+    print(f"{count} événements importés dans {target}")
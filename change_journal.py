@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus
+    fcntl = None
+
+logger = logging.getLogger('caldav-server')
+
+# Préfixe des sync-token (RFC 6578) : <préfixe><identifiant du journal>-<révision>
+SYNC_TOKEN_PREFIX = 'urn:syncroteam:sync:'
+
+# Compactage du journal : au-delà de ce nombre de révisions, seule la moitié la plus récente est conservée,
+# et les révisions plus anciennes que cet âge sont supprimées ; les jetons antérieurs imposent une resynchronisation
+MAX_RECORDS = int(os.environ.get('CALDAV_JOURNAL_MAX_RECORDS', '10000'))
+MAX_AGE = int(os.environ.get('CALDAV_JOURNAL_MAX_AGE_DAYS', '90')) * 86400
+
+ADDED = 'added'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+
+
+# Jeton de synchronisation invalide ou inconnu (précondition DAV:valid-sync-token)
+class InvalidSyncToken(Exception):
+    pass
+
+
+# Journal des modifications, en ajout seul (compacté périodiquement) : une ligne JSON par révision de la collection.
+# Avec track_etags, l'état conserve la table UID -> ETag pour calculer les changements par différence ;
+# sinon les changements sont fournis par les écritures et tout écart inexpliqué invalide les jetons.
+class ChangeJournal:
+    def __init__(self, path, track_etags=True):
+        self.path = path
+        self.track_etags = track_etags
+        self.state_path = path + '.state'
+        self.lock_path = path + '.lock'
+        self.journal_id = None
+        # Incrémenté à chaque compactage : le fichier a été réécrit, il faut le relire depuis le début
+        self.generation = 0
+        self.revision = 0
+        self.min_revision = 0
+        self._observed_ctag = None
+        # Signature du fichier d'état lors de la dernière lecture : révèle les révisions d'autres processus
+        self._state_signature = None
+        self._records = []
+        self._offset = 0
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    # Verrou inter-processus pour les déploiements gunicorn à plusieurs workers (réentrant dans un thread)
+    @contextmanager
+    def locked(self):
+        with self._lock:
+            if fcntl is None or self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_state_signature(self):
+        try:
+            st = os.stat(self.state_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'journal_id': uuid.uuid4().hex, 'revision': 0, 'min_revision': 0, 'generation': 0,
+                    'ctag': None, 'etags': {}}
+
+    def _write_state(self, state):
+        directory = os.path.dirname(self.state_path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.journal-', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    # Charge les révisions ajoutées au fichier depuis la dernière lecture
+    def _read_new_records(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line:
+                record = json.loads(line)
+                self._records.append((record['rev'], record['changes']))
+        self._offset += end
+
+    def _append(self, state, ctag, changes, reset=False):
+        state['revision'] += 1
+        state['ctag'] = ctag
+        if reset:
+            state['min_revision'] = state['revision']
+        record = {'rev': state['revision'], 'time': int(time.time()), 'ctag': ctag, 'changes': changes}
+        if reset:
+            record['reset'] = True
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+        self._compact_if_needed(state)
+        self._write_state(state)
+        logger.info("Journal %s: révision %s, %d changements", self.path, state['revision'], len(changes))
+
+    # Réécrit le journal sans les révisions trop nombreuses ou trop anciennes ; à appeler sous locked().
+    # min_revision avance jusqu'au point de compactage : les jetons plus anciens deviennent invalides.
+    def _compact_if_needed(self, state):
+        with open(self.path, 'rb') as f:
+            first = json.loads(f.readline())
+        now = time.time()
+        too_many = state['revision'] - first['rev'] + 1 > MAX_RECORDS
+        if not too_many and first.get('time', now) >= now - MAX_AGE:
+            return
+
+        with open(self.path, 'rb') as f:
+            lines = [line for line in f if line.strip()]
+        cut = state['min_revision']
+        if too_many:
+            cut = max(cut, state['revision'] - MAX_RECORDS // 2)
+        kept = []
+        for line in lines:
+            record = json.loads(line)
+            if record['rev'] <= cut or record.get('time', now) < now - MAX_AGE:
+                cut = max(cut, record['rev'])
+            else:
+                kept.append(line)
+        # Les révisions conservées doivent rester contiguës
+        kept = [line for line in kept if json.loads(line)['rev'] > cut]
+
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.journal-', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(kept)
+        os.replace(tmp_path, self.path)
+        state['min_revision'] = cut
+        state['generation'] = state.get('generation', 0) + 1
+        logger.info("Journal %s compacté: %d révisions supprimées, jetons valides à partir de la révision %d",
+                    self.path, len(lines) - len(kept), cut)
+
+    def _adopt(self, state, ctag):
+        generation = state.get('generation', 0)
+        if state['journal_id'] != self.journal_id or generation != self.generation:
+            # Journal recréé ou compacté : on relit le fichier depuis le début
+            self.journal_id = state['journal_id']
+            self.generation = generation
+            self._records = []
+            self._offset = 0
+        self._read_new_records()
+        self.revision = state['revision']
+        self.min_revision = state.get('min_revision', 0)
+        self._observed_ctag = ctag
+        self._state_signature = self._read_state_signature()
+        return self.revision
+
+    # Enregistre une nouvelle révision si la vue diffère du dernier état journalisé ;
+    # renvoie la révision correspondant à cette vue
+    def observe(self, snapshot):
+        # Raccourci seulement si aucun processus n'a journalisé depuis : sinon (A -> B -> A) la révision
+        # de ce processus serait périmée et les jetons émis par les autres refusés
+        if snapshot.ctag == self._observed_ctag and self._read_state_signature() == self._state_signature:
+            return self.revision
+
+        with self.locked():
+            state = self._load_state()
+            if state['ctag'] != snapshot.ctag:
+                if not self.track_etags:
+                    # Changement fait hors des écritures journalisées (import...) : les jetons existants expirent
+                    self._append(state, snapshot.ctag, [], reset=True)
+                else:
+                    etags = {}
+                    for uid, etag in snapshot.etags():
+                        etags.setdefault(uid, etag)
+                    previous = state['etags']
+                    changes = [[uid, DELETED] for uid in previous if uid not in etags]
+                    for uid, etag in etags.items():
+                        if uid not in previous:
+                            changes.append([uid, ADDED])
+                        elif previous[uid] != etag:
+                            changes.append([uid, MODIFIED])
+                    state['etags'] = etags
+                    self._append(state, snapshot.ctag, changes)
+            return self._adopt(state, snapshot.ctag)
+
+    # Enregistre les changements d'une écriture ; à appeler sous locked(), après la validation de l'écriture.
+    # changes : liste de (uid, type de changement, nouvel ETag ou None)
+    def record(self, ctag, changes):
+        with self.locked():
+            state = self._load_state()
+            if self.track_etags:
+                for uid, change, etag in changes:
+                    if change == DELETED:
+                        state['etags'].pop(uid, None)
+                    else:
+                        state['etags'][uid] = etag
+            else:
+                state['etags'] = {}
+            self._append(state, ctag, [[uid, change] for uid, change, _ in changes])
+            return self._adopt(state, ctag)
+
+    def token(self, revision=None):
+        return f"{SYNC_TOKEN_PREFIX}{self.journal_id}-{self.revision if revision is None else revision}"
+
+    # UID modifiés depuis le jeton : {uid: True si présent, False si supprimé}
+    def changes_since(self, token):
+        if not token.startswith(SYNC_TOKEN_PREFIX):
+            raise InvalidSyncToken(token)
+        journal_id, _, revision = token[len(SYNC_TOKEN_PREFIX):].rpartition('-')
+        if (revision.isdigit() and (journal_id != self.journal_id or int(revision) > self.revision)
+                and self._read_state_signature() != self._state_signature):
+            # Jeton émis par un autre processus depuis notre dernière lecture du journal
+            with self.locked():
+                state = self._load_state()
+                self._adopt(state, state['ctag'])
+        if (journal_id != self.journal_id or not revision.isdigit()
+                or not self.min_revision <= int(revision) <= self.revision):
+            raise InvalidSyncToken(token)
+
+        since = int(revision)
+        changed = {}
+        records = self._records
+        # Les révisions sont contiguës : on saute directement à la première révision utile
+        first = records[0][0] if records else since + 1
+        for rev, changes in records[max(0, since - first + 1):]:
+            for uid, change in changes:
+                changed[uid] = change != DELETED
+        return changed
@@ -1,36 +1,44 @@
-import smtplib
-from email.message import EmailMessage
+import os
+import sys
+import logging
 
-# Configuration SMTP
-SMTP_SERVER = 'smtp-relay.brevo.com'
-SMTP_PORT = 587
-SMTP_USERNAME = 'namivam721@ebuthor.com'
-SMTP_PASSWORD = 'NZWbLOa3mIPd6vkr'  # ⚠️ Utilise une variable d’environnement pour la sécurité !
-SENDER_EMAIL = 'apple@apple-ascenseur.fr'
-RECIPIENT_EMAIL = 'yassinrabhi91@gmail.com'
+from invitations import SmtpSettings, EncodedInvitation, InvitationDispatcher
+
+# Configuration SMTP lue dans l'environnement par SmtpSettings.from_env (SMTP_SERVER, SMTP_PORT, SMTP_USERNAME,
+# SMTP_PASSWORD, SENDER_EMAIL, SMTP_STARTTLS, SMTP_TIMEOUT) ; valeurs par défaut du relais historique
+SMTP_DEFAULTS = {'SMTP_SERVER': 'smtp-relay.brevo.com', 'SENDER_EMAIL': 'apple@apple-ascenseur.fr'}
+
+# Débit, parallélisme et reprises de l'envoi
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', '4'))
+SMTP_RATE = float(os.environ.get('SMTP_RATE', '10'))
+SMTP_MAX_RETRIES = int(os.environ.get('SMTP_MAX_RETRIES', '3'))
 
 email_subject = "Nouvel événement ajouté à votre agenda"
 email_body = "L'événement a été ajouté automatiquement à votre calendrier. Ouvrez la pièce jointe pour l'importer."
 
-# Lecture du fichier ICS
-filename = "event.ics"
-with open(filename, "rb") as f:
-    file_data = f.read()
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# Création du message email
-msg = EmailMessage()
-msg["From"] = SENDER_EMAIL
-msg["To"] = RECIPIENT_EMAIL
-msg["Subject"] = email_subject
-msg.set_content(email_body)
+    # Destinataires : arguments de la ligne de commande, sinon RECIPIENT_EMAIL (liste séparée par des virgules)
+    recipients = sys.argv[1:] or [r.strip() for r in os.environ.get('RECIPIENT_EMAIL', '').split(',') if r.strip()]
+    if not recipients:
+        sys.exit("Aucun destinataire : passez les adresses en argument ou définissez RECIPIENT_EMAIL")
+    settings = SmtpSettings.from_env({**SMTP_DEFAULTS, **os.environ})
+    if settings.username and not settings.password:
+        sys.exit("SMTP_PASSWORD doit être défini dans l'environnement")
 
-# Ajout du fichier ICS en pièce jointe
-msg.add_attachment(file_data, maintype="text", subtype="calendar", filename=filename)
+    # Lecture du fichier ICS, encodé une seule fois pour tous les destinataires
+    filename = os.environ.get('INVITATION_FILE', 'event.ics')
+    invitation = EncodedInvitation.from_file(filename, email_subject, email_body)
 
-# Envoi de l'email
-with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-    server.starttls()  # Sécurisation
-    server.login(SMTP_USERNAME, SMTP_PASSWORD)
-    server.send_message(msg)
+    dispatcher = InvitationDispatcher(settings, pool_size=SMTP_POOL_SIZE, rate=SMTP_RATE,
+                                      max_retries=SMTP_MAX_RETRIES)
+    try:
+        report = dispatcher.dispatch(recipients, [invitation])
+    finally:
+        dispatcher.close()
 
-print("Email envoyé avec succès ! 📅")
+    print(report)
+    if report.failed:
+        sys.exit(1)
+    print("Emails envoyés avec succès ! 📅")
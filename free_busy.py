@@ -0,0 +1,146 @@
+import os
+import math
+import time
+import heapq
+import bisect
+import threading
+import logging
+from datetime import datetime, timezone
+
+from recurrence import occurrences
+
+logger = logging.getLogger('caldav-server')
+
+# Les séries sont développées sur [maintenant - HISTORY, maintenant + HORIZON] ; au-delà, calcul direct
+HORIZON = int(os.environ.get('CALDAV_FREEBUSY_HORIZON_DAYS', '366')) * 86400
+HISTORY = int(os.environ.get('CALDAV_FREEBUSY_HISTORY_DAYS', '31')) * 86400
+
+BUSY = 'BUSY'
+BUSY_TENTATIVE = 'BUSY-TENTATIVE'
+
+
+# Type d'occupation d'un VEVENT, ou None s'il ne bloque pas le créneau (transparent ou annulé)
+def busy_type(component):
+    if str(component.get('transp', 'OPAQUE')).upper() == 'TRANSPARENT':
+        return None
+    status = str(component.get('status', '')).upper()
+    if status == 'CANCELLED':
+        return None
+    return BUSY_TENTATIVE if status == 'TENTATIVE' else BUSY
+
+
+# Intervalles occupés (début, fin, type) d'un événement sur [start, end), triés par début
+def event_busy_intervals(entry, start, end):
+    master_type = busy_type(entry.component)
+    intervals = []
+    for occurrence in occurrences(entry, start, end):
+        fbtype = master_type if occurrence.override is None else busy_type(occurrence.override)
+        # Les événements instantanés ou sans date n'occupent aucun créneau
+        if (fbtype is None or not occurrence.end > occurrence.start
+                or math.isinf(occurrence.start) or math.isinf(occurrence.end)):
+            continue
+        intervals.append((occurrence.start, occurrence.end, fbtype))
+    return intervals
+
+
+# Fusionne des intervalles triés par début en une liste disjointe (débuts, fins)
+def merge_intervals(intervals):
+    starts = []
+    ends = []
+    for start, end in intervals:
+        if ends and start <= ends[-1]:
+            if end > ends[-1]:
+                ends[-1] = end
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+# Créneaux de (starts, ends) qui chevauchent [start, end), rognés à la fenêtre
+def slice_intervals(starts, ends, start, end):
+    lo = bisect.bisect_right(ends, start)
+    hi = bisect.bisect_left(starts, end)
+    return [(max(s, start), min(e, end)) for s, e in zip(starts[lo:hi], ends[lo:hi])]
+
+
+# Index des créneaux occupés d'une collection : les intervalles sont conservés par (UID, ETag)
+# et seuls les événements modifiés sont recalculés quand le CTag change
+class BusyIndex:
+    def __init__(self):
+        self.ctag = None
+        self.window = (0.0, 0.0)
+        self.rebuilds = 0
+        self._by_uid = {}
+        self._merged = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _current_window():
+        # Fenêtre arrondie au jour pour ne pas tout redévelopper à chaque requête
+        today = math.floor(time.time() / 86400) * 86400
+        return (today - HISTORY, today + HORIZON)
+
+    def update(self, view):
+        window = self._current_window()
+        if view.ctag == self.ctag and window == self.window:
+            return
+        with self._lock:
+            if view.ctag == self.ctag and window == self.window:
+                return
+            previous = self._by_uid if window == self.window else {}
+            by_uid = {}
+            computed = 0
+            for entry in view.events:
+                cached = previous.get(entry.uid)
+                if cached is not None and cached[0] == entry.etag:
+                    by_uid[entry.uid] = cached
+                    continue
+                by_uid[entry.uid] = (entry.etag, event_busy_intervals(entry, *window))
+                computed += 1
+
+            merged = {}
+            for fbtype in (BUSY, BUSY_TENTATIVE):
+                streams = [[(s, e) for s, e, t in intervals if t == fbtype] for _, intervals in by_uid.values()]
+                merged[fbtype] = merge_intervals(heapq.merge(*streams))
+            self._by_uid = by_uid
+            self._merged = merged
+            self.window = window
+            self.ctag = view.ctag
+            self.rebuilds += 1
+            logger.debug("Index de disponibilité mis à jour: %d/%d événements recalculés", computed, len(by_uid))
+
+    # Créneaux occupés sur [start, end) : {type: [(début, fin), ...]}
+    def busy(self, view, start, end):
+        self.update(view)
+        window_start, window_end = self.window
+        if window_start <= start and end <= window_end:
+            return {fbtype: slice_intervals(starts, ends, start, end)
+                    for fbtype, (starts, ends) in self._merged.items()}
+
+        # Hors de la fenêtre indexée : calcul direct à partir de l'index d'intervalles
+        intervals = []
+        for entry in view.query(start, end):
+            intervals.extend(event_busy_intervals(entry, start, end))
+        intervals.sort()
+        result = {}
+        for fbtype in (BUSY, BUSY_TENTATIVE):
+            starts, ends = merge_intervals((s, e) for s, e, t in intervals if t == fbtype)
+            result[fbtype] = slice_intervals(starts, ends, start, end)
+        return result
+
+
+def _format_utc(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+# Corps text/calendar d'une réponse free-busy-query (RFC 4791, section 7.10)
+def freebusy_calendar(busy, start, end):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//My Calendar//example.com//', 'BEGIN:VFREEBUSY',
+             f'DTSTAMP:{_format_utc(time.time())}', f'DTSTART:{_format_utc(start)}', f'DTEND:{_format_utc(end)}']
+    for fbtype in (BUSY, BUSY_TENTATIVE):
+        # Une ligne par créneau : pas de repliement de ligne nécessaire
+        for period_start, period_end in busy.get(fbtype, []):
+            lines.append(f'FREEBUSY;FBTYPE={fbtype}:{_format_utc(period_start)}/{_format_utc(period_end)}')
+    lines += ['END:VFREEBUSY', 'END:VCALENDAR', '']
+    return '\r\n'.join(lines).encode('utf-8')
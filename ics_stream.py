@@ -0,0 +1,211 @@
+import re
+import math
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Lecture en flux d'un fichier .ics : les composants de premier niveau sont repérés par leurs lignes
+# BEGIN/END sans construire l'arbre icalendar ; seules quelques propriétés des VEVENT sont relevées
+# (UID, dates, récurrence) pour l'index, le composant complet n'étant analysé qu'à la demande.
+# Fonctionne sur des bytes comme sur un mmap.
+
+INDEXED_PROPERTIES = ('UID', 'DTSTART', 'DTEND', 'DURATION', 'RRULE', 'RDATE', 'RECURRENCE-ID', 'LAST-MODIFIED')
+
+# Une seule passe sur le fichier : lignes BEGIN/END et propriétés indexées (avec leurs lignes de continuation) ;
+# une marque d'ordre des octets UTF-8 est tolérée en début de ligne, donc en tête de fichier
+_LINE = re.compile(
+    rb'^(?:\xef\xbb\xbf)?(?:(BEGIN|END):([A-Za-z0-9-]+)[ \t]*\r?$'
+    rb'|(' + b'|'.join(name.encode('ascii') for name in INDEXED_PROPERTIES) + rb')([;:][^\r\n]*(?:\r?\n[ \t][^\r\n]*)*))',
+    re.MULTILINE | re.IGNORECASE)
+_FOLD = re.compile(rb'\r?\n[ \t]')
+
+_DURATION = re.compile(r'^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+# Composant de premier niveau : nom, position [start, end) dans le fichier et propriétés indexées
+# (texte déplié après le nom : paramètres puis valeur)
+class RawComponent:
+    __slots__ = ('name', 'start', 'end', 'fields')
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.fields = {}
+
+
+# Composants de premier niveau du VCALENDAR, dans l'ordre du fichier
+def iter_components(buffer):
+    depth = 0
+    current = None
+    seen_calendar = False
+    for match in _LINE.finditer(buffer):
+        keyword = match.group(1)
+        if keyword is None:
+            # Seules les propriétés propres au composant comptent (pas celles d'un VALARM imbriqué)
+            if current is not None and depth == 2:
+                name = match.group(3).upper().decode('ascii')
+                if name not in current.fields:
+                    value = match.group(4)
+                    if b'\n' in value:
+                        value = _FOLD.sub(b'', value)
+                    current.fields[name] = value.decode('utf-8', 'replace')
+            continue
+
+        name = match.group(2).upper().decode('ascii')
+        if keyword.upper() == b'BEGIN':
+            depth += 1
+            if depth == 1:
+                if name != 'VCALENDAR':
+                    raise ValueError(f"Composant {name} hors d'un VCALENDAR")
+                seen_calendar = True
+            elif depth == 2:
+                current = RawComponent(name, match.start())
+        else:
+            if depth == 2 and current is not None:
+                if name != current.name:
+                    raise ValueError(f"END:{name} ne ferme pas BEGIN:{current.name}")
+                end = match.end()
+                current.end = end + 1 if buffer[end:end + 1] == b'\n' else end
+                yield current
+                current = None
+            depth -= 1
+            if depth < 0:
+                raise ValueError(f"END:{name} sans BEGIN correspondant")
+    if not seen_calendar:
+        raise ValueError("Aucun VCALENDAR dans le fichier")
+    if depth != 0:
+        raise ValueError("Fichier iCalendar tronqué")
+
+
+# Octets de la plage [start, end) d'un composant, avec des fins de ligne CRLF comme dans une sérialisation icalendar
+def component_bytes(buffer, start, end):
+    data = bytes(buffer[start:end])
+    if data.count(b'\n') != data.count(b'\r\n'):
+        data = data.replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+    if not data.endswith(b'\n'):
+        data += b'\r\n'
+    return data
+
+
+# Décompose « ;PARAM=...;...:valeur » en (paramètres, valeur) ; les paramètres peuvent être entre guillemets
+def split_property(text):
+    if text.startswith(':'):
+        return {}, text[1:]
+    params = {}
+    position = 0
+    while position < len(text) and text[position] == ';':
+        equals = text.find('=', position)
+        if equals < 0:
+            break
+        name = text[position + 1:equals].upper()
+        position = equals + 1
+        if text.startswith('"', position):
+            closing = text.find('"', position + 1)
+            closing = len(text) if closing < 0 else closing
+            value = text[position + 1:closing]
+            position = closing + 1
+        else:
+            stop = position
+            while stop < len(text) and text[stop] not in ';:':
+                stop += 1
+            value = text[position:stop]
+            position = stop
+        params[name] = value
+    if text.startswith(':', position):
+        position += 1
+    return params, text[position:]
+
+
+# Valeur TEXT déséchappée (UID)
+def unescape_text(value):
+    if '\\' not in value:
+        return value
+    return (value.replace('\\n', '\n').replace('\\N', '\n').replace('\\,', ',')
+            .replace('\\;', ';').replace('\\\\', '\\'))
+
+
+# Champs (année, mois, jour, heure, minute, seconde) de AAAAMMJJ ou AAAAMMJJTHHMMSS, sans strptime
+def _fields(value):
+    if len(value) == 15 and value[8] in 'Tt' and value[:8].isdigit() and value[9:].isdigit():
+        ymd, hms = int(value[:8]), int(value[9:])
+    elif len(value) == 8 and value.isdigit():
+        ymd, hms = int(value), 0
+    else:
+        raise ValueError(f"Date illisible: {value}")
+    year, month_day = divmod(ymd, 10000)
+    hour, minute_second = divmod(hms, 10000)
+    return year, *divmod(month_day, 100), hour, *divmod(minute_second, 100)
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# Secondes epoch d'une date et heure UTC, par calcul direct (bien plus rapide que datetime.timestamp)
+def _utc_epoch(year, month, day, hour, minute, second):
+    return float((date(year, month, day).toordinal() - _EPOCH_ORDINAL) * 86400 + hour * 3600 + minute * 60 + second)
+
+
+@lru_cache(maxsize=256)
+def _zone(tzid):
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError, OSError):
+        return None
+
+
+# Secondes epoch d'une valeur DATE / DATE-TIME et indicateur « date seule » ;
+# None si le fuseau n'est pas un nom IANA (définition VTIMEZONE propre au fichier)
+def _epoch(text):
+    params, value = split_property(text)
+    value = value.strip()
+    if len(value) == 8 or (params and params.get('VALUE', '').upper() == 'DATE'):
+        return _utc_epoch(*_fields(value[:8])), True
+    if value.endswith('Z'):
+        return _utc_epoch(*_fields(value[:-1])), False
+    fields = _fields(value)
+    tzid = params.get('TZID')
+    if not tzid:
+        # Heure flottante : interprétée en UTC, comme to_epoch
+        return _utc_epoch(*fields), False
+    zone = _zone(tzid.lstrip('/'))
+    if zone is None:
+        return None
+    offset = datetime(*fields, tzinfo=zone).utcoffset().total_seconds()
+    return _utc_epoch(*fields) - offset, False
+
+
+def _duration(text):
+    match = _DURATION.match(split_property(text)[1].strip())
+    if match is None:
+        raise ValueError(f"Durée illisible: {text}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    total = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                      minutes=int(minutes or 0), seconds=int(seconds or 0)).total_seconds()
+    return -total if sign == '-' else total
+
+
+# Bornes [début, fin) d'un VEVENT à partir de ses propriétés indexées, selon les mêmes règles que
+# time_range.event_bounds ; None si elles exigent l'analyse complète (fuseau défini dans le fichier)
+def raw_bounds(fields):
+    dtstart = fields.get('DTSTART')
+    if dtstart is None:
+        return (-math.inf, math.inf)
+    parsed = _epoch(dtstart)
+    if parsed is None:
+        return None
+    start, all_day = parsed
+    if 'RRULE' in fields or 'RDATE' in fields:
+        return (start, math.inf)
+    if 'DTEND' in fields:
+        parsed = _epoch(fields['DTEND'])
+        if parsed is None:
+            return None
+        end = parsed[0]
+    elif 'DURATION' in fields:
+        end = start + _duration(fields['DURATION'])
+    elif all_day:
+        end = start + 86400
+    else:
+        end = start
+    return (start, max(start, end))
@@ -0,0 +1,227 @@
+import os
+import time
+import uuid
+import queue
+import base64
+import smtplib
+import threading
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from email.header import Header
+from email.utils import formatdate, make_msgid
+
+logger = logging.getLogger('invitations')
+
+
+# Paramètres SMTP, lus dans l'environnement (aucun identifiant dans le code)
+class SmtpSettings:
+    def __init__(self, host, port=587, username=None, password=None, sender=None, starttls=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.starttls = starttls
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        host = environ.get('SMTP_SERVER')
+        if not host:
+            raise ValueError("Variable d'environnement SMTP_SERVER manquante")
+        return cls(host,
+                   port=int(environ.get('SMTP_PORT', '587')),
+                   username=environ.get('SMTP_USERNAME'),
+                   password=environ.get('SMTP_PASSWORD'),
+                   sender=environ.get('SENDER_EMAIL'),
+                   starttls=environ.get('SMTP_STARTTLS', '1') not in ('0', 'false', 'no'),
+                   timeout=float(environ.get('SMTP_TIMEOUT', '30')))
+
+
+# Invitation prête à l'envoi : le corps MIME (texte + pièce jointe .ics en base64) est encodé une seule fois,
+# seuls les en-têtes sont produits pour chaque destinataire
+class EncodedInvitation:
+    def __init__(self, ics_data, subject, text, filename='invite.ics', method='REQUEST'):
+        self.subject = subject
+        self.boundary = f'=_invitation_{uuid.uuid4().hex}'
+        attachment = base64.encodebytes(ics_data).replace(b'\n', b'\r\n')
+        text_part = base64.encodebytes(text.encode('utf-8')).replace(b'\n', b'\r\n')
+        boundary = self.boundary.encode('ascii')
+        self.body = b''.join([
+            b'--', boundary, b'\r\n',
+            b'Content-Type: text/plain; charset="utf-8"\r\n',
+            b'Content-Transfer-Encoding: base64\r\n\r\n', text_part,
+            b'--', boundary, b'\r\n',
+            f'Content-Type: text/calendar; charset="utf-8"; method={method}\r\n'.encode('ascii'),
+            b'Content-Transfer-Encoding: base64\r\n',
+            f'Content-Disposition: attachment; filename="{filename}"\r\n\r\n'.encode('ascii'), attachment,
+            b'--', boundary, b'--\r\n',
+        ])
+        self._subject_header = Header(subject, 'utf-8').encode()
+
+    @classmethod
+    def from_file(cls, path, subject, text, method='REQUEST'):
+        with open(path, 'rb') as f:
+            return cls(f.read(), subject, text, filename=os.path.basename(path), method=method)
+
+    # Message complet pour un destinataire
+    def message(self, sender, recipient):
+        headers = (
+            f'From: {sender}\r\n'
+            f'To: {recipient}\r\n'
+            f'Subject: {self._subject_header}\r\n'
+            f'Date: {formatdate(localtime=True)}\r\n'
+            f'Message-ID: {make_msgid()}\r\n'
+            'MIME-Version: 1.0\r\n'
+            f'Content-Type: multipart/mixed; boundary="{self.boundary}"\r\n\r\n'
+        )
+        return headers.encode('utf-8') + self.body
+
+
+# Limiteur de débit (seau à jetons) partagé par tous les threads d'envoi
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Pool de connexions SMTP persistantes, authentifiées une seule fois
+class SmtpConnectionPool:
+    def __init__(self, settings, size=4):
+        self.settings = settings
+        self.size = size
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        settings = self.settings
+        connection = smtplib.SMTP(settings.host, settings.port, timeout=settings.timeout)
+        try:
+            if settings.starttls:
+                connection.starttls()
+            if settings.username:
+                connection.login(settings.username, settings.password or '')
+        except Exception:
+            connection.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        logger.info("Connexion SMTP ouverte vers %s:%s", settings.host, settings.port)
+        return connection
+
+    # Prête une connexion ; en cas d'erreur elle est fermée au lieu d'être remise dans le pool
+    @contextmanager
+    def connection(self):
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+        try:
+            yield connection
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+            raise
+        self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+
+
+# Bilan d'un envoi
+class DispatchReport:
+    def __init__(self, sent, failed, elapsed, connections):
+        self.sent = sent
+        self.failed = failed
+        self.elapsed = elapsed
+        self.connections = connections
+
+    @property
+    def messages_per_second(self):
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (f"{self.sent} messages envoyés, {len(self.failed)} échecs en {self.elapsed:.2f}s "
+                f"({self.messages_per_second:.1f} messages/s, {self.connections} connexions SMTP)")
+
+
+# Erreurs temporaires : la connexion est rouverte et l'envoi retenté
+def _is_transient(error):
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+# Envoi d'invitations en parallèle sur un petit pool de connexions, avec reprise et limite de débit
+class InvitationDispatcher:
+    def __init__(self, settings, pool_size=4, rate=10.0, max_retries=3, backoff=0.5):
+        self.settings = settings
+        self.pool = SmtpConnectionPool(settings, pool_size)
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def _send_one(self, recipient, invitation):
+        message = invitation.message(self.settings.sender, recipient)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                with self.pool.connection() as connection:
+                    connection.sendmail(self.settings.sender, [recipient], message)
+                return None
+            except (smtplib.SMTPException, OSError) as e:
+                if not _is_transient(e) or attempt == self.max_retries:
+                    logger.error("Échec de l'envoi à %s: %s", recipient, e)
+                    return e
+                delay = self.backoff * (2 ** attempt)
+                logger.warning("Envoi à %s refusé temporairement (%s), nouvel essai dans %.1fs", recipient, e, delay)
+                time.sleep(delay)
+
+    # Envoie chaque invitation à chaque destinataire ; renvoie un DispatchReport
+    def dispatch(self, recipients, invitations):
+        jobs = [(recipient, invitation) for invitation in invitations for recipient in recipients]
+        started = time.perf_counter()
+        opened = self.pool.connections_opened
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix='smtp') as executor:
+            for (recipient, _), error in zip(jobs, executor.map(lambda job: self._send_one(*job), jobs)):
+                if error is not None:
+                    failed.append((recipient, error))
+        report = DispatchReport(len(jobs) - len(failed), failed, time.perf_counter() - started,
+                                self.pool.connections_opened - opened)
+        logger.info('%s', report)
+        return report
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Niveau et format des journaux : 'text' (lisible) ou 'json' (une ligne JSON par message)
+LOG_LEVEL = os.environ.get('CALDAV_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('CALDAV_LOG_FORMAT', 'text')
+# Au plus RATE_LIMIT messages d'un même modèle par fenêtre de RATE_WINDOW secondes (0 : aucune limite)
+RATE_LIMIT = int(os.environ.get('CALDAV_LOG_RATE_LIMIT', '20'))
+RATE_WINDOW = float(os.environ.get('CALDAV_LOG_RATE_WINDOW', '10'))
+# Messages en attente d'écriture ; au-delà ils sont abandonnés plutôt que de bloquer les requêtes
+QUEUE_SIZE = int(os.environ.get('CALDAV_LOG_QUEUE_SIZE', '10000'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Nombre maximal de modèles suivis par le filtre de débit
+MAX_TRACKED_MESSAGES = 10000
+
+# Arguments immuables, dont la substitution peut attendre le thread d'écriture
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+# Limite le débit de chaque modèle de message (journal, niveau, texte avant substitution des arguments) ;
+# les erreurs ne sont jamais filtrées et le nombre de messages ignorés est joint au suivant
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limit=RATE_LIMIT, window=RATE_WINDOW, exempt_level=logging.ERROR):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.exempt_level = exempt_level
+        self.suppressed_total = 0
+        # modèle -> [début de la fenêtre, messages émis, messages ignorés]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.limit or record.levelno >= self.exempt_level:
+            return True
+        key = (record.name, record.levelno, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state is not None and state[2]:
+                    record.suppressed = state[2]
+                elif state is None and len(self._windows) >= MAX_TRACKED_MESSAGES:
+                    self._purge(now)
+                self._windows[key] = [now, 1, 0]
+                return True
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+            state[2] += 1
+            self.suppressed_total += 1
+            return False
+
+    def _purge(self, now):
+        for key in [key for key, state in self._windows.items() if now - state[0] >= self.window]:
+            del self._windows[key]
+
+
+# Format texte historique, suivi du nombre de messages similaires ignorés
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text += f' ({suppressed} messages similaires ignorés)'
+        return text
+
+
+# Une ligne JSON par message, pour les collecteurs de journaux
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Dépose les messages dans la file sans jamais bloquer ; ceux qui ne tiennent pas sont comptés et abandonnés
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    # Aucun formatage dans le thread de la requête : le message et exc_info sont transmis tels quels au
+    # gestionnaire du thread d'écriture. Seuls des arguments mutables, qui pourraient changer d'ici là,
+    # sont substitués immédiatement.
+    def prepare(self, record):
+        args = record.args
+        if args and not all(isinstance(arg, IMMUTABLE_ARGS)
+                            for arg in (args.values() if isinstance(args, dict) else args)):
+            record.msg = record.getMessage()
+            record.args = None
+        elif not isinstance(record.msg, str):
+            record.msg = str(record.msg)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+
+
+# Installe sur le journal racine un QueueHandler (seul travail fait par le thread de la requête)
+# et un QueueListener qui formate et écrit les messages dans un thread dédié
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, stream=None):
+    global _listener, _handler
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter(TEXT_FORMAT))
+
+    _handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+    _handler.addFilter(RateLimitFilter())
+
+    # Seuls les gestionnaires installés par ce module sont remplacés : ceux de l'hôte (gunicorn, pytest,
+    # application englobante) sont conservés
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+# Vide la file et arrête le thread d'écriture
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# Compteurs des messages ignorés (limite de débit) et abandonnés (file pleine)
+def logging_stats():
+    if _handler is None:
+        return {'suppressed': 0, 'dropped': 0}
+    suppressed = sum(f.suppressed_total for f in _handler.filters if isinstance(f, RateLimitFilter))
+    return {'suppressed': suppressed, 'dropped': _handler.dropped}
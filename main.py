@@ -1,23 +1,232 @@
-from ics import Calendar, Event
+import os
+import sys
+import csv
+import json
+import uuid
+import argparse
+import tempfile
+from datetime import datetime, date, timezone
+from concurrent.futures import ProcessPoolExecutor
 
-# Création du calendrier
-cal = Calendar()
+# En-tête du flux : METHOD:PUBLISH fait partie de l'en-tête, sans découpage de la sortie d'une bibliothèque
+CALENDAR_HEADER = "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//My Calendar//EN\r\nMETHOD:PUBLISH\r\n"
+CALENDAR_FOOTER = "END:VCALENDAR\r\n"
 
-# Création de l'événement
-event = Event()
-event.name = "Réunion d'orde "
-event.begin = "2025-03-03 13:25:00"
-event.end = "2025-03-03 23:30:00"
-event.location = "Bureau 30"
-event.description = "Discussion sur toi ."
+# Taille du tampon d'écriture et nombre d'événements par lot envoyé aux processus
+WRITE_BUFFER_SIZE = 1024 * 1024
+BATCH_SIZE = 2000
 
-# Ajout de l'événement
-cal.events.add(event)
 
-# Génération du contenu ICS en supprimant ORGANIZER et en ajoutant METHOD:PUBLISH
-ics_content = "BEGIN:VCALENDAR\nVERSION:2.0\nPRODID:-//My Calendar//EN\nMETHOD:PUBLISH\n" + cal.serialize()[15:]
+# Échappement d'une valeur TEXT (RFC 5545, section 3.3.11)
+def escape_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
 
-# Sauvegarde du fichier .ics
-filename = "event.ics"
-with open(filename, "w") as f:
-    f.write(ics_content)
+
+# Repli des lignes à 75 octets sans couper un caractère UTF-8
+def fold_line(line):
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    start = 0
+    limit = 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Reculer jusqu'au début d'un caractère UTF-8
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode('utf-8'))
+        start = end
+        limit = 74  # la ligne de continuation commence par une espace
+    return '\r\n '.join(parts) + '\r\n'
+
+
+# Valeur DATE ou DATE-TIME : les dates et heures sans fuseau sont interprétées en UTC
+def format_datetime(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if len(value) == 10:
+            value = date.fromisoformat(value)
+        else:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    return value.strftime('%Y%m%d')
+
+
+def _field(record, *names):
+    for name in names:
+        value = record.get(name)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+# Texte d'un VEVENT à partir d'un enregistrement CSV/JSON (name/summary, begin/start, end, location, description, uid)
+def event_text(record, dtstamp):
+    begin = _field(record, 'begin', 'start', 'dtstart')
+    if begin is None:
+        raise ValueError(f"Enregistrement sans date de début: {record!r}")
+    start = format_datetime(begin)
+    value_type = ';VALUE=DATE' if len(start) == 8 else ''
+
+    lines = ['BEGIN:VEVENT',
+             f"UID:{_field(record, 'uid', 'id') or uuid.uuid4()}",
+             f'DTSTAMP:{dtstamp}',
+             f'DTSTART{value_type}:{start}']
+    end = _field(record, 'end', 'dtend')
+    if end is not None:
+        lines.append(f'DTEND{value_type}:{format_datetime(end)}')
+    for prop, names in (('SUMMARY', ('name', 'summary', 'title')),
+                        ('LOCATION', ('location',)),
+                        ('DESCRIPTION', ('description',))):
+        value = _field(record, *names)
+        if value is not None:
+            lines.append(f'{prop}:{escape_text(value)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold_line(line) for line in lines)
+
+
+# Lecture en flux d'un tableau JSON : les éléments sont décodés un par un sans charger le fichier
+def _iter_json_array(f, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Le fichier JSON doit contenir un tableau d'événements")
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # Élément incomplet : lire la suite du fichier
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError("Tableau JSON incomplet")
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+# Enregistrements d'un export CSV, JSON (tableau) ou JSON Lines, lus au fil de l'eau
+def read_records(path, input_format=None):
+    input_format = input_format or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if input_format == 'csv':
+            yield from csv.DictReader(f)
+        elif input_format in ('jsonl', 'ndjson'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif input_format == 'json':
+            yield from _iter_json_array(f)
+        else:
+            raise ValueError(f"Format d'entrée inconnu: {input_format}")
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_batch(batch, dtstamp):
+    return len(batch), ''.join(event_text(record, dtstamp) for record in batch)
+
+
+# Textes VEVENT produits à la demande, sous forme de (nombre d'événements, texte) ; avec workers > 1,
+# les lots sont répartis sur un pool de processus en gardant un nombre borné de lots en vol et l'ordre d'entrée
+def render_events(records, dtstamp, workers=1, batch_size=BATCH_SIZE):
+    if workers <= 1:
+        for record in records:
+            yield 1, event_text(record, dtstamp)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for batch in _batches(records, batch_size):
+            pending.append(executor.submit(render_batch, batch, dtstamp))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+# Écriture atomique : fichier temporaire tamponné dans le même répertoire puis os.replace
+class AtomicWriter:
+    def __init__(self, path, buffer_size=WRITE_BUFFER_SIZE):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._file = None
+        self._tmp_path = None
+
+    def __enter__(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix='.feed-', suffix='.ics')
+        self._file = open(fd, 'w', encoding='utf-8', newline='', buffering=self.buffer_size)
+        return self._file
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+        if exc_type is None:
+            os.chmod(self._tmp_path, 0o644)
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.unlink(self._tmp_path)
+        return False
+
+
+# Génère un flux .ics complet ; la mémoire utilisée ne dépend pas du nombre d'événements
+def write_feed(records, path, workers=1):
+    dtstamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    count = 0
+    with AtomicWriter(path) as out:
+        out.write(CALENDAR_HEADER)
+        for events, text in render_events(records, dtstamp, workers):
+            out.write(text)
+            count += events
+        out.write(CALENDAR_FOOTER)
+    return count
+
+
+# Événement d'exemple (comportement historique du script)
+SAMPLE_EVENT = {
+    'name': "Réunion d'orde ",
+    'begin': "2025-03-03 13:25:00",
+    'end': "2025-03-03 23:30:00",
+    'location': "Bureau 30",
+    'description': "Discussion sur toi .",
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Génère un fichier .ics à partir d'un export CSV ou JSON")
+    parser.add_argument('source', nargs='?', help="export CSV, JSON ou JSON Lines (sans argument : événement d'exemple)")
+    parser.add_argument('-o', '--output', default='event.ics', help="fichier .ics produit")
+    parser.add_argument('--format', choices=('csv', 'json', 'jsonl'), help="format de l'export (par défaut : extension)")
+    parser.add_argument('--workers', type=int, default=1, help="nombre de processus de génération")
+    args = parser.parse_args()
+
+    records = read_records(args.source, args.format) if args.source else iter([SAMPLE_EVENT])
+    try:
+        count = write_feed(records, args.output, workers=args.workers)
+    except ValueError as e:
+        sys.exit(f"Erreur: {e}")
+    print(f"{count} événements écrits dans {args.output}")
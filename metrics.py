@@ -0,0 +1,335 @@
+import os
+import sys
+import time
+import atexit
+import bisect
+import threading
+import logging
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+logger = logging.getLogger('caldav-server')
+
+# Bornes des histogrammes : durées en secondes, tailles en octets, nombres d'événements
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+# Profileur par échantillonnage : activé par CALDAV_PROFILE=1, période en millisecondes
+PROFILE_ENABLED = os.environ.get('CALDAV_PROFILE', '0') not in ('0', 'false', 'no', '')
+PROFILE_INTERVAL = float(os.environ.get('CALDAV_PROFILE_INTERVAL_MS', '10')) / 1000
+# Nombre maximal de piles distinctes conservées par le profileur
+PROFILE_MAX_STACKS = int(os.environ.get('CALDAV_PROFILE_MAX_STACKS', '10000'))
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Compteur monotone, par combinaison d'étiquettes
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in values]
+
+
+# Histogramme à bornes fixes : une recherche dichotomique et un incrément par observation
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [compte par borne..., compte au-delà de la dernière borne, somme]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        samples = []
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                samples.append((f'{self.name}_bucket', labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f'{self.name}_sum', labels, values[-1]))
+            samples.append((f'{self.name}_count', labels, cumulative))
+        return samples
+
+
+# Ensemble des métriques exposées ; les collecteurs lisent à chaque exposition les compteurs
+# déjà tenus ailleurs (caches, surveillance du fichier utilisateur)
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    # collector() renvoie [(nom, type, description, [(étiquettes {nom: valeur}, valeur), ...]), ...]
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    # Format texte d'exposition Prometheus (version 0.0.4)
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines += [f'{name}{labels} {_format_value(value)}' for name, labels, value in metric.samples()]
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logger.warning("Collecteur de métriques en échec: %s", e)
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'caldav_request_duration_seconds', "Durée des requêtes, jusqu'à la fin de l'envoi du corps", ('route', 'method'))
+REQUESTS = REGISTRY.counter('caldav_requests_total', 'Requêtes traitées', ('route', 'method', 'status'))
+STAGE_SECONDS = REGISTRY.histogram(
+    'caldav_stage_duration_seconds',
+    'Durée des étapes : file_sync, parse, index_lookup, serialization, response_write (elles peuvent être imbriquées)',
+    ('stage',))
+RESPONSE_BYTES = REGISTRY.histogram(
+    'caldav_response_size_bytes', 'Taille des corps de réponse envoyés', ('route',), SIZE_BUCKETS)
+RESPONSE_EVENTS = REGISTRY.histogram(
+    'caldav_response_events', 'Événements inclus par réponse PROPFIND/REPORT', ('kind',), COUNT_BUCKETS)
+
+
+# Mesure d'une étape : with stage('parse'): ...
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+# Itérateur dont le temps de production de chaque élément est compté dans une étape (sérialisation en flux)
+def timed_iter(iterable, name):
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        STAGE_SECONDS.observe(elapsed, stage=name)
+
+
+# Itérateur qui compte les éléments produits puis enregistre leur nombre
+def counted_events(iterable, kind):
+    count = 0
+    try:
+        for item in iterable:
+            count += 1
+            yield item
+    finally:
+        RESPONSE_EVENTS.observe(count, kind=kind)
+
+
+# Corps de réponse instrumenté : le temps passé hors de la production des morceaux est le temps d'écriture
+class MeteredBody:
+    def __init__(self, body, route, method, started):
+        self._body = body
+        self._iterator = iter(body)
+        self.route = route
+        self.method = method
+        self.started = started
+        self.size = 0
+        self._producing = 0.0
+        self._handed_over = time.perf_counter()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            chunk = next(self._iterator)
+        finally:
+            self._producing += time.perf_counter() - started
+        self.size += len(chunk)
+        return chunk
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        close = getattr(self._body, 'close', None)
+        if close is not None:
+            close()
+        finished = time.perf_counter()
+        STAGE_SECONDS.observe(max(0.0, finished - self._handed_over - self._producing), stage='response_write')
+        RESPONSE_BYTES.observe(self.size, route=self.route)
+        REQUEST_SECONDS.observe(finished - self.started, route=self.route, method=self.method)
+
+
+# Branche les mesures sur une application Flask : durée par route et méthode, statut, taille du corps.
+# Le profileur (CALDAV_PROFILE=1) démarre avec l'application, jamais à l'import, et s'arrête à la sortie.
+def instrument_app(app):
+    from flask import g, request
+
+    if PROFILE_ENABLED and not profiler.running:
+        profiler.start()
+        atexit.register(profiler.stop)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _wrap_response(response):
+        started = g.pop('metrics_started', None)
+        if started is None or response.direct_passthrough:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        response.response = MeteredBody(response.response, route, request.method, started)
+        return response
+
+    return app
+
+
+# Profileur par échantillonnage : relève périodiquement la pile de chaque thread et agrège
+# les piles repliées (format « fichier:fonction;... nombre », lisible par flamegraph.pl ou speedscope)
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, max_stacks=PROFILE_MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self.dropped = 0
+        self._stacks = StackCounter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='caldav-profiler', daemon=True)
+        self._thread.start()
+        logger.info("Profileur par échantillonnage démarré (période %.1f ms)", self.interval * 1000)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = [self._collapse(frame) for ident, frame in sys._current_frames().items() if ident != own]
+            with self._lock:
+                self.samples += 1
+                for stack in stacks:
+                    if stack in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[stack] += 1
+                    else:
+                        self.dropped += 1
+
+    # Piles repliées, les plus fréquentes d'abord ; reset remet les compteurs à zéro
+    def collapsed(self, reset=False):
+        with self._lock:
+            stacks = self._stacks.most_common()
+            if reset:
+                self._stacks = StackCounter()
+                self.samples = 0
+                self.dropped = 0
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+
+profiler = SamplingProfiler()
+
+
+def _profiler_metrics():
+    return [('caldav_profiler_samples_total', 'counter', 'Échantillons relevés par le profileur',
+             [({}, profiler.samples)]),
+            ('caldav_profiler_dropped_total', 'counter', 'Piles ignorées (limite de piles distinctes atteinte)',
+             [({}, profiler.dropped)])]
+
+
+REGISTRY.register_collector(_profiler_metrics)
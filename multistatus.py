@@ -0,0 +1,121 @@
+from xml.sax.saxutils import escape
+
+from flask import Response
+
+from caldav_query import GETETAG, CALENDAR_DATA, DAV_NS, CALDAV_NS, CALENDARSERVER_NS
+from metrics import timed_iter
+
+MULTISTATUS_HEADER = (b'<?xml version="1.0" encoding="utf-8"?>\n'
+                      b'<D:multistatus xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav"'
+                      b' xmlns:CS="http://calendarserver.org/ns/">\n')
+MULTISTATUS_FOOTER = b'</D:multistatus>'
+
+# Préfixes déclarés par MULTISTATUS_HEADER
+NAMESPACE_PREFIXES = {DAV_NS: 'D', CALDAV_NS: 'C', CALENDARSERVER_NS: 'CS'}
+
+RESOURCETYPE = f'{{{DAV_NS}}}resourcetype'
+GETCONTENTTYPE = f'{{{DAV_NS}}}getcontenttype'
+
+# Taille visée des morceaux envoyés : assez gros pour limiter les écritures, assez petits pour rester en flux
+CHUNK_SIZE = 64 * 1024
+
+
+# Élément <D:response> d'un événement pour les REPORT, avec les seules propriétés demandées ;
+# calendar_data remplace la ressource stockée (série développée ou limitée)
+def event_report_response(href, entry, props, calendar_data=None):
+    parts = [b'  <D:response>\n    <D:href>', escape(href).encode('utf-8'),
+             b'</D:href>\n    <D:propstat>\n        <D:prop>']
+    if GETETAG in props:
+        parts += [b'\n            <D:getetag>"', entry.etag.encode('ascii'), b'"</D:getetag>']
+    if CALENDAR_DATA in props:
+        data = entry.resource if calendar_data is None else calendar_data
+        parts += [b'\n            <C:calendar-data>', escape(data.decode('utf-8')).encode('utf-8'),
+                  b'</C:calendar-data>']
+    parts.append(b'\n        </D:prop>\n        <D:status>HTTP/1.1 200 OK</D:status>\n'
+                 b'    </D:propstat>\n  </D:response>\n')
+    return b''.join(parts)
+
+
+# Élément vide d'une propriété {espace}nom, pour les propstat 404
+def empty_property(tag):
+    namespace, _, name = tag[1:].partition('}') if tag.startswith('{') else ('', '', tag)
+    prefix = NAMESPACE_PREFIXES.get(namespace)
+    if prefix is not None:
+        return f'<{prefix}:{name}/>'.encode('utf-8')
+    if not namespace:
+        return f'<{name} xmlns=""/>'.encode('utf-8')
+    return f'<X:{name} xmlns:X="{escape(namespace, {chr(34): "&quot;"})}"/>'.encode('utf-8')
+
+
+# Élément <D:response> construit à partir de fragments XML déjà encodés [(nom, octets), ...].
+# Avec requested, seules les propriétés demandées sont renvoyées et les inconnues sont signalées en 404.
+def properties_response(href, properties, requested=None):
+    if requested is None:
+        found = [fragment for _, fragment in properties]
+        missing = []
+    else:
+        found = [fragment for tag, fragment in properties if tag in requested]
+        known = {tag for tag, _ in properties}
+        missing = sorted(tag for tag in requested if tag not in known)
+
+    parts = [b'  <D:response>\n    <D:href>', escape(href).encode('utf-8'), b'</D:href>\n']
+    if found or not missing:
+        parts.append(b'    <D:propstat>\n        <D:prop>\n')
+        parts += [b'            ' + fragment + b'\n' for fragment in found]
+        parts.append(b'        </D:prop>\n        <D:status>HTTP/1.1 200 OK</D:status>\n    </D:propstat>\n')
+    if missing:
+        parts.append(b'    <D:propstat>\n        <D:prop>\n')
+        parts += [b'            ' + empty_property(tag) + b'\n' for tag in missing]
+        parts.append(b'        </D:prop>\n        <D:status>HTTP/1.1 404 Not Found</D:status>\n    </D:propstat>\n')
+    parts.append(b'  </D:response>\n')
+    return b''.join(parts)
+
+
+# Corps multistatus complet, pour les réponses mises en cache
+def multistatus_body(responses):
+    return MULTISTATUS_HEADER + b''.join(responses) + MULTISTATUS_FOOTER
+
+
+# Élément <D:response> d'un événement pour un PROPFIND Depth:1 ; requested filtre les propriétés
+def event_propfind_response(href, etag, requested=None):
+    if requested is not None:
+        return properties_response(href, [
+            (GETETAG, b'<D:getetag>"' + etag.encode('ascii') + b'"</D:getetag>'),
+            (RESOURCETYPE, b'<D:resourcetype/>'),
+            (GETCONTENTTYPE, b'<D:getcontenttype>text/calendar; charset=utf-8; component=vevent</D:getcontenttype>'),
+        ], requested)
+    return (b'  <D:response>\n    <D:href>' + escape(href).encode('utf-8')
+            + b'</D:href>\n    <D:propstat>\n        <D:prop>\n            <D:getetag>"'
+            + etag.encode('ascii')
+            + b'"</D:getetag>\n            <D:resourcetype/>\n        </D:prop>\n'
+              b'        <D:status>HTTP/1.1 200 OK</D:status>\n    </D:propstat>\n  </D:response>\n')
+
+
+# Élément <D:response> d'une ressource absente ou supprimée
+def missing_response(href):
+    return (b'  <D:response>\n    <D:href>' + escape(href).encode('utf-8')
+            + b'</D:href>\n    <D:status>HTTP/1.1 404 Not Found</D:status>\n  </D:response>\n')
+
+
+# Générateur du corps multistatus : les réponses sont regroupées en morceaux d'environ CHUNK_SIZE
+def stream_multistatus(responses, trailer=b''):
+    yield MULTISTATUS_HEADER
+    buffer = []
+    size = 0
+    for part in responses:
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(trailer)
+    buffer.append(MULTISTATUS_FOOTER)
+    yield b''.join(buffer)
+
+
+# Réponse Flask 207 envoyée en flux, sans construire le corps complet en mémoire ;
+# le temps de production des morceaux est compté comme sérialisation
+def multistatus_response(responses, trailer=b''):
+    return Response(timed_iter(stream_multistatus(responses, trailer), 'serialization'), status=207,
+                    content_type='text/xml; charset=utf-8')
@@ -0,0 +1,232 @@
+import os
+import math
+import logging
+from datetime import datetime, timedelta, timezone
+
+from bounded_cache import BoundedLRU
+from calendar_cache import RESOURCE_HEADER, RESOURCE_FOOTER
+from time_range import event_bounds, overlaps, to_epoch
+
+logger = logging.getLogger('caldav-server')
+
+# Nombre de développements conservés (clé : UID, ETag, fenêtre)
+CACHE_SIZE = int(os.environ.get('CALDAV_RECURRENCE_CACHE_SIZE', '1024'))
+# Garde-fou pour les fenêtres ouvertes sur une série infinie
+MAX_OCCURRENCES = int(os.environ.get('CALDAV_MAX_OCCURRENCES', '5000'))
+
+# Propriétés retirées d'une instance développée (remplacées par DTSTART / DTEND / RECURRENCE-ID en UTC)
+_SERIES_PROPERTIES = frozenset(['RRULE', 'RDATE', 'EXDATE', 'EXRULE', 'DTSTART', 'DTEND', 'DURATION',
+                                'RECURRENCE-ID'])
+
+
+# Cache des occurrences calculées ; l'ETag dans la clé invalide les séries modifiées
+occurrence_cache = BoundedLRU(CACHE_SIZE)
+
+
+# Une occurrence : bornes en secondes epoch, RECURRENCE-ID d'origine, et VEVENT d'exception éventuel
+class Occurrence:
+    __slots__ = ('start', 'end', 'recurrence_id', 'override')
+
+    def __init__(self, start, end, recurrence_id, override=None):
+        self.start = start
+        self.end = end
+        self.recurrence_id = recurrence_id
+        self.override = override
+
+
+# Vrai si le VEVENT maître décrit une série
+def is_recurring(entry):
+    # Test rapide sur les bornes avant d'accéder au composant (analysé à la demande pour certains stockages)
+    if entry.end != math.inf or entry.start == -math.inf:
+        return False
+    component = entry.component
+    return 'rrule' in component or 'rdate' in component
+
+
+def _values(component, name):
+    value = component.get(name)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+# Aligne une date de RDATE / EXDATE / UNTIL sur le type de DTSTART (date, flottante ou avec fuseau)
+def _align(value, dtstart):
+    if isinstance(value, tuple):
+        # RDATE de type PERIOD : seul le début compte
+        value = value[0]
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, dtstart.timetz())
+    if dtstart.tzinfo is None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    if dtstart.tzinfo is not None and value.tzinfo is None:
+        return value.replace(tzinfo=dtstart.tzinfo)
+    return value
+
+
+def _series_start(master):
+    dtstart = master.decoded('dtstart')
+    if isinstance(dtstart, datetime):
+        return dtstart, False
+    return datetime(dtstart.year, dtstart.month, dtstart.day), True
+
+
+def _duration(master, all_day):
+    if 'dtend' in master:
+        seconds = to_epoch(master.decoded('dtend')) - to_epoch(master.decoded('dtstart'))
+        return timedelta(seconds=max(0, seconds))
+    if 'duration' in master:
+        duration = master.decoded('duration')
+        return duration if isinstance(duration, timedelta) else timedelta(0)
+    return timedelta(days=1) if all_day else timedelta(0)
+
+
+# Ensemble RRULE / RDATE / EXDATE d'une série ; DTSTART en est toujours la première instance
+def _rule_set(master, dtstart):
+    # icalendar et dateutil ne sont importés qu'au premier développement d'une série
+    import icalendar
+    from dateutil.rrule import rruleset, rrulestr
+    rules = rruleset()
+    for rule in _values(master, 'rrule'):
+        rule = icalendar.vRecur(rule)
+        if 'UNTIL' in rule:
+            # dateutil exige un UNTIL du même type que DTSTART (UTC si DTSTART a un fuseau)
+            until = _align(rule['UNTIL'][0], dtstart)
+            rule['UNTIL'] = [until.astimezone(timezone.utc) if until.tzinfo is not None else until]
+        rules.rrule(rrulestr(rule.to_ical().decode('ascii'), dtstart=dtstart))
+    rules.rdate(dtstart)
+    for rdates in _values(master, 'rdate'):
+        for value in rdates.dts:
+            rules.rdate(_align(value.dt, dtstart))
+    for exdates in _values(master, 'exdate'):
+        for value in exdates.dts:
+            rules.exdate(_align(value.dt, dtstart))
+    return rules
+
+
+def _window_datetime(epoch, dtstart):
+    value = datetime.fromtimestamp(epoch, timezone.utc)
+    return value if dtstart.tzinfo is not None else value.replace(tzinfo=None)
+
+
+# Calcule les occurrences de la série qui chevauchent [start, end), exceptions comprises
+def _expand(entry, start, end):
+    master = entry.component
+    overrides = {}
+    for override in entry.overrides:
+        overrides[to_epoch(override.decoded('recurrence-id'))] = override
+
+    dtstart, all_day = _series_start(master)
+    duration = _duration(master, all_day)
+    rules = _rule_set(master, dtstart)
+
+    occurrences = []
+    if start == -math.inf:
+        candidates = iter(rules)
+    else:
+        # Une occurrence commencée avant la fenêtre peut encore la chevaucher
+        candidates = rules.xafter(_window_datetime(start - duration.total_seconds(), dtstart), inc=True)
+    for value in candidates:
+        occurrence_start = to_epoch(value)
+        if occurrence_start >= end:
+            break
+        if len(occurrences) >= MAX_OCCURRENCES:
+            logger.warning("Série %s: développement limité à %d occurrences", entry.uid, MAX_OCCURRENCES)
+            break
+        if occurrence_start in overrides:
+            continue
+        occurrence_end = to_epoch(value + duration)
+        if overlaps(occurrence_start, occurrence_end, start, end):
+            occurrences.append(Occurrence(occurrence_start, occurrence_end, value))
+
+    # Les exceptions sont évaluées sur leurs propres dates : elles peuvent entrer dans la fenêtre ou en sortir
+    for override in overrides.values():
+        override_start, override_end = event_bounds(override)
+        if overlaps(override_start, override_end, start, end):
+            occurrences.append(Occurrence(override_start, override_end, override.decoded('recurrence-id'), override))
+
+    occurrences.sort(key=lambda occurrence: occurrence.start)
+    return occurrences
+
+
+# Occurrences d'un événement sur [start, end) ; les séries ne sont développées que sur la fenêtre demandée
+def occurrences(entry, start=-math.inf, end=math.inf):
+    if not is_recurring(entry):
+        return [Occurrence(entry.start, entry.end, None)] if overlaps(entry.start, entry.end, start, end) else []
+
+    def compute():
+        try:
+            return _expand(entry, start, end)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error("Récurrence illisible pour %s: %s", entry.uid, e)
+            return [Occurrence(entry.start, entry.end, None)]
+
+    return occurrence_cache.get_or_compute((entry.uid, entry.etag, start, end), compute)
+
+
+# Retire des candidats de l'index les séries sans aucune occurrence dans [start, end)
+def filter_entries(entries, start, end):
+    return [entry for entry in entries if not is_recurring(entry) or occurrences(entry, start, end)]
+
+
+def _utc(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+    return value
+
+
+# VEVENT d'une instance développée (RFC 4791, section 9.6.5) : dates en UTC, sans règle de récurrence
+def _instance(component, occurrence, all_day):
+    import icalendar
+    instance = icalendar.Event()
+    for name, value in component.property_items(recursive=False)[1:-1]:
+        if name not in _SERIES_PROPERTIES:
+            instance.add(name, value, encode=False)
+    for subcomponent in component.subcomponents:
+        instance.add_component(subcomponent)
+    start = datetime.fromtimestamp(occurrence.start, timezone.utc)
+    end = datetime.fromtimestamp(occurrence.end, timezone.utc)
+    recurrence_id = occurrence.recurrence_id
+    if all_day and occurrence.override is None:
+        start, end, recurrence_id = start.date(), end.date(), recurrence_id.date()
+    instance.add('dtstart', start)
+    if occurrence.end > occurrence.start:
+        instance.add('dtend', end)
+    instance.add('recurrence-id', _utc(recurrence_id))
+    return instance
+
+
+# Ressource calendar-data d'une série développée sur [start, end) (élément C:expand)
+def expanded_resource(entry, start, end):
+    if not is_recurring(entry):
+        return entry.resource
+
+    def compute():
+        _, all_day = _series_start(entry.component)
+        parts = [RESOURCE_HEADER]
+        for occurrence in occurrences(entry, start, end):
+            component = occurrence.override if occurrence.override is not None else entry.component
+            parts.append(_instance(component, occurrence, all_day).to_ical())
+        parts.append(RESOURCE_FOOTER)
+        return b''.join(parts)
+
+    return occurrence_cache.get_or_compute(('expand', entry.uid, entry.etag, start, end), compute)
+
+
+# Ressource calendar-data limitée (élément C:limit-recurrence-set) : la série et les seules exceptions
+# qui concernent [start, end)
+def limited_resource(entry, start, end):
+    if not entry.overrides:
+        return entry.resource
+    kept = []
+    for override in entry.overrides:
+        override_start, override_end = event_bounds(override)
+        recurrence_id = to_epoch(override.decoded('recurrence-id'))
+        if overlaps(override_start, override_end, start, end) or start <= recurrence_id < end:
+            kept.append(override)
+    if len(kept) == len(entry.overrides):
+        return entry.resource
+    header, _, _ = entry.resource.partition(b'BEGIN:VEVENT')
+    return b''.join([header] + [c.to_ical() for c in [entry.component] + kept] + [RESOURCE_FOOTER])
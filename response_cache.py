@@ -0,0 +1,26 @@
+import os
+
+from bounded_cache import BoundedLRU
+from calendar_cache import content_etag
+
+# Nombre de réponses de découverte conservées (clé : chemin, profondeur, propriétés demandées, version)
+CACHE_SIZE = int(os.environ.get('CALDAV_RESPONSE_CACHE_SIZE', '1024'))
+
+
+# Corps de réponse déjà encodé, avec son ETag et sa longueur
+class CachedResponse:
+    __slots__ = ('body', 'etag', 'length')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = content_etag(body)
+        self.length = len(body)
+
+
+# Cache LRU borné des réponses construites une fois pour toutes
+class ResponseCache(BoundedLRU):
+    def __init__(self, maxsize=CACHE_SIZE):
+        super().__init__(maxsize)
+
+    def get(self, key, render):
+        return self.get_or_compute(key, lambda: CachedResponse(render()))
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# Les modules du serveur sont à la racine du dépôt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Construit une application neuve dans un répertoire de travail temporaire (les chemins du serveur sont
+# relatifs), avec calendar comme fichier utilisateur et le stockage demandé
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    import app2
+    from calendar_storage import default_storage_path
+
+    def make(calendar, backend='ics'):
+        (tmp_path / 'calendars' / 'user').mkdir(parents=True, exist_ok=True)
+        (tmp_path / 'calendars' / 'user' / 'event.ics').write_bytes(calendar)
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(app2, 'STORAGE_BACKEND', backend)
+        monkeypatch.setattr(app2, 'STORAGE_PATH', default_storage_path(backend, app2.ICS_FILE_PATH))
+        for name in ('user_file_watcher', 'calendar_storage', 'legacy_collection', 'collection_registry'):
+            monkeypatch.setattr(app2, name, None)
+        return app2.create_app()
+    return make
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import subprocess
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import app2
+from test_calendar_storage import zoned_event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+D = '{DAV:}'
+
+# Série hebdomadaire de 10 occurrences à partir du lundi 1er janvier 2024, et un événement isolé en juin
+CALENDAR = b'''BEGIN:VCALENDAR\r
+VERSION:2.0\r
+PRODID:-//Test//EN\r
+BEGIN:VEVENT\r
+UID:weekly\r
+DTSTAMP:20240101T000000Z\r
+DTSTART:20240101T100000Z\r
+DTEND:20240101T110000Z\r
+RRULE:FREQ=WEEKLY;COUNT=10\r
+SUMMARY:Point hebdomadaire\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:single\r
+DTSTAMP:20240101T000000Z\r
+DTSTART:20240615T090000Z\r
+DTEND:20240615T100000Z\r
+SUMMARY:Rendez-vous\r
+END:VEVENT\r
+END:VCALENDAR\r
+'''
+
+CALENDAR_QUERY = '''<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+<D:prop><D:getetag/></D:prop>
+<C:filter><C:comp-filter name="VCALENDAR"><C:comp-filter name="VEVENT">
+<C:time-range start="{}" end="{}"/>
+</C:comp-filter></C:comp-filter></C:filter>
+</C:calendar-query>'''
+
+SYNC_COLLECTION = '''<D:sync-collection xmlns:D="DAV:">
+<D:sync-token>{}</D:sync-token><D:sync-level>1</D:sync-level><D:prop><D:getetag/></D:prop>
+</D:sync-collection>'''
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app(CALENDAR).test_client()
+
+
+def request(client, method, path, body=None, **headers):
+    return client.open(path, method=method, data=body, headers=headers, buffered=True)
+
+
+def hrefs(response):
+    assert response.status_code == 207
+    return sorted(href.text for href in ET.fromstring(response.data).iter(f'{D}href'))
+
+
+def uids_in_range(client, start, end):
+    response = request(client, 'REPORT', '/calendar/', CALENDAR_QUERY.format(start, end), Depth='1')
+    return [href.rsplit('/', 1)[1][:-len('.ics')] for href in hrefs(response)]
+
+
+# GET dans un autre processus : relit le fichier écrit, sans l'instantané en cache de ce processus
+def get_in_new_process(path):
+    script = (f"import sys, json, app2\n"
+              f"r = app2.create_app().test_client().get({path!r}, buffered=True)\n"
+              f"print(json.dumps([r.status_code, r.headers.get('ETag'), r.get_data(as_text=True)]))\n")
+    env = dict(os.environ, PYTHONPATH=ROOT, CALDAV_LOG_LEVEL='ERROR')
+    output = subprocess.run([sys.executable, '-c', script], cwd=os.getcwd(), env=env,
+                            capture_output=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_put_get_round_trip_across_processes(client):
+    response = request(client, 'PUT', '/calendar/zoned-1.ics', zoned_event('zoned-1'),
+                       **{'Content-Type': 'text/calendar'})
+    assert response.status_code == 201
+    etag = response.headers['ETag']
+
+    local = request(client, 'GET', '/calendar/zoned-1.ics')
+    status, remote_etag, body = get_in_new_process('/calendar/zoned-1.ics')
+    assert status == 200
+    assert remote_etag == local.headers['ETag'] == etag
+    assert body == local.get_data(as_text=True)
+    assert 'BEGIN:VTIMEZONE' in body and 'TZID:Europe/Paris' in body
+
+
+def test_sync_collection_tokens(client):
+    initial = request(client, 'REPORT', '/calendar/', SYNC_COLLECTION.format(''))
+    assert hrefs(initial) == ['/calendar/single.ics', '/calendar/weekly.ics']
+    token = ET.fromstring(initial.data).findtext(f'{D}sync-token')
+
+    # Aucun changement depuis le jeton
+    assert hrefs(request(client, 'REPORT', '/calendar/', SYNC_COLLECTION.format(token))) == []
+
+    assert request(client, 'PUT', '/calendar/zoned-1.ics', zoned_event('zoned-1')).status_code == 201
+    assert request(client, 'DELETE', '/calendar/single.ics').status_code == 204
+    changes = request(client, 'REPORT', '/calendar/', SYNC_COLLECTION.format(token))
+    assert hrefs(changes) == ['/calendar/single.ics', '/calendar/zoned-1.ics']
+    statuses = {response.findtext(f'{D}href'): response.findtext(f'{D}status')
+                for response in ET.fromstring(changes.data).iter(f'{D}response')}
+    assert '404' in statuses['/calendar/single.ics']
+    assert ET.fromstring(changes.data).findtext(f'{D}sync-token') != token
+
+
+def test_sync_collection_invalid_token(client):
+    response = request(client, 'REPORT', '/calendar/', SYNC_COLLECTION.format('urn:syncroteam:sync:inconnu-1'))
+    assert response.status_code == 403
+    assert ET.fromstring(response.data).find(f'{D}valid-sync-token') is not None
+
+
+def test_unsupported_report(client):
+    response = request(client, 'REPORT', '/calendar/', '<D:expand-property xmlns:D="DAV:"/>')
+    assert response.status_code == 403
+    assert ET.fromstring(response.data).find(f'{D}supported-report') is not None
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    # Cinquième occurrence de la série (29 janvier)
+    ('20240129T000000Z', '20240130T000000Z', ['weekly']),
+    # Entre deux occurrences
+    ('20240103T000000Z', '20240104T000000Z', []),
+    # Après la dixième et dernière occurrence (4 mars)
+    ('20240305T000000Z', '20240601T000000Z', []),
+    ('20240101T000000Z', '20241231T000000Z', ['single', 'weekly']),
+])
+def test_time_range_with_recurring_events(client, start, end, expected):
+    assert uids_in_range(client, start, end) == expected
+
+
+def test_preconditions(client):
+    response = request(client, 'PUT', '/calendar/zoned-1.ics', zoned_event('zoned-1'), **{'If-None-Match': '*'})
+    assert response.status_code == 201
+    etag = response.headers['ETag']
+
+    # If-None-Match: * sur une ressource existante
+    assert request(client, 'PUT', '/calendar/zoned-1.ics', zoned_event('zoned-1'),
+                   **{'If-None-Match': '*'}).status_code == 412
+    assert request(client, 'PUT', '/calendar/zoned-1.ics', zoned_event('zoned-1', 'Autre'),
+                   **{'If-Match': '"perime"'}).status_code == 412
+    assert request(client, 'GET', '/calendar/zoned-1.ics', **{'If-None-Match': etag}).status_code == 304
+
+    response = request(client, 'PUT', '/calendar/zoned-1.ics', zoned_event('zoned-1', 'Autre'), **{'If-Match': etag})
+    assert response.status_code == 204
+    new_etag = response.headers['ETag']
+    assert new_etag != etag
+    assert request(client, 'GET', '/calendar/zoned-1.ics').headers['ETag'] == new_etag
+
+    assert request(client, 'DELETE', '/calendar/zoned-1.ics', **{'If-Match': etag}).status_code == 412
+    assert request(client, 'DELETE', '/calendar/zoned-1.ics', **{'If-Match': new_etag}).status_code == 204
+    assert request(client, 'GET', '/calendar/zoned-1.ics').status_code == 404
+
+
+def test_put_on_corrupt_calendar_is_refused(client):
+    source = os.path.join('calendars', 'user', 'event.ics')
+    truncated = CALENDAR[:CALENDAR.rindex(b'END:VCALENDAR')]
+    with open(source, 'wb') as f:
+        f.write(truncated)
+    assert request(client, 'PUT', '/calendar/zoned-1.ics', zoned_event('zoned-1'),
+                   **{'If-None-Match': '*'}).status_code == 409
+    assert request(client, 'DELETE', '/calendar/weekly.ics').status_code == 409
+    with open(source, 'rb') as f:
+        assert f.read() == truncated
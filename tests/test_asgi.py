@@ -0,0 +1,93 @@
+import asyncio
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import app2
+import asgi
+from calendar_storage import import_ics
+
+EVENTS = 300
+CALENDAR = (b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Test//EN\r\n'
+            + b''.join(f'BEGIN:VEVENT\r\nUID:event-{i}\r\nDTSTAMP:20240101T000000Z\r\n'
+                       f'DTSTART:2024{1 + i % 12:02d}{1 + i % 28:02d}T100000Z\r\n'
+                       f'DTEND:2024{1 + i % 12:02d}{1 + i % 28:02d}T110000Z\r\n'
+                       f'SUMMARY:Événement {i}\r\nEND:VEVENT\r\n'.encode('utf-8') for i in range(EVENTS))
+            + b'END:VCALENDAR\r\n')
+
+
+# Appel ASGI minimal : corps de requête en un message, messages envoyés collectés
+async def call(adapter, method, path, body=b'', headers=()):
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        # Client lent : laisse les autres requêtes avancer entre deux morceaux
+        await asyncio.sleep(0)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]}
+    await adapter(scope, receive, send)
+    assert sent[0]['type'] == 'http.response.start'
+    assert not sent[-1].get('more_body', False)
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+
+@pytest.fixture
+def adapter(make_app):
+    app = make_app(CALENDAR, backend='sqlite')
+    import_ics(app2.USER_ICS_FILE, app2.calendar_storage)
+    adapter = asgi.WsgiToAsgi(app, max_workers=8)
+    yield adapter
+    adapter.executor.shutdown(wait=True)
+
+
+def test_concurrent_multistatus_streams_on_sqlite(adapter):
+    propfind = ('PROPFIND', '/calendar/', b'', [('Depth', '1')])
+    report = ('REPORT', '/calendar/', b'<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">'
+              b'<D:prop><D:getetag/><C:calendar-data/></D:prop></C:calendar-query>', [('Depth', '1')])
+
+    async def run():
+        return await asyncio.gather(*(call(adapter, *(propfind if i % 2 else report)) for i in range(12)))
+
+    for status, body in asyncio.run(run()):
+        assert status == 207
+        hrefs = [href.text for href in ET.fromstring(body).iter('{DAV:}href')]
+        assert len([href for href in hrefs if href.endswith('.ics')]) == EVENTS
+
+
+def test_lifespan_shutdown(adapter):
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(adapter({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+def test_client_gone_mid_stream_releases_worker(adapter):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+        if len(sent) == 3:
+            raise ConnectionResetError("client parti")
+
+    scope = {'type': 'http', 'method': 'PROPFIND', 'path': '/calendar/', 'query_string': b'',
+             'headers': [(b'depth', b'1')]}
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(adapter(scope, receive, send))
+    # Le thread de traitement a terminé : le pool peut s'arrêter sans attendre
+    adapter.executor.shutdown(wait=True)
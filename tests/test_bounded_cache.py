@@ -0,0 +1,29 @@
+from bounded_cache import BoundedLRU
+from response_cache import ResponseCache
+
+
+def test_least_recently_used_is_evicted():
+    cache = BoundedLRU(2)
+    cache.get_or_compute('a', lambda: 1)
+    cache.get_or_compute('b', lambda: 2)
+    # 'a' redevient le plus récent : 'b' est évincé à l'ajout de 'c'
+    assert cache.get_or_compute('a', lambda: None) == 1
+    cache.get_or_compute('c', lambda: 3)
+    assert len(cache) == 2
+    assert cache.get_or_compute('b', lambda: 'recalculé') == 'recalculé'
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_none_values_are_cached():
+    cache = BoundedLRU(4)
+    calls = []
+    for _ in range(2):
+        cache.get_or_compute('k', lambda: calls.append(1))
+    assert calls == [1]
+
+
+def test_response_cache_renders_once():
+    cache = ResponseCache(maxsize=4)
+    first = cache.get('key', lambda: b'<multistatus/>')
+    assert cache.get('key', lambda: b'autre') is first
+    assert first.length == len(b'<multistatus/>')
@@ -0,0 +1,19 @@
+import pytest
+
+from caldav_query import parse_report, UnsupportedReport
+
+
+def test_known_reports():
+    body = b'<D:sync-collection xmlns:D="DAV:"><D:sync-token>abc</D:sync-token></D:sync-collection>'
+    report = parse_report(body)
+    assert report.kind == 'sync-collection'
+    assert report.sync_token == 'abc'
+
+
+@pytest.mark.parametrize('body', [
+    b'<D:expand-property xmlns:D="DAV:"/>',
+    b'<C:calendar-query xmlns:C="urn:example:other"/>',
+])
+def test_unsupported_report(body):
+    with pytest.raises(UnsupportedReport):
+        parse_report(body)
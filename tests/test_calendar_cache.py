@@ -0,0 +1,46 @@
+from calendar_cache import (CalendarSnapshot, CalendarCache, content_etag, write_index, RESOURCE_HEADER,
+                            RESOURCE_FOOTER)
+from test_calendar_storage import VTIMEZONE
+
+PLAIN = (b'BEGIN:VEVENT\r\nUID:plain\r\nDTSTAMP:20240101T000000Z\r\nDTSTART:20240101T100000Z\r\n'
+         b'DTEND:20240101T110000Z\r\nSUMMARY:Sans fuseau\r\nEND:VEVENT\r\n')
+ZONED = (b'BEGIN:VEVENT\r\nUID:zoned\r\nDTSTAMP:20240101T000000Z\r\nDTSTART;TZID=Europe/Paris:20240305T100000\r\n'
+         b'DTEND;TZID=Europe/Paris:20240305T110000\r\nSUMMARY:Avec fuseau\r\nEND:VEVENT\r\n')
+DATA = b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Test//EN\r\n' + VTIMEZONE + PLAIN + ZONED + b'END:VCALENDAR\r\n'
+
+
+def test_entries_point_into_the_file_without_parsing():
+    snapshot = CalendarSnapshot.from_bytes(None, DATA)
+    plain, zoned = snapshot.events
+    assert plain._source is DATA and plain.ical == PLAIN
+    assert zoned._source is DATA and zoned.ical == ZONED
+    # Aucun composant icalendar n'est construit pour lister ou indexer
+    assert plain._parsed is None and zoned._parsed is None
+
+
+def test_resource_is_byte_exact():
+    plain, zoned = CalendarSnapshot.from_bytes(None, DATA).events
+    assert plain.resource == RESOURCE_HEADER + PLAIN + RESOURCE_FOOTER
+    # Les VTIMEZONE ne sont joints qu'aux événements qui ont un TZID
+    assert zoned.resource == RESOURCE_HEADER + VTIMEZONE + ZONED + RESOURCE_FOOTER
+    assert plain.etag == content_etag(plain.resource)
+    assert zoned.etag == content_etag(zoned.resource)
+    # L'analyse à la demande ne modifie ni les octets ni l'ETag
+    assert str(zoned.component.get('summary')) == 'Avec fuseau'
+    assert zoned.resource == RESOURCE_HEADER + VTIMEZONE + ZONED + RESOURCE_FOOTER
+
+
+def test_prebuilt_index_round_trip(tmp_path, monkeypatch):
+    path = tmp_path / 'event.ics'
+    path.write_bytes(DATA)
+    parsed = CalendarSnapshot.from_bytes(None, DATA)
+    write_index(str(tmp_path / 'event.index'), parsed, DATA)
+
+    # Chargement depuis l'index seul, sans analyse du fichier
+    def no_parse(*args, **kwargs):
+        raise AssertionError("analyse inattendue")
+    monkeypatch.setattr(CalendarSnapshot, 'from_bytes', no_parse)
+    loaded = CalendarCache(str(path), index_path=str(tmp_path / 'event.index')).get()
+    assert [(entry.uid, entry.etag, entry.resource) for entry in loaded.events] == \
+        [(entry.uid, entry.etag, entry.resource) for entry in parsed.events]
+    assert loaded.ctag == parsed.ctag
@@ -0,0 +1,73 @@
+import pytest
+
+from calendar_collections import CollectionRegistry, valid_name
+from calendar_storage import entry_from_calendar
+from test_calendar_storage import zoned_event
+
+
+def registry(tmp_path, backend='ics', **limits):
+    return CollectionRegistry(str(tmp_path / 'users'), backend, **limits)
+
+
+# Collection créée et chargée avec un événement, pour que son estimation mémoire ne soit pas nulle
+def load(registry, name, uid=None):
+    collection = registry.get('alice', name, create=True)
+    if uid is not None:
+        collection.storage.put(entry_from_calendar(zoned_event(uid)))
+    collection.view()
+    return collection
+
+
+def resident(registry):
+    return [name for _, name in registry._resident]
+
+
+def test_least_recently_used_collection_is_evicted(tmp_path):
+    reg = registry(tmp_path, max_resident=2)
+    load(reg, 'travail')
+    load(reg, 'perso')
+    # travail redevient la plus récente : perso est libérée à l'arrivée de sport
+    reg.get('alice', 'travail')
+    load(reg, 'sport')
+    assert resident(reg) == ['travail', 'sport']
+    assert reg.stats()['evictions'] == 1
+
+
+@pytest.mark.parametrize('backend', ['ics', 'directory'])
+def test_memory_budget_keeps_current_collection(tmp_path, backend):
+    reg = registry(tmp_path, backend, memory_budget=1)
+    load(reg, 'travail', 'ev-1')
+    load(reg, 'perso', 'ev-2')
+    # Le budget est dépassé par chaque collection : seule celle en cours d'utilisation reste chargée
+    assert resident(reg) == ['perso']
+    assert reg.get('alice', 'travail').view().get('ev-1') is not None
+    assert resident(reg) == ['travail']
+    assert reg.stats()['loads'] == 3
+
+
+# SQLite ne garde rien en mémoire entre deux requêtes : ses collections ne comptent pas dans le budget
+def test_sqlite_collections_are_not_evicted_by_memory(tmp_path):
+    reg = registry(tmp_path, 'sqlite', memory_budget=1)
+    load(reg, 'travail', 'ev-1')
+    load(reg, 'perso', 'ev-2')
+    assert resident(reg) == ['travail', 'perso']
+
+
+def test_sync_token_survives_eviction(tmp_path):
+    reg = registry(tmp_path, max_resident=1)
+    collection = load(reg, 'travail', 'ev-1')
+    token = collection.sync_token(collection.view())
+    collection.storage.put(entry_from_calendar(zoned_event('ev-2')))
+    load(reg, 'perso')
+    assert resident(reg) == ['perso']
+
+    reloaded = reg.get('alice', 'travail')
+    assert reloaded is not collection
+    reloaded.view()
+    assert reloaded.journal.changes_since(token) == {'ev-2': True}
+
+
+@pytest.mark.parametrize('name, valid', [('travail', True), ('../etc', False), ('cal.ics', False),
+                                         ('a.journal', False), ('', False)])
+def test_valid_name(name, valid):
+    assert valid_name(name) == valid
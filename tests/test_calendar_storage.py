@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from calendar_storage import (IcsFileStorage, StoredEvent, entry_from_calendar, open_storage, default_storage_path,
+                              PreconditionFailed, CalendarUnreadable)
+from change_journal import InvalidSyncToken
+
+VTIMEZONE = b'''BEGIN:VTIMEZONE\r
+TZID:Europe/Paris\r
+BEGIN:STANDARD\r
+DTSTART:19701025T030000\r
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU\r
+TZOFFSETFROM:+0200\r
+TZOFFSETTO:+0100\r
+END:STANDARD\r
+BEGIN:DAYLIGHT\r
+DTSTART:19700329T020000\r
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU\r
+TZOFFSETFROM:+0100\r
+TZOFFSETTO:+0200\r
+END:DAYLIGHT\r
+END:VTIMEZONE\r
+'''
+
+
+def zoned_event(uid, summary='Réunion'):
+    return (b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Test//EN\r\n' + VTIMEZONE
+            + f'BEGIN:VEVENT\r\nUID:{uid}\r\nDTSTAMP:20240101T000000Z\r\n'
+              f'DTSTART;TZID=Europe/Paris:20240305T100000\r\nDTEND;TZID=Europe/Paris:20240305T110000\r\n'
+              f'SUMMARY:{summary}\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n'.encode('utf-8'))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'event.ics')
+
+
+def test_put_keeps_vtimezone_on_disk(path):
+    storage = IcsFileStorage(path)
+    created, etag = storage.put(entry_from_calendar(zoned_event('zoned-1')))
+    assert created
+
+    with open(path, 'rb') as f:
+        assert f.read().count(b'BEGIN:VTIMEZONE') == 1
+    # Nouvelle instance : le fichier est réanalysé comme par un autre processus
+    reread = IcsFileStorage(path).view().get('zoned-1')
+    assert reread.etag == etag == storage.view().get('zoned-1').etag
+    assert b'TZID:Europe/Paris' in reread.resource
+    assert reread.resource == storage.view().get('zoned-1').resource
+
+
+def test_put_does_not_duplicate_known_timezone(path):
+    storage = IcsFileStorage(path)
+    storage.put(entry_from_calendar(zoned_event('zoned-1')))
+    _, etag = storage.put(entry_from_calendar(zoned_event('zoned-2')))
+    with open(path, 'rb') as f:
+        assert f.read().count(b'BEGIN:VTIMEZONE') == 1
+    assert IcsFileStorage(path).view().get('zoned-2').etag == etag
+
+
+def test_put_preconditions(path):
+    storage = IcsFileStorage(path)
+    _, etag = storage.put(entry_from_calendar(zoned_event('zoned-1')), if_none_match=['*'])
+    with pytest.raises(PreconditionFailed):
+        storage.put(entry_from_calendar(zoned_event('zoned-1')), if_none_match=['*'])
+    with pytest.raises(PreconditionFailed):
+        storage.put(entry_from_calendar(zoned_event('zoned-1', 'Autre')), if_match=['perime'])
+    created, new_etag = storage.put(entry_from_calendar(zoned_event('zoned-1', 'Autre')), if_match=[etag])
+    assert not created and new_etag != etag
+
+
+# Fichier sans END:VCALENDAR final : illisible, mais ses événements ne doivent pas être perdus
+TRUNCATED = (b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'
+             + b''.join(f'BEGIN:VEVENT\r\nUID:ev-{i}\r\nDTSTART:20240101T100000Z\r\nEND:VEVENT\r\n'.encode()
+                        for i in range(3)))
+
+
+@pytest.mark.parametrize('write', [
+    lambda storage: storage.put(entry_from_calendar(zoned_event('zoned-1'))),
+    lambda storage: storage.put(entry_from_calendar(zoned_event('zoned-1')), if_none_match=['*']),
+    lambda storage: storage.delete('ev-0'),
+])
+def test_corrupt_file_is_never_rewritten(path, write):
+    with open(path, 'wb') as f:
+        f.write(TRUNCATED)
+    storage = IcsFileStorage(path)
+    # Les lectures se replient sur un calendrier vide
+    assert storage.view().events == []
+    with pytest.raises(CalendarUnreadable):
+        write(storage)
+    with open(path, 'rb') as f:
+        assert f.read() == TRUNCATED
+
+
+@pytest.mark.parametrize('backend', ['directory', 'sqlite'])
+def test_replace_all_excludes_concurrent_writes(tmp_path, backend):
+    storage = open_storage(backend, default_storage_path(backend, str(tmp_path / 'event.ics')))
+    storage.put(entry_from_calendar(zoned_event('before')))
+    token = storage.journal.token(storage.journal.observe(storage.view()))
+    importing, release = threading.Event(), threading.Event()
+
+    # Import lent : l'écriture concurrente doit attendre qu'il soit terminé et journalisé
+    def entries():
+        importing.set()
+        release.wait(5)
+        yield StoredEvent.from_entry(entry_from_calendar(zoned_event('imported')))
+
+    importer = threading.Thread(target=storage.replace_all, args=(entries(),))
+    importer.start()
+    importing.wait(5)
+    writer = threading.Thread(target=storage.put, args=(entry_from_calendar(zoned_event('written')),))
+    writer.start()
+    writer.join(0.2)
+    assert writer.is_alive()
+    release.set()
+    importer.join(5)
+    writer.join(5)
+
+    view = storage.view()
+    assert sorted(uid for uid, _ in view.etags()) == ['imported', 'written']
+    # L'import a invalidé les jetons antérieurs ; l'écriture suivante est journalisée après lui
+    with pytest.raises(InvalidSyncToken):
+        storage.journal.changes_since(token)
+    assert storage.journal.changes_since(storage.journal.token(storage.journal.revision - 1)) == {'written': True}
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+import change_journal
+from change_journal import ChangeJournal, InvalidSyncToken, ADDED, MODIFIED
+
+
+def _write(journal, count, start=0):
+    for i in range(start, start + count):
+        journal.record(f'ctag-{i}', [(f'uid-{i % 3}', ADDED if i < 3 else MODIFIED, f'etag-{i}')])
+
+
+def test_changes_since(tmp_path):
+    journal = ChangeJournal(str(tmp_path / 'event.journal'))
+    _write(journal, 2)
+    token = journal.token()
+    _write(journal, 1, start=2)
+    assert journal.changes_since(token) == {'uid-2': True}
+    assert journal.changes_since(journal.token()) == {}
+
+
+def test_compaction_by_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_journal, 'MAX_RECORDS', 10)
+    journal = ChangeJournal(str(tmp_path / 'event.journal'))
+    _write(journal, 1)
+    old_token = journal.token()
+    _write(journal, 10, start=1)
+    recent_token = journal.token(journal.revision - 2)
+
+    with open(journal.path) as f:
+        assert len(f.readlines()) <= 10
+    # Jeton antérieur au compactage : resynchronisation complète (DAV:valid-sync-token)
+    with pytest.raises(InvalidSyncToken):
+        journal.changes_since(old_token)
+    assert journal.changes_since(recent_token) == {'uid-0': True, 'uid-1': True}
+
+
+def test_compaction_by_age(tmp_path, monkeypatch):
+    journal = ChangeJournal(str(tmp_path / 'event.journal'))
+    _write(journal, 3)
+    old_token = journal.token(1)
+    # Vieillit les révisions existantes
+    with open(journal.path) as f:
+        records = [json.loads(line) for line in f]
+    with open(journal.path, 'w') as f:
+        for record in records:
+            record['time'] -= change_journal.MAX_AGE + 1
+            f.write(json.dumps(record) + '\n')
+
+    _write(journal, 1, start=3)
+    with pytest.raises(InvalidSyncToken):
+        journal.changes_since(old_token)
+    assert journal.changes_since(journal.token(3)) == {'uid-0': True}
+
+
+def test_compaction_seen_by_other_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_journal, 'MAX_RECORDS', 4)
+    path = str(tmp_path / 'event.journal')
+    writer, reader = ChangeJournal(path), ChangeJournal(path)
+    _write(writer, 1)
+    reader.record('ctag-reader', [])
+    _write(writer, 5, start=1)
+    reader.record('ctag-reader-2', [('uid-9', ADDED, 'etag-9')])
+    token = reader.token(reader.revision - 1)
+    assert reader.changes_since(token) == {'uid-9': True}
+    with pytest.raises(InvalidSyncToken):
+        reader.changes_since(reader.token(1))
+
+
+# Vue minimale d'une collection : CTag et couples (UID, ETag)
+class Snapshot:
+    def __init__(self, etags):
+        self._etags = dict(etags)
+        self.ctag = ','.join(f'{uid}={etag}' for uid, etag in sorted(self._etags.items()))
+
+    def etags(self):
+        return iter(self._etags.items())
+
+
+def test_revert_seen_by_other_worker(tmp_path):
+    path = str(tmp_path / 'event.journal')
+    first, second = ChangeJournal(path), ChangeJournal(path)
+    a, b = Snapshot({'x': '1'}), Snapshot({'x': '2'})
+    first.observe(a)
+    second.observe(a)
+    # Modification externe puis retour à l'état initial, vus par le second processus seulement
+    second.observe(b)
+    second.observe(a)
+    token = second.token()
+
+    # Le premier processus voit de nouveau A : sa révision doit suivre celle du journal
+    assert first.observe(a) == second.revision
+    assert first.changes_since(token) == {}
+    assert first.changes_since(second.token(1)) == {'x': True}
+
+
+def test_token_from_newer_revision_of_other_worker(tmp_path):
+    path = str(tmp_path / 'event.journal')
+    first, second = ChangeJournal(path), ChangeJournal(path)
+    first.observe(Snapshot({'x': '1'}))
+    second.observe(Snapshot({'x': '1', 'y': '1'}))
+    assert first.changes_since(second.token()) == {}
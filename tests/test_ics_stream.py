@@ -0,0 +1,88 @@
+import pytest
+
+from calendar_cache import CalendarSnapshot
+from ics_stream import iter_components
+
+
+def calendar(*lines, newline='\r\n', prefix=b''):
+    lines = ('BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Test//EN') + lines + ('END:VCALENDAR',)
+    return prefix + ''.join(line + newline for line in lines).encode('utf-8')
+
+
+EVENT = ('BEGIN:VEVENT', 'UID:a', 'DTSTAMP:20240101T000000Z', 'DTSTART:20240101T100000Z',
+         'DTEND:20240101T110000Z', 'END:VEVENT')
+
+
+@pytest.mark.parametrize('prefix', [b'\xef\xbb\xbf', b'\r\n\r\n', b'\xef\xbb\xbf\r\n'])
+def test_bom_and_leading_blank_lines(prefix):
+    snapshot = CalendarSnapshot.from_bytes(None, calendar(*EVENT, prefix=prefix))
+    assert [(entry.uid, entry.start) for entry in snapshot.events] == [('a', 1704103200.0)]
+    # L'en-tête est conservé tel quel pour les réécritures
+    assert snapshot.shell.startswith(prefix)
+
+
+def test_mixed_line_endings():
+    data = calendar(*EVENT[:3], newline='\n').replace(b'END:VCALENDAR\n', b'')
+    data += ''.join(line + '\r\n' for line in EVENT[3:] + ('END:VCALENDAR',)).encode('ascii')
+    [entry] = CalendarSnapshot.from_bytes(None, data).events
+    assert entry.uid == 'a' and entry.end == 1704106800.0
+    # La ressource est normalisée en CRLF
+    assert entry.resource.count(b'\n') == entry.resource.count(b'\r\n')
+    assert b'UID:a\r\n' in entry.resource
+
+
+@pytest.mark.parametrize('data', [
+    # END:VALARM et END:VEVENT inversés : refusé par la lecture en flux, accepté par icalendar
+    calendar(*EVENT[:-1], 'BEGIN:VALARM', 'ACTION:DISPLAY', 'TRIGGER:-PT5M', 'END:VEVENT', 'END:VALARM'),
+    # Espace avant BEGIN:VCALENDAR
+    b' ' + calendar(*EVENT),
+])
+def test_falls_back_to_icalendar(data):
+    with pytest.raises(ValueError):
+        list(iter_components(data))
+    [entry] = CalendarSnapshot.from_bytes(None, data).events
+    assert entry.uid == 'a' and entry.start == 1704103200.0
+
+
+def test_unreadable_file_raises():
+    with pytest.raises(ValueError):
+        CalendarSnapshot.from_bytes(None, calendar(*EVENT)[:-len('END:VCALENDAR\r\n')])
+
+
+def test_folded_lines():
+    data = calendar('BEGIN:VEVENT', 'UID:une-uid-tres-', ' longue', 'DTSTAMP:20240101T000000Z',
+                    'DTSTART;TZID=Europe/', '\tParis:20240305T100000', 'DURATION:PT1', ' H', 'END:VEVENT')
+    [component] = list(iter_components(data))
+    assert component.fields['UID'] == ':une-uid-tres-longue'
+    [entry] = CalendarSnapshot.from_bytes(None, data).events
+    assert entry.uid == 'une-uid-tres-longue'
+    # 10h à Paris en mars (UTC+1), une heure
+    assert (entry.start, entry.end) == (1709629200.0, 1709632800.0)
+
+
+def test_nested_valarm_properties_are_ignored():
+    data = calendar('BEGIN:VEVENT', 'BEGIN:VALARM', 'UID:alarme', 'ACTION:DISPLAY', 'TRIGGER:-PT5M',
+                    'DTSTART:19990101T000000Z', 'END:VALARM', 'UID:a', 'DTSTAMP:20240101T000000Z',
+                    'DTSTART:20240101T100000Z', 'DTEND:20240101T110000Z', 'END:VEVENT')
+    [component] = list(iter_components(data))
+    assert component.name == 'VEVENT'
+    assert data[component.start:component.end].endswith(b'END:VEVENT\r\n')
+    [entry] = CalendarSnapshot.from_bytes(None, data).events
+    assert (entry.uid, entry.start, entry.end) == ('a', 1704103200.0, 1704106800.0)
+    assert b'BEGIN:VALARM' in entry.resource
+
+
+def test_duplicate_uid_overrides_form_one_resource():
+    master = ('BEGIN:VEVENT', 'UID:serie', 'DTSTAMP:20240101T000000Z', 'DTSTART:20240101T100000Z',
+              'DTEND:20240101T110000Z', 'RRULE:FREQ=DAILY;COUNT=3', 'END:VEVENT')
+    override = ('BEGIN:VEVENT', 'UID:serie', 'DTSTAMP:20240101T000000Z', 'RECURRENCE-ID:20240102T100000Z',
+                'DTSTART:20231231T080000Z', 'DTEND:20231231T090000Z', 'END:VEVENT')
+    # Exception séparée de sa série par un autre événement
+    snapshot = CalendarSnapshot.from_bytes(None, calendar(*master, *EVENT, *override))
+    assert [entry.uid for entry in snapshot.events] == ['serie', 'a']
+    entry = snapshot.get('serie')
+    # L'exception déplacée avant la série élargit les bornes
+    assert entry.start == 1704009600.0
+    assert entry.ical == ''.join(line + '\r\n' for line in master + override).encode('ascii')
+    assert [override.get('recurrence-id') is not None for override in entry.overrides] == [True]
+    assert entry.component.get('rrule') is not None
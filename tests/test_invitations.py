@@ -0,0 +1,106 @@
+import time
+import smtplib
+import threading
+
+import pytest
+
+import invitations
+from invitations import SmtpSettings, EncodedInvitation, InvitationDispatcher
+
+
+# Serveur SMTP factice : compte les connexions ouvertes simultanément et les envois en cours
+class FakeSMTP:
+    lock = threading.Lock()
+    instances = []
+    open_now = 0
+    max_open = 0
+    sending_now = 0
+    max_sending = 0
+    # Nombre de connexions à couper au prochain envoi
+    drops = 0
+
+    def __init__(self, host, port, timeout=None):
+        cls = type(self)
+        self.sent = []
+        self.closed = False
+        self.logged_in = False
+        with cls.lock:
+            cls.instances.append(self)
+            cls.open_now += 1
+            cls.max_open = max(cls.max_open, cls.open_now)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        self.logged_in = True
+
+    def sendmail(self, sender, recipients, message):
+        cls = type(self)
+        with cls.lock:
+            if cls.drops:
+                cls.drops -= 1
+                raise smtplib.SMTPServerDisconnected("connexion coupée")
+            cls.sending_now += 1
+            cls.max_sending = max(cls.max_sending, cls.sending_now)
+        time.sleep(0.002)
+        self.sent.extend(recipients)
+        with cls.lock:
+            cls.sending_now -= 1
+
+    def close(self):
+        cls = type(self)
+        with cls.lock:
+            if not self.closed:
+                self.closed = True
+                cls.open_now -= 1
+
+    def quit(self):
+        self.close()
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    fake = type('Server', (FakeSMTP,), {'instances': [], 'lock': threading.Lock()})
+    monkeypatch.setattr(invitations.smtplib, 'SMTP', fake)
+    return fake
+
+
+def dispatch(count, pool_size=4):
+    settings = SmtpSettings('smtp.example.com', username='user', password='secret', sender='agenda@example.com')
+    invitation = EncodedInvitation(b'BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n', 'Invitation', 'Bonjour')
+    dispatcher = InvitationDispatcher(settings, pool_size=pool_size, rate=0, backoff=0)
+    try:
+        return dispatcher.dispatch([f'user{i}@example.com' for i in range(count)], [invitation])
+    finally:
+        dispatcher.close()
+
+
+def test_connections_are_reused_and_capped(smtp):
+    report = dispatch(50)
+    assert report.sent == 50 and not report.failed
+    # Une connexion authentifiée par thread d'envoi au plus, réutilisée pour tous les messages
+    assert report.connections == len(smtp.instances) <= 4
+    assert all(connection.logged_in for connection in smtp.instances)
+    assert smtp.max_open <= 4 and smtp.max_sending <= 4
+    assert sum(len(connection.sent) for connection in smtp.instances) == 50
+    # close() termine les connexions du pool
+    assert smtp.open_now == 0
+
+
+def test_dropped_connection_is_replaced(smtp):
+    smtp.drops = 1
+    report = dispatch(20, pool_size=2)
+    assert report.sent == 20 and not report.failed
+    dropped = [connection for connection in smtp.instances if not connection.sent]
+    assert len(dropped) == 1 and dropped[0].closed
+    # La connexion coupée est remplacée, sans dépasser la taille du pool
+    assert len(smtp.instances) <= 3 and smtp.max_open <= 2
+
+
+def test_permanent_error_is_reported(smtp, monkeypatch):
+    def refuse(self, sender, recipients, message):
+        raise smtplib.SMTPRecipientsRefused({recipients[0]: (550, b'inconnu')})
+    monkeypatch.setattr(smtp, 'sendmail', refuse)
+    report = dispatch(3, pool_size=1)
+    assert report.sent == 0 and len(report.failed) == 3
@@ -0,0 +1,75 @@
+import io
+import json
+import queue
+import logging
+from logging.handlers import QueueListener
+
+from logging_config import DroppingQueueHandler, JsonFormatter
+
+
+def _log_through_queue(emit):
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    handler = DroppingQueueHandler(queue.Queue(100))
+    listener = QueueListener(handler.queue, output)
+    logger = logging.getLogger('test-logging-config')
+    logger.propagate = False
+    logger.addHandler(handler)
+    listener.start()
+    try:
+        emit(logger)
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_exception_reaches_json_formatter():
+    def emit(logger):
+        try:
+            raise RuntimeError("échec")
+        except RuntimeError:
+            logger.exception("Erreur pendant %s", 'la requête')
+
+    [entry] = _log_through_queue(emit)
+    assert entry['message'] == 'Erreur pendant la requête'
+    assert 'RuntimeError: échec' in entry['exception']
+
+
+def test_mutable_arguments_are_captured_when_logged():
+    def emit(logger):
+        state = ['avant']
+        logger.warning("État %s", state)
+        state[0] = 'après'
+
+    [entry] = _log_through_queue(emit)
+    assert entry['message'] == "État ['avant']"
+
+
+def test_full_queue_drops():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    record = logging.LogRecord('x', logging.INFO, __file__, 1, 'message', None, None)
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.dropped == 1
+
+
+def test_configure_logging_keeps_host_handlers(monkeypatch):
+    import logging_config
+    monkeypatch.setattr(logging_config, '_listener', None)
+    monkeypatch.setattr(logging_config, '_handler', None)
+    root = logging.getLogger()
+    host = logging.NullHandler()
+    previous = DroppingQueueHandler(queue.Queue(1))
+    saved = list(root.handlers)
+    root.addHandler(host)
+    root.addHandler(previous)
+    try:
+        logging_config.configure_logging(stream=io.StringIO())
+        assert host in root.handlers
+        assert previous not in root.handlers
+        assert logging_config._handler in root.handlers
+    finally:
+        logging_config.stop_logging()
+        root.handlers[:] = saved
@@ -0,0 +1,15 @@
+from flask import Flask
+
+import metrics
+
+
+def test_profiler_starts_with_app_not_on_import(monkeypatch):
+    assert not metrics.profiler.running
+    monkeypatch.setattr(metrics, 'PROFILE_ENABLED', True)
+    monkeypatch.setattr(metrics, 'profiler', metrics.SamplingProfiler(interval=0.001))
+    metrics.instrument_app(Flask(__name__))
+    try:
+        assert metrics.profiler.running
+    finally:
+        metrics.profiler.stop()
+    assert not metrics.profiler.running
@@ -0,0 +1,25 @@
+from collections import namedtuple
+
+from time_range import IntervalIndex, LONG_SPAN
+
+Entry = namedtuple('Entry', 'uid start end')
+DAY = 86400
+
+
+def test_overlapping_sorted_with_long_event_first():
+    # L'événement long commence avant tous les autres mais est rangé à part dans l'index
+    long_event = Entry('long', 0, 2 * LONG_SPAN)
+    index = IntervalIndex([
+        Entry('b', 10 * DAY, 10 * DAY + 3600),
+        long_event,
+        Entry('a', 5 * DAY, 5 * DAY + 3600),
+        Entry('later-long', 8 * DAY, 8 * DAY + 2 * LONG_SPAN),
+    ])
+    result = index.overlapping(0, 20 * DAY)
+    assert [entry.uid for entry in result] == ['long', 'a', 'later-long', 'b']
+
+
+def test_overlapping_excludes_outside_range():
+    index = IntervalIndex([Entry('a', 0, 3600), Entry('long', 0, 2 * LONG_SPAN)])
+    assert [entry.uid for entry in index.overlapping(2 * LONG_SPAN, 3 * LONG_SPAN)] == []
+    assert [entry.uid for entry in index.overlapping(7200, 10800)] == ['long']
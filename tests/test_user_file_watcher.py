@@ -0,0 +1,62 @@
+import time
+import threading
+
+from user_file_watcher import UserFileWatcher
+
+
+# Copie lente : laisse aux autres requêtes le temps d'arriver pendant la synchro
+def _slow_copy(watcher, delay=0.2):
+    copy = watcher._atomic_copy
+
+    def slow():
+        time.sleep(delay)
+        copy()
+    watcher._atomic_copy = slow
+
+
+# Les requêtes concurrentes arrivées pendant une copie ne doivent jamais lire l'ancienne cible
+def _assert_concurrent_readers_see_new_content(watcher, source, target):
+    source.write_bytes(b'nouveau')
+    _slow_copy(watcher)
+    seen = []
+    barrier = threading.Barrier(20)
+
+    def request():
+        barrier.wait()
+        watcher.sync_if_changed()
+        seen.append(target.read_bytes())
+
+    threads = [threading.Thread(target=request) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == [b'nouveau'] * 20
+    assert watcher.syncs_performed == 2
+
+
+def test_inotify_readers_wait_for_pending_sync(tmp_path):
+    source, target = tmp_path / 'user.ics', tmp_path / 'copie' / 'event.ics'
+    source.write_bytes(b'ancien')
+    watcher = UserFileWatcher(str(source), str(target))
+    assert watcher.sync_if_changed()
+    # Simule le thread inotify : un changement signalé, pas encore recopié
+    watcher.mode = 'inotify'
+    watcher._changes += 1
+    _assert_concurrent_readers_see_new_content(watcher, source, target)
+    watcher.sync_if_changed()
+    assert watcher.syncs_performed == 2
+
+
+def test_polling_readers_wait_for_pending_sync(tmp_path):
+    source, target = tmp_path / 'user.ics', tmp_path / 'copie' / 'event.ics'
+    source.write_bytes(b'ancien')
+    watcher = UserFileWatcher(str(source), str(target), poll_interval=0)
+    assert watcher.sync_if_changed()
+    _assert_concurrent_readers_see_new_content(watcher, source, target)
+
+
+def test_missing_source(tmp_path):
+    watcher = UserFileWatcher(str(tmp_path / 'absent.ics'), str(tmp_path / 'event.ics'))
+    assert not watcher.sync_if_changed()
+    assert watcher.syncs_performed == 0
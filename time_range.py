@@ -0,0 +1,86 @@
+import math
+import bisect
+import heapq
+from datetime import date, datetime, timedelta, timezone
+
+# Au-delà de cette durée, un événement est rangé à part pour ne pas élargir les recherches
+LONG_SPAN = 31 * 86400
+
+
+# Convertit une valeur DATE / DATE-TIME en secondes epoch UTC
+# (les dates et heures flottantes sont interprétées en UTC)
+def to_epoch(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp()
+    raise TypeError(f"Valeur de date inattendue: {value!r}")
+
+
+# Analyse un horodatage CalDAV du type 20060104T000000Z
+def parse_utc(text):
+    return datetime.strptime(text.strip(), '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc).timestamp()
+
+
+# Bornes [début, fin) d'un VEVENT selon les règles de la RFC 4791 (section 9.9)
+def event_bounds(component):
+    if 'dtstart' not in component:
+        return (-math.inf, math.inf)
+    dtstart = component.decoded('dtstart')
+    start = to_epoch(dtstart)
+
+    # Les événements récurrents s'étendent jusqu'à la fin de leur série
+    if 'rrule' in component or 'rdate' in component:
+        return (start, math.inf)
+
+    if 'dtend' in component:
+        end = to_epoch(component.decoded('dtend'))
+    elif 'duration' in component:
+        duration = component.decoded('duration')
+        end = start + (duration.total_seconds() if isinstance(duration, timedelta) else 0)
+    elif not isinstance(dtstart, datetime):
+        end = start + 86400
+    else:
+        end = start
+    return (start, max(start, end))
+
+
+# Test de chevauchement ; un événement instantané est inclus si start <= début < end
+def overlaps(event_start, event_end, start, end):
+    if event_end > event_start:
+        return event_start < end and event_end > start
+    return start <= event_start < end
+
+
+# Index d'intervalles : débuts triés + durée maximale, et liste à part pour les événements longs
+class IntervalIndex:
+    __slots__ = ('starts', 'entries', 'max_span', 'long_entries')
+
+    def __init__(self, entries):
+        short = []
+        self.long_entries = []
+        self.max_span = 0.0
+        for entry in entries:
+            span = entry.end - entry.start
+            if span > LONG_SPAN or math.isinf(span):
+                self.long_entries.append(entry)
+            else:
+                short.append(entry)
+                self.max_span = max(self.max_span, span)
+        short.sort(key=lambda entry: entry.start)
+        self.long_entries.sort(key=lambda entry: entry.start)
+        self.entries = short
+        self.starts = [entry.start for entry in short]
+
+    # Entrées qui chevauchent [start, end), triées par début
+    def overlapping(self, start=-math.inf, end=math.inf):
+        lo = bisect.bisect_left(self.starts, start - self.max_span)
+        hi = bisect.bisect_left(self.starts, end) if end != math.inf else len(self.starts)
+        short = (entry for entry in self.entries[lo:hi]
+                 if overlaps(entry.start, entry.end, start, end))
+        long = (entry for entry in self.long_entries
+                if overlaps(entry.start, entry.end, start, end))
+        # Les deux listes sont triées par début : une fusion suffit
+        return list(heapq.merge(short, long, key=lambda entry: entry.start))
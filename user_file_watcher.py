@@ -0,0 +1,175 @@
+import os
+import time
+import shutil
+import struct
+import tempfile
+import threading
+import logging
+import ctypes
+import ctypes.util
+
+logger = logging.getLogger('caldav-server')
+
+# Masques inotify (voir <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+# Intervalle minimal entre deux vérifications de mtime en mode polling (secondes)
+POLL_INTERVAL = float(os.environ.get('CALDAV_WATCH_POLL_INTERVAL', '1.0'))
+
+
+def _load_inotify():
+    if not hasattr(os, 'O_CLOEXEC'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+# Surveille le fichier utilisateur et ne le recopie que lorsqu'il a réellement changé
+class UserFileWatcher:
+    def __init__(self, source, target, poll_interval=POLL_INTERVAL):
+        self.source = source
+        self.target = target
+        self.poll_interval = poll_interval
+        self.mode = 'polling'
+        self.syncs_performed = 0
+        self.syncs_skipped = 0
+        self._synced_signature = None
+        # Changements signalés par inotify, et nombre d'entre eux pris en compte par la dernière copie terminée
+        self._changes = 1
+        self._synced_changes = 0
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        self._inotify_fd = None
+
+    # Démarre la surveillance inotify ; en cas d'échec on reste en mode polling
+    def start(self):
+        libc = _load_inotify()
+        directory = os.path.dirname(os.path.abspath(self.source))
+        if libc is None or not os.path.isdir(directory):
+            logger.info("Surveillance de %s par polling de mtime", self.source)
+            return
+
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            logger.warning("inotify indisponible (errno %d), polling de mtime", ctypes.get_errno())
+            return
+        if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+            logger.warning("Impossible de surveiller %s (errno %d), polling de mtime", directory, ctypes.get_errno())
+            os.close(fd)
+            return
+
+        self._inotify_fd = fd
+        self.mode = 'inotify'
+        thread = threading.Thread(target=self._read_events, name='user-file-watcher', daemon=True)
+        thread.start()
+        logger.info("Surveillance de %s par inotify", self.source)
+
+    def _read_events(self):
+        name = os.fsencode(os.path.basename(self.source))
+        try:
+            while True:
+                buffer = os.read(self._inotify_fd, 4096)
+                offset = 0
+                while offset < len(buffer):
+                    _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                    offset += EVENT_HEADER.size
+                    event_name = buffer[offset:offset + length].rstrip(b'\0')
+                    offset += length
+                    if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        raise OSError("répertoire surveillé supprimé ou déplacé")
+                    if event_name == name:
+                        self._changes += 1
+        except OSError as e:
+            logger.warning("Arrêt de la surveillance inotify (%s), retour au polling de mtime", e)
+        self.mode = 'polling'
+        self._changes += 1
+
+    def _source_signature(self):
+        st = os.stat(self.source)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    # Recopie le fichier utilisateur si besoin ; renvoie False si le fichier n'existe pas.
+    # Un changement n'est considéré comme traité qu'une fois la copie terminée : les requêtes arrivées
+    # pendant la copie attendent le verrou au lieu de lire l'ancienne version de la cible.
+    def sync_if_changed(self, force=False):
+        if not force:
+            if self.mode == 'inotify':
+                if self._changes == self._synced_changes:
+                    self.syncs_skipped += 1
+                    return self._synced_signature is not None
+            elif (self._synced_signature is not None
+                  and time.monotonic() - self._last_poll < self.poll_interval):
+                self.syncs_skipped += 1
+                return True
+
+        with self._lock:
+            # Changements vus avant la copie : une écriture pendant la copie relancera une synchro
+            changes = self._changes
+            if not force and self.mode == 'inotify' and changes == self._synced_changes:
+                # Copie faite par une autre requête pendant l'attente du verrou
+                self.syncs_skipped += 1
+                return self._synced_signature is not None
+            try:
+                signature = self._source_signature()
+            except FileNotFoundError:
+                logger.warning("Attention: %s n'existe pas", self.source)
+                self._synced_signature = None
+                self._synced_changes = changes
+                self._last_poll = time.monotonic()
+                return False
+
+            if not force and signature == self._synced_signature and os.path.exists(self.target):
+                self.syncs_skipped += 1
+            else:
+                self._atomic_copy()
+                self._synced_signature = signature
+                self.syncs_performed += 1
+                logger.info("Fichier %s copié vers %s", self.source, self.target)
+            self._synced_changes = changes
+            self._last_poll = time.monotonic()
+            return True
+
+    # Copie dans un fichier temporaire du même répertoire puis renommage atomique
+    def _atomic_copy(self):
+        directory = os.path.dirname(self.target) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.sync-', suffix='.ics')
+        try:
+            with os.fdopen(fd, 'wb') as dst, open(self.source, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+                dst.flush()
+                os.fsync(dst.fileno())
+            shutil.copystat(self.source, tmp_path)
+            os.replace(tmp_path, self.target)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'syncs_performed': self.syncs_performed,
+            'syncs_skipped': self.syncs_skipped,
+        }